@@ -0,0 +1,49 @@
+"""indices de busqueda (pg_trgm) para clientes y productos
+
+Revision ID: 0001_indices_busqueda
+Revises:
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_indices_busqueda'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Búsqueda por contenido (ILIKE '%x%' y similarity()) sin recorrer toda la tabla
+    op.create_index(
+        "ix_clientes_nombre_trgm", "clientes", ["nombre"],
+        postgresql_using="gin", postgresql_ops={"nombre": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_productos_descripcion_trgm", "productos", ["descripcion"],
+        postgresql_using="gin", postgresql_ops={"descripcion": "gin_trgm_ops"},
+    )
+
+    # Búsqueda por prefijo (LIKE 'x%'); los índices de igualdad existentes no sirven
+    # para LIKE si la base no usa collation "C"
+    op.create_index(
+        "ix_clientes_numero_documento_prefijo", "clientes", ["numero_documento"],
+        postgresql_ops={"numero_documento": "text_pattern_ops"},
+    )
+    op.create_index(
+        "ix_productos_codigo_prefijo", "productos", ["codigo"],
+        postgresql_ops={"codigo": "text_pattern_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_productos_codigo_prefijo", table_name="productos")
+    op.drop_index("ix_clientes_numero_documento_prefijo", table_name="clientes")
+    op.drop_index("ix_productos_descripcion_trgm", table_name="productos")
+    op.drop_index("ix_clientes_nombre_trgm", table_name="clientes")
@@ -0,0 +1,37 @@
+"""comprobante asociado (NC/ND) e indice (punto_venta_id, tipo_comprobante, numero)
+
+Revision ID: 0002_comprobante_asociado
+Revises: 0001_indices_busqueda
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_comprobante_asociado'
+down_revision: Union[str, None] = '0001_indices_busqueda'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("comprobantes", sa.Column("asoc_punto_venta_id", sa.Integer(), sa.ForeignKey("puntos_venta.id"), nullable=True))
+    op.add_column("comprobantes", sa.Column("asoc_tipo_comprobante", sa.Integer(), nullable=True))
+    op.add_column("comprobantes", sa.Column("asoc_numero", sa.Integer(), nullable=True))
+
+    # Resolver el comprobante original de una NC/ND (y cualquier búsqueda por número AFIP)
+    op.create_index(
+        "ix_comprobantes_pv_tipo_numero", "comprobantes",
+        ["punto_venta_id", "tipo_comprobante", "numero"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_comprobantes_pv_tipo_numero", table_name="comprobantes")
+    op.drop_column("comprobantes", "asoc_numero")
+    op.drop_column("comprobantes", "asoc_tipo_comprobante")
+    op.drop_column("comprobantes", "asoc_punto_venta_id")
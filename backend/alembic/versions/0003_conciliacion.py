@@ -0,0 +1,57 @@
+"""tablas de conciliacion contra FECompConsultar
+
+Revision ID: 0003_conciliacion
+Revises: 0002_comprobante_asociado
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_conciliacion'
+down_revision: Union[str, None] = '0002_comprobante_asociado'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "conciliacion_progreso",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("punto_venta_id", sa.Integer(), sa.ForeignKey("puntos_venta.id"), nullable=False),
+        sa.Column("tipo_comprobante", sa.Integer(), nullable=False),
+        sa.Column("ultimo_numero", sa.Integer(), nullable=True),
+        sa.Column("actualizado", sa.DateTime(), nullable=True),
+        sa.UniqueConstraint("punto_venta_id", "tipo_comprobante", name="uq_conciliacion_progreso_pv_tipo"),
+    )
+    op.create_index("ix_conciliacion_progreso_id", "conciliacion_progreso", ["id"])
+
+    op.create_table(
+        "conciliacion_discrepancias",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("punto_venta_id", sa.Integer(), sa.ForeignKey("puntos_venta.id"), nullable=False),
+        sa.Column("tipo_comprobante", sa.Integer(), nullable=False),
+        sa.Column("numero", sa.Integer(), nullable=False),
+        sa.Column("tipo_discrepancia", sa.String(), nullable=False),
+        sa.Column("valor_local", sa.String(), nullable=True),
+        sa.Column("valor_afip", sa.String(), nullable=True),
+        sa.Column("detectada", sa.DateTime(), nullable=True),
+        sa.Column("resuelta", sa.Boolean(), nullable=True),
+    )
+    op.create_index("ix_conciliacion_discrepancias_id", "conciliacion_discrepancias", ["id"])
+    op.create_index(
+        "ix_conciliacion_discrepancias_pv_tipo_numero", "conciliacion_discrepancias",
+        ["punto_venta_id", "tipo_comprobante", "numero"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_conciliacion_discrepancias_pv_tipo_numero", table_name="conciliacion_discrepancias")
+    op.drop_index("ix_conciliacion_discrepancias_id", table_name="conciliacion_discrepancias")
+    op.drop_table("conciliacion_discrepancias")
+    op.drop_index("ix_conciliacion_progreso_id", table_name="conciliacion_progreso")
+    op.drop_table("conciliacion_progreso")
@@ -0,0 +1,29 @@
+"""moneda y cotizacion en comprobantes
+
+Revision ID: 0004_moneda_comprobante
+Revises: 0003_conciliacion
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_moneda_comprobante'
+down_revision: Union[str, None] = '0003_conciliacion'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Los comprobantes existentes se emitieron todos en pesos
+    op.add_column("comprobantes", sa.Column("moneda_id", sa.String(), nullable=True, server_default="PES"))
+    op.add_column("comprobantes", sa.Column("moneda_cotizacion", sa.Float(), nullable=True, server_default="1.0"))
+
+
+def downgrade() -> None:
+    op.drop_column("comprobantes", "moneda_cotizacion")
+    op.drop_column("comprobantes", "moneda_id")
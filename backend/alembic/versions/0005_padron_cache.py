@@ -0,0 +1,34 @@
+"""cache persistente del padron AFIP
+
+Revision ID: 0005_padron_cache
+Revises: 0004_moneda_comprobante
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_padron_cache'
+down_revision: Union[str, None] = '0004_moneda_comprobante'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "padron_cache",
+        sa.Column("cuit", sa.String(), primary_key=True),
+        sa.Column("encontrado", sa.Boolean(), nullable=False),
+        sa.Column("nombre", sa.String(), nullable=True),
+        sa.Column("direccion", sa.String(), nullable=True),
+        sa.Column("condicion_iva", sa.String(), nullable=True),
+        sa.Column("consultado", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("padron_cache")
@@ -0,0 +1,145 @@
+"""particionado mensual de comprobantes y comprobante_detalles por fecha_emision
+
+Revision ID: 0006_particionado_comprobantes
+Revises: 0005_padron_cache
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_particionado_comprobantes'
+down_revision: Union[str, None] = '0005_padron_cache'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Meses creados por adelantado; después los mantiene app.services.particiones
+MESES_ADELANTE = 3
+
+
+def _sumar_meses(mes: date, meses: int) -> date:
+    total = mes.year * 12 + (mes.month - 1) + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _crear_indices():
+    op.create_index("ix_comprobantes_id", "comprobantes", ["id"])
+    op.create_index("ix_comprobantes_pv_tipo_numero", "comprobantes", ["punto_venta_id", "tipo_comprobante", "numero"])
+    op.create_index("ix_comprobante_detalles_id", "comprobante_detalles", ["id"])
+    op.create_index("ix_comprobante_detalles_comprobante_id", "comprobante_detalles", ["comprobante_id"])
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    # 1. Apartar las tablas actuales. Las secuencias de id se reutilizan, así que se
+    #    desvinculan para que no se borren junto con las tablas viejas.
+    op.execute("ALTER SEQUENCE comprobantes_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE comprobante_detalles_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE comprobante_detalles RENAME TO comprobante_detalles_old")
+    op.execute("ALTER TABLE comprobantes RENAME TO comprobantes_old")
+    op.execute("UPDATE comprobantes_old SET fecha_emision = now() WHERE fecha_emision IS NULL")
+    for indice in ("ix_comprobantes_id", "ix_comprobantes_pv_tipo_numero", "ix_comprobante_detalles_id"):
+        op.execute(f"DROP INDEX IF EXISTS {indice}")
+
+    # 2. Tablas particionadas. La clave de partición tiene que formar parte de la PK,
+    #    y los detalles llevan la fecha del comprobante para caer en el mismo mes.
+    op.execute("""
+        CREATE TABLE comprobantes (
+            LIKE comprobantes_old INCLUDING DEFAULTS,
+            PRIMARY KEY (id, fecha_emision),
+            FOREIGN KEY (punto_venta_id) REFERENCES puntos_venta (id),
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id),
+            FOREIGN KEY (asoc_punto_venta_id) REFERENCES puntos_venta (id)
+        ) PARTITION BY RANGE (fecha_emision)
+    """)
+    op.execute("""
+        CREATE TABLE comprobante_detalles (
+            LIKE comprobante_detalles_old INCLUDING DEFAULTS,
+            fecha_emision TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, fecha_emision),
+            FOREIGN KEY (comprobante_id, fecha_emision) REFERENCES comprobantes (id, fecha_emision),
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        ) PARTITION BY RANGE (fecha_emision)
+    """)
+    op.execute("ALTER SEQUENCE comprobantes_id_seq OWNED BY comprobantes.id")
+    op.execute("ALTER SEQUENCE comprobante_detalles_id_seq OWNED BY comprobante_detalles.id")
+
+    # Red de seguridad: si una partición futura no se creó a tiempo, el comprobante
+    # (que ya tiene CAE) se guarda igual y se reubica al crearla
+    op.execute("CREATE TABLE comprobantes_default PARTITION OF comprobantes DEFAULT")
+    op.execute("CREATE TABLE comprobante_detalles_default PARTITION OF comprobante_detalles DEFAULT")
+
+    # 3. Una partición por mes, desde el comprobante más viejo hasta MESES_ADELANTE
+    primera = conn.execute(sa.text("SELECT min(fecha_emision) FROM comprobantes_old")).scalar()
+    hoy = date.today().replace(day=1)
+    mes = primera.date().replace(day=1) if primera else hoy
+    fin = _sumar_meses(hoy, MESES_ADELANTE)
+    while mes <= fin:
+        siguiente = _sumar_meses(mes, 1)
+        sufijo = f"y{mes.year:04d}m{mes.month:02d}"
+        for tabla in ("comprobantes", "comprobante_detalles"):
+            op.execute(
+                f"CREATE TABLE {tabla}_{sufijo} PARTITION OF {tabla} "
+                f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{siguiente.isoformat()}')"
+            )
+        mes = siguiente
+
+    _crear_indices()
+
+    # 4. Copiar los datos (los detalles toman la fecha de su comprobante)
+    op.execute("INSERT INTO comprobantes SELECT * FROM comprobantes_old")
+    op.execute("""
+        INSERT INTO comprobante_detalles
+        SELECT d.*, COALESCE(c.fecha_emision, now())
+        FROM comprobante_detalles_old d
+        LEFT JOIN comprobantes_old c ON c.id = d.comprobante_id
+    """)
+
+    op.execute("DROP TABLE comprobante_detalles_old")
+    op.execute("DROP TABLE comprobantes_old")
+
+
+def downgrade() -> None:
+    op.execute("ALTER SEQUENCE comprobantes_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE comprobante_detalles_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE comprobante_detalles RENAME TO comprobante_detalles_part")
+    op.execute("ALTER TABLE comprobantes RENAME TO comprobantes_part")
+    for indice in ("ix_comprobantes_id", "ix_comprobantes_pv_tipo_numero",
+                   "ix_comprobante_detalles_id", "ix_comprobante_detalles_comprobante_id"):
+        op.execute(f"DROP INDEX IF EXISTS {indice}")
+
+    op.execute("""
+        CREATE TABLE comprobantes (
+            LIKE comprobantes_part INCLUDING DEFAULTS,
+            PRIMARY KEY (id),
+            FOREIGN KEY (punto_venta_id) REFERENCES puntos_venta (id),
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id),
+            FOREIGN KEY (asoc_punto_venta_id) REFERENCES puntos_venta (id)
+        )
+    """)
+    op.execute("INSERT INTO comprobantes SELECT * FROM comprobantes_part")
+    op.execute("""
+        CREATE TABLE comprobante_detalles (
+            LIKE comprobante_detalles_part INCLUDING DEFAULTS,
+            PRIMARY KEY (id),
+            FOREIGN KEY (comprobante_id) REFERENCES comprobantes (id),
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        )
+    """)
+    op.execute("INSERT INTO comprobante_detalles SELECT * FROM comprobante_detalles_part")
+    op.execute("ALTER TABLE comprobante_detalles DROP COLUMN fecha_emision")
+    op.execute("ALTER SEQUENCE comprobantes_id_seq OWNED BY comprobantes.id")
+    op.execute("ALTER SEQUENCE comprobante_detalles_id_seq OWNED BY comprobante_detalles.id")
+
+    op.execute("DROP TABLE comprobante_detalles_part")
+    op.execute("DROP TABLE comprobantes_part")
+
+    op.create_index("ix_comprobantes_id", "comprobantes", ["id"])
+    op.create_index("ix_comprobantes_pv_tipo_numero", "comprobantes", ["punto_venta_id", "tipo_comprobante", "numero"])
+    op.create_index("ix_comprobante_detalles_id", "comprobante_detalles", ["id"])
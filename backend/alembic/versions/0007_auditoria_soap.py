@@ -0,0 +1,47 @@
+"""indice del archivo de auditoria SOAP
+
+Revision ID: 0007_auditoria_soap
+Revises: 0006_particionado_comprobantes
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_auditoria_soap'
+down_revision: Union[str, None] = '0006_particionado_comprobantes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "auditoria_soap",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("fecha", sa.DateTime(), nullable=False),
+        sa.Column("servicio", sa.String(), nullable=False),
+        sa.Column("metodo", sa.String(), nullable=False),
+        sa.Column("cuit", sa.String(), nullable=False),
+        sa.Column("punto_venta", sa.Integer(), nullable=True),
+        sa.Column("tipo_comprobante", sa.Integer(), nullable=True),
+        sa.Column("numero", sa.Integer(), nullable=True),
+        sa.Column("numero_hasta", sa.Integer(), nullable=True),
+        sa.Column("archivo", sa.String(), nullable=False),
+        sa.Column("offset", sa.Integer(), nullable=False),
+        sa.Column("longitud", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_auditoria_soap_id", "auditoria_soap", ["id"])
+    op.create_index(
+        "ix_auditoria_soap_cuit_pv_tipo_numero", "auditoria_soap",
+        ["cuit", "punto_venta", "tipo_comprobante", "numero"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_auditoria_soap_cuit_pv_tipo_numero", table_name="auditoria_soap")
+    op.drop_index("ix_auditoria_soap_id", table_name="auditoria_soap")
+    op.drop_table("auditoria_soap")
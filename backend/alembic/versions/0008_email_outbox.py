@@ -0,0 +1,42 @@
+"""outbox de emails de comprobantes
+
+Revision ID: 0008_email_outbox
+Revises: 0007_auditoria_soap
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008_email_outbox'
+down_revision: Union[str, None] = '0007_auditoria_soap'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "email_outbox",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("comprobante_id", sa.Integer(), nullable=False),
+        sa.Column("comprobante_fecha", sa.DateTime(), nullable=False),
+        sa.Column("destinatario", sa.String(), nullable=False),
+        sa.Column("estado", sa.String(), nullable=False, server_default="pendiente"),
+        sa.Column("intentos", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("proximo_intento", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("ultimo_error", sa.String(), nullable=True),
+        sa.Column("creado", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("enviado", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_email_outbox_id", "email_outbox", ["id"])
+    op.create_index("ix_email_outbox_estado_proximo_intento", "email_outbox", ["estado", "proximo_intento"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_email_outbox_estado_proximo_intento", table_name="email_outbox")
+    op.drop_index("ix_email_outbox_id", table_name="email_outbox")
+    op.drop_table("email_outbox")
@@ -0,0 +1,49 @@
+"""ventas a consumidor final pendientes de consolidación
+
+Revision ID: 0009_ventas_consolidables
+Revises: 0008_email_outbox
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009_ventas_consolidables'
+down_revision: Union[str, None] = '0008_email_outbox'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ventas_consolidables",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("punto_venta_id", sa.Integer(), sa.ForeignKey("puntos_venta.id"), nullable=False),
+        sa.Column("tipo_comprobante", sa.Integer(), nullable=False),
+        sa.Column("fecha", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("referencia", sa.String(), nullable=True),
+        sa.Column("items", sa.JSON(), nullable=False),
+        sa.Column("total_neto", sa.Float(), nullable=False),
+        sa.Column("total_iva", sa.Float(), nullable=False),
+        sa.Column("total_comprobante", sa.Float(), nullable=False),
+        sa.Column("estado", sa.String(), nullable=False, server_default="pendiente"),
+        sa.Column("comprobante_id", sa.Integer(), nullable=True),
+        sa.Column("comprobante_fecha", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_ventas_consolidables_id", "ventas_consolidables", ["id"])
+    op.create_index(
+        "ix_ventas_consolidables_estado_pv", "ventas_consolidables",
+        ["estado", "punto_venta_id", "tipo_comprobante", "fecha"]
+    )
+    op.create_index("ix_ventas_consolidables_comprobante", "ventas_consolidables", ["comprobante_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ventas_consolidables_comprobante", table_name="ventas_consolidables")
+    op.drop_index("ix_ventas_consolidables_estado_pv", table_name="ventas_consolidables")
+    op.drop_index("ix_ventas_consolidables_id", table_name="ventas_consolidables")
+    op.drop_table("ventas_consolidables")
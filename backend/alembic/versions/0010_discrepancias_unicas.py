@@ -0,0 +1,45 @@
+"""discrepancias de conciliación únicas por (PV, tipo, número, tipo de discrepancia)
+
+Revision ID: 0010_discrepancias_unicas
+Revises: 0009_ventas_consolidables
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010_discrepancias_unicas'
+down_revision: Union[str, None] = '0009_ventas_consolidables'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Las re-conciliaciones anteriores pudieron duplicar filas: se conserva la más vieja
+    # (si alguna de las copias estaba resuelta, la conservada también)
+    op.execute("""
+        UPDATE conciliacion_discrepancias d
+        SET resuelta = true
+        FROM conciliacion_discrepancias o
+        WHERE o.punto_venta_id = d.punto_venta_id AND o.tipo_comprobante = d.tipo_comprobante
+          AND o.numero = d.numero AND o.tipo_discrepancia = d.tipo_discrepancia
+          AND o.resuelta AND NOT coalesce(d.resuelta, false)
+    """)
+    op.execute("""
+        DELETE FROM conciliacion_discrepancias d
+        USING conciliacion_discrepancias o
+        WHERE o.punto_venta_id = d.punto_venta_id AND o.tipo_comprobante = d.tipo_comprobante
+          AND o.numero = d.numero AND o.tipo_discrepancia = d.tipo_discrepancia
+          AND o.id < d.id
+    """)
+    op.create_unique_constraint(
+        "uq_conciliacion_discrepancias_clave", "conciliacion_discrepancias",
+        ["punto_venta_id", "tipo_comprobante", "numero", "tipo_discrepancia"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_conciliacion_discrepancias_clave", "conciliacion_discrepancias", type_="unique")
@@ -0,0 +1,35 @@
+"""reintentos de ventas consolidables incluidas en resúmenes rechazados
+
+Revision ID: 0011_ventas_consolidables_reintentos
+Revises: 0010_discrepancias_unicas
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011_ventas_consolidables_reintentos'
+down_revision: Union[str, None] = '0010_discrepancias_unicas'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("ventas_consolidables", sa.Column("intentos", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("ventas_consolidables", sa.Column("ultimo_error", sa.String(), nullable=True))
+    # Las ventas que quedaron en "error" por un resumen rechazado vuelven a la cola
+    op.execute("""
+        UPDATE ventas_consolidables
+        SET estado = 'pendiente', intentos = 1, comprobante_id = NULL, comprobante_fecha = NULL,
+            ultimo_error = 'Resumen rechazado por AFIP (anterior a los reintentos)'
+        WHERE estado = 'error'
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column("ventas_consolidables", "ultimo_error")
+    op.drop_column("ventas_consolidables", "intentos")
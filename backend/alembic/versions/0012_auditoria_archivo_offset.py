@@ -0,0 +1,26 @@
+"""índice único de auditoria_soap por (archivo, offset)
+
+Revision ID: 0012_auditoria_archivo_offset
+Revises: 0011_ventas_consolidables_reintentos
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012_auditoria_archivo_offset'
+down_revision: Union[str, None] = '0011_ventas_consolidables_reintentos'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # La recuperación de diarios de índice (services/auditoria) inserta con ON CONFLICT DO NOTHING
+    op.create_index("uq_auditoria_soap_archivo_offset", "auditoria_soap", ["archivo", "offset"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("uq_auditoria_soap_archivo_offset", table_name="auditoria_soap")
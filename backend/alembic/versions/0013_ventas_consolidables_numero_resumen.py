@@ -0,0 +1,26 @@
+"""número del resumen en vuelo de cada venta consolidable
+
+Revision ID: 0013_ventas_consolidables_numero_resumen
+Revises: 0012_auditoria_archivo_offset
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0013_ventas_consolidables_numero_resumen'
+down_revision: Union[str, None] = '0012_auditoria_archivo_offset'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("ventas_consolidables", sa.Column("numero_resumen", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("ventas_consolidables", "numero_resumen")
@@ -0,0 +1,44 @@
+"""busqueda: GiST gist_trgm_ops (orden KNN por <->) e indices de prefijo sobre lower()
+
+Revision ID: 0014_busqueda_gist_trgm
+Revises: 0013_ventas_consolidables_numero_resumen
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0014_busqueda_gist_trgm'
+down_revision: Union[str, None] = '0013_ventas_consolidables_numero_resumen'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRGM = (("clientes", "nombre"), ("productos", "descripcion"))
+
+
+def upgrade() -> None:
+    for tabla, columna in TRGM:
+        # GIN no sirve para ordenar por distancia: GiST resuelve ILIKE y además el ORDER BY <-> con LIMIT
+        op.drop_index(f"ix_{tabla}_{columna}_trgm", table_name=tabla)
+        op.create_index(
+            f"ix_{tabla}_{columna}_trgm", tabla, [columna],
+            postgresql_using="gist", postgresql_ops={columna: "gist_trgm_ops"},
+        )
+        # Búsquedas de menos de 3 caracteres (sin trigramas): LIKE 'x%' sobre lower(columna)
+        op.create_index(
+            f"ix_{tabla}_{columna}_prefijo", tabla, [sa.text(f"lower({columna}) text_pattern_ops")],
+        )
+
+
+def downgrade() -> None:
+    for tabla, columna in TRGM:
+        op.drop_index(f"ix_{tabla}_{columna}_prefijo", table_name=tabla)
+        op.drop_index(f"ix_{tabla}_{columna}_trgm", table_name=tabla)
+        op.create_index(
+            f"ix_{tabla}_{columna}_trgm", tabla, [columna],
+            postgresql_using="gin", postgresql_ops={columna: "gin_trgm_ops"},
+        )
@@ -0,0 +1,32 @@
+"""comprobantes rechazados sin numero (AFIP no lo consume)
+
+Revision ID: 0015_comprobantes_rechazados_sin_numero
+Revises: 0014_busqueda_gist_trgm
+Create Date: 2026-10-19 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0015_comprobantes_rechazados_sin_numero'
+down_revision: Union[str, None] = '0014_busqueda_gist_trgm'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column("comprobantes", "numero", nullable=True)
+    # El número de un rechazado es el que usó el siguiente autorizado: se conserva en las observaciones
+    op.execute(
+        "UPDATE comprobantes SET observaciones_afip = 'Número solicitado: ' || numero || E'\\n' || "
+        "coalesce(observaciones_afip, ''), numero = NULL WHERE cae IS NULL"
+    )
+
+
+def downgrade() -> None:
+    # El número solicitado no se recupera: los rechazados quedan con 0
+    op.execute("UPDATE comprobantes SET numero = 0 WHERE numero IS NULL")
+    op.alter_column("comprobantes", "numero", nullable=False)
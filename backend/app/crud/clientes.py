@@ -0,0 +1,27 @@
+from sqlalchemy.orm import Session
+from app import models
+from app.crud.utils import buscar_texto, escapar_like
+
+def get_cliente(db: Session, cliente_id: int):
+    return db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+
+def get_clientes(db: Session, skip: int = 0, limit: int = 100):
+    return db.query(models.Cliente).offset(skip).limit(limit).all()
+
+def search_clientes(db: Session, q: str, limit: int = 10):
+    # Búsqueda para autocompletado: primero numero_documento por prefijo (índice btree
+    # text_pattern_ops), después nombre (ver buscar_texto). Dos consultas acotadas por
+    # limit en vez de un OR que no puede usar los índices para ordenar
+    patron = escapar_like(q)
+    clientes = (
+        db.query(models.Cliente)
+        .filter(models.Cliente.numero_documento.like(f"{patron}%", escape="\\"))
+        .order_by(models.Cliente.numero_documento)
+        .limit(limit)
+        .all()
+    )
+    if len(clientes) < limit:
+        vistos = [c.id for c in clientes]
+        query = db.query(models.Cliente).filter(models.Cliente.id.notin_(vistos)) if vistos else db.query(models.Cliente)
+        clientes += buscar_texto(query, models.Cliente.nombre, q, limit - len(clientes))
+    return clientes
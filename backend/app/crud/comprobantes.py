@@ -1,14 +1,34 @@
 from sqlalchemy.orm import Session
 from app import models, schemas
 from sqlalchemy import desc
+from datetime import datetime
 
 def get_comprobante(db: Session, comprobante_id: int):
     return db.query(models.Comprobante).filter(models.Comprobante.id == comprobante_id).first()
 
-def get_comprobantes(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Comprobante).order_by(desc(models.Comprobante.fecha_emision)).offset(skip).limit(limit).all()
+def get_comprobantes(db: Session, skip: int = 0, limit: int = 100, desde: datetime = None, hasta: datetime = None):
+    # Filtrar por fecha permite a Postgres descartar las particiones mensuales fuera del rango
+    query = db.query(models.Comprobante)
+    if desde is not None:
+        query = query.filter(models.Comprobante.fecha_emision >= desde)
+    if hasta is not None:
+        query = query.filter(models.Comprobante.fecha_emision < hasta)
+    return query.order_by(desc(models.Comprobante.fecha_emision)).offset(skip).limit(limit).all()
 
 def create_comprobante(db: Session, comprobante: schemas.ComprobanteCreate):
     # Nota: La creación real con lógica de negocio está en InvoiceService.
     # Este CRUD es principalmente para lectura o creaciones simples si fuera necesario.
     pass
+
+def get_comprobante_por_numero(db: Session, punto_venta_id: int, tipo_comprobante: int, numero: int):
+    # Usa el índice compuesto ix_comprobantes_pv_tipo_numero.
+    # Solo los autorizados tienen número (los rechazados se guardan sin él).
+    return (
+        db.query(models.Comprobante)
+        .filter(
+            models.Comprobante.punto_venta_id == punto_venta_id,
+            models.Comprobante.tipo_comprobante == tipo_comprobante,
+            models.Comprobante.numero == numero,
+        )
+        .first()
+    )
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from app import models, schemas
+from app.crud.utils import buscar_texto, escapar_like
 
 def get_producto(db: Session, producto_id: int):
     return db.query(models.Producto).filter(models.Producto.id == producto_id).first()
@@ -7,6 +8,22 @@ def get_producto(db: Session, producto_id: int):
 def get_productos(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Producto).offset(skip).limit(limit).all()
 
+def search_productos(db: Session, q: str, limit: int = 10):
+    # codigo por prefijo (btree text_pattern_ops) y después descripcion (ver buscar_texto)
+    patron = escapar_like(q)
+    productos = (
+        db.query(models.Producto)
+        .filter(models.Producto.codigo.like(f"{patron}%", escape="\\"))
+        .order_by(models.Producto.codigo)
+        .limit(limit)
+        .all()
+    )
+    if len(productos) < limit:
+        vistos = [p.id for p in productos]
+        query = db.query(models.Producto).filter(models.Producto.id.notin_(vistos)) if vistos else db.query(models.Producto)
+        productos += buscar_texto(query, models.Producto.descripcion, q, limit - len(productos))
+    return productos
+
 def create_producto(db: Session, producto: schemas.ProductoCreate):
     db_producto = models.Producto(**producto.dict())
     db.add(db_producto)
@@ -0,0 +1,22 @@
+from sqlalchemy import func
+
+# pg_trgm parte el texto en trigramas: con menos caracteres un ILIKE '%x%' no
+# puede usar el índice y recorre toda la tabla
+MIN_TRIGRAMA = 3
+
+
+def escapar_like(texto: str) -> str:
+    """Escapa los comodines de LIKE para buscar el texto del usuario de forma literal"""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def buscar_texto(query, columna, q: str, limit: int):
+    """Autocompletado sobre una columna de texto con índices de prefijo (lower text_pattern_ops)
+    y GiST gist_trgm_ops: por prefijo si q es corto, si no por contenido ordenado por
+    distancia de trigramas (<->, KNN sobre el índice: se corta en `limit` filas)"""
+    patron = escapar_like(q)
+    if len(q) < MIN_TRIGRAMA:
+        query = query.filter(func.lower(columna).like(f"{patron.lower()}%", escape="\\")).order_by(func.lower(columna))
+    else:
+        query = query.filter(columna.ilike(f"%{patron}%", escape="\\")).order_by(columna.op("<->")(q))
+    return query.limit(limit).all()
@@ -1,7 +1,8 @@
 import os
+import threading
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import afip, invoices
+from .routers import afip, invoices, clientes, productos, conciliacion, padron, auditoria, admin
 
 app = FastAPI()
 
@@ -21,6 +22,57 @@ app.add_middleware(
 
 app.include_router(afip.router, prefix="/api", tags=["afip"])
 app.include_router(invoices.router, prefix="/api", tags=["facturas"])
+app.include_router(clientes.router, prefix="/api", tags=["clientes"])
+app.include_router(productos.router, prefix="/api", tags=["productos"])
+app.include_router(conciliacion.router, prefix="/api", tags=["conciliacion"])
+app.include_router(padron.router, prefix="/api", tags=["padron"])
+app.include_router(auditoria.router, prefix="/api", tags=["auditoria"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
+
+@app.on_event("startup")
+def warmup_afip():
+    # Precargar pyafipws en segundo plano: el servidor empieza a responder enseguida
+    # y la primera factura no paga el import. AFIP_WARMUP=0 lo desactiva.
+    if os.getenv("AFIP_WARMUP", "1") == "1":
+        from .services import afip as afip_service
+        threading.Thread(target=afip_service.warmup, name="afip-warmup", daemon=True).start()
+
+@app.on_event("startup")
+def mantener_particiones():
+    # Crea las particiones mensuales de comprobantes por adelantado (y luego una vez por día)
+    if os.getenv("PARTICIONES_AUTOMATICAS", "1") == "1":
+        from .services import particiones
+        particiones.iniciar_mantenimiento()
+
+@app.on_event("startup")
+def programar_consolidacion():
+    # Resumen diario de ventas chicas a Consumidor Final (opcional, CONSOLIDACION_CF=1)
+    from .services import consolidacion
+    if consolidacion.HABILITADA:
+        consolidacion.iniciar_programador()
+
+@app.on_event("startup")
+def recuperar_auditoria():
+    # Reaplica índices y registros de auditoría SOAP que quedaron pendientes en la corrida anterior
+    from .services import auditoria as auditoria_service
+    auditoria_service.iniciar()
+
+@app.on_event("startup")
+def escuchar_eventos():
+    # Eventos de emisión de todos los workers para el stream SSE (LISTEN/NOTIFY, ver services/eventos)
+    from .services.eventos import hub
+    hub.iniciar()
+
+@app.on_event("shutdown")
+def dejar_de_escuchar_eventos():
+    from .services.eventos import hub
+    hub.detener()
+
+@app.on_event("shutdown")
+def cerrar_auditoria():
+    # Escribir lo que quede en la cola de auditoría SOAP antes de salir
+    from .services import auditoria as auditoria_service
+    auditoria_service.detener()
 
 @app.get("/")
 def read_root():
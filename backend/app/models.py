@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Date, Index, UniqueConstraint, ForeignKeyConstraint, JSON, func
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -27,6 +27,13 @@ class Cliente(Base):
 
     comprobantes = relationship("Comprobante", back_populates="cliente")
 
+    # Índices para autocompletado (requieren la extensión pg_trgm, ver migraciones 0001 y 0014)
+    __table_args__ = (
+        Index("ix_clientes_nombre_trgm", "nombre", postgresql_using="gist", postgresql_ops={"nombre": "gist_trgm_ops"}),
+        Index("ix_clientes_nombre_prefijo", func.lower(nombre).label("nombre_lower"), postgresql_ops={"nombre_lower": "text_pattern_ops"}),
+        Index("ix_clientes_numero_documento_prefijo", "numero_documento", postgresql_ops={"numero_documento": "text_pattern_ops"}),
+    )
+
 class Producto(Base):
     __tablename__ = "productos"
 
@@ -36,34 +43,56 @@ class Producto(Base):
     precio_unitario = Column(Float, nullable=False)
     alicuota_iva = Column(Float, default=21.0) # 21.0, 10.5, 0.0, etc.
 
+    __table_args__ = (
+        Index("ix_productos_descripcion_trgm", "descripcion", postgresql_using="gist", postgresql_ops={"descripcion": "gist_trgm_ops"}),
+        Index("ix_productos_descripcion_prefijo", func.lower(descripcion).label("descripcion_lower"), postgresql_ops={"descripcion_lower": "text_pattern_ops"}),
+        Index("ix_productos_codigo_prefijo", "codigo", postgresql_ops={"codigo": "text_pattern_ops"}),
+    )
+
 class Comprobante(Base):
+    # Particionada por mes de fecha_emision (ver migración 0006 y services/particiones.py),
+    # por eso la fecha forma parte de la clave primaria
     __tablename__ = "comprobantes"
 
-    id = Column(Integer, primary_key=True, index=True)
-    fecha_emision = Column(DateTime, default=datetime.utcnow)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    fecha_emision = Column(DateTime, primary_key=True, default=datetime.utcnow)
     tipo_comprobante = Column(Integer, nullable=False) # 1 = Factura A, 6 = Factura B, 11 = Factura C
     punto_venta_id = Column(Integer, ForeignKey("puntos_venta.id"))
-    numero = Column(Integer, nullable=False) # Número de comprobante asignado por AFIP
+    numero = Column(Integer, nullable=True) # Número de comprobante asignado por AFIP (NULL si fue rechazado)
     cliente_id = Column(Integer, ForeignKey("clientes.id"))
     
     total_neto = Column(Float, default=0.0)
     total_iva = Column(Float, default=0.0)
     total_comprobante = Column(Float, default=0.0)
+    moneda_id = Column(String, default="PES") # Código AFIP: PES, DOL, 060 (EUR), etc.
+    moneda_cotizacion = Column(Float, default=1.0) # Cotización usada al emitir
     
     cae = Column(String, nullable=True) # Código de Autorización Electrónico
     vto_cae = Column(Date, nullable=True) # Vencimiento del CAE
     resultado_afip = Column(String, nullable=True) # Aprobado, Rechazado
     observaciones_afip = Column(String, nullable=True)
 
-    punto_venta = relationship("PuntoVenta")
+    # Comprobante asociado (Notas de Crédito/Débito). Se guarda la terna AFIP y no un FK
+    # porque así es como se referencia en CbtesAsoc y se resuelve con el índice compuesto.
+    asoc_punto_venta_id = Column(Integer, ForeignKey("puntos_venta.id"), nullable=True)
+    asoc_tipo_comprobante = Column(Integer, nullable=True)
+    asoc_numero = Column(Integer, nullable=True)
+
+    punto_venta = relationship("PuntoVenta", foreign_keys=[punto_venta_id])
     cliente = relationship("Cliente", back_populates="comprobantes")
     items = relationship("ComprobanteDetalle", back_populates="comprobante")
 
+    __table_args__ = (
+        Index("ix_comprobantes_pv_tipo_numero", "punto_venta_id", "tipo_comprobante", "numero"),
+    )
+
 class ComprobanteDetalle(Base):
+    # Particionada igual que comprobantes: fecha_emision es la del comprobante
     __tablename__ = "comprobante_detalles"
 
-    id = Column(Integer, primary_key=True, index=True)
-    comprobante_id = Column(Integer, ForeignKey("comprobantes.id"))
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    fecha_emision = Column(DateTime, primary_key=True)
+    comprobante_id = Column(Integer, index=True)
     producto_id = Column(Integer, ForeignKey("productos.id"), nullable=True)
     descripcion = Column(String, nullable=False) # Se guarda para histórico
     cantidad = Column(Float, default=1.0)
@@ -73,3 +102,126 @@ class ComprobanteDetalle(Base):
 
     comprobante = relationship("Comprobante", back_populates="items")
     producto = relationship("Producto")
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["comprobante_id", "fecha_emision"],
+            ["comprobantes.id", "comprobantes.fecha_emision"]
+        ),
+    )
+
+class ConciliacionProgreso(Base):
+    """Checkpoint de la conciliación contra FECompConsultar por (PV, tipo)"""
+    __tablename__ = "conciliacion_progreso"
+
+    id = Column(Integer, primary_key=True, index=True)
+    punto_venta_id = Column(Integer, ForeignKey("puntos_venta.id"), nullable=False)
+    tipo_comprobante = Column(Integer, nullable=False)
+    ultimo_numero = Column(Integer, default=0) # Último número verificado contra AFIP
+    actualizado = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("punto_venta_id", "tipo_comprobante", name="uq_conciliacion_progreso_pv_tipo"),
+    )
+
+class ConciliacionDiscrepancia(Base):
+    __tablename__ = "conciliacion_discrepancias"
+
+    id = Column(Integer, primary_key=True, index=True)
+    punto_venta_id = Column(Integer, ForeignKey("puntos_venta.id"), nullable=False)
+    tipo_comprobante = Column(Integer, nullable=False)
+    numero = Column(Integer, nullable=False)
+    tipo_discrepancia = Column(String, nullable=False) # faltante_local, faltante_afip, cae, total
+    valor_local = Column(String, nullable=True)
+    valor_afip = Column(String, nullable=True)
+    detectada = Column(DateTime, default=datetime.utcnow)
+    resuelta = Column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("ix_conciliacion_discrepancias_pv_tipo_numero", "punto_venta_id", "tipo_comprobante", "numero"),
+        UniqueConstraint(
+            "punto_venta_id", "tipo_comprobante", "numero", "tipo_discrepancia",
+            name="uq_conciliacion_discrepancias_clave"
+        ),
+    )
+
+class PadronContribuyente(Base):
+    """Caché persistente de consultas al padrón de AFIP (A5/A13), incluidas las negativas"""
+    __tablename__ = "padron_cache"
+
+    cuit = Column(String, primary_key=True)
+    encontrado = Column(Boolean, nullable=False, default=True) # False = caché negativa
+    nombre = Column(String, nullable=True)
+    direccion = Column(String, nullable=True)
+    condicion_iva = Column(String, nullable=True) # Mismos valores que Cliente.condicion_iva
+    consultado = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class AuditoriaSoap(Base):
+    """Índice del archivo de auditoría SOAP (el XML comprimido está en AUDITORIA_DIR)"""
+    __tablename__ = "auditoria_soap"
+
+    id = Column(Integer, primary_key=True, index=True)
+    fecha = Column(DateTime, nullable=False)
+    servicio = Column(String, nullable=False) # wsaa, wsfe
+    metodo = Column(String, nullable=False) # LoginCMS, FECAESolicitar, etc.
+    cuit = Column(String, nullable=False)
+    punto_venta = Column(Integer, nullable=True) # Número AFIP del punto de venta
+    tipo_comprobante = Column(Integer, nullable=True)
+    numero = Column(Integer, nullable=True)
+    numero_hasta = Column(Integer, nullable=True) # Lotes: rango de números incluidos
+    archivo = Column(String, nullable=False) # Segmento, relativo a AUDITORIA_DIR
+    offset = Column(Integer, nullable=False)
+    longitud = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_auditoria_soap_cuit_pv_tipo_numero", "cuit", "punto_venta", "tipo_comprobante", "numero"),
+        # Un frame por posición: reaplicar un diario de índice no duplica filas
+        Index("uq_auditoria_soap_archivo_offset", "archivo", "offset", unique=True),
+    )
+
+class EmailOutbox(Base):
+    """Outbox transaccional de emails de comprobantes (se escribe junto con el Comprobante)"""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Sin FK: comprobantes está particionada y su PK es (id, fecha_emision)
+    comprobante_id = Column(Integer, nullable=False)
+    comprobante_fecha = Column(DateTime, nullable=False)
+    destinatario = Column(String, nullable=False)
+    estado = Column(String, nullable=False, default="pendiente") # pendiente, enviando (con lease), enviado, fallido (dead letter)
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime, nullable=False, default=datetime.utcnow) # En "enviando", vencimiento del lease
+    ultimo_error = Column(String, nullable=True)
+    creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    enviado = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_estado_proximo_intento", "estado", "proximo_intento"),
+    )
+
+class VentaConsolidable(Base):
+    """Venta chica a Consumidor Final anónimo en espera de la consolidación diaria (services/consolidacion.py)"""
+    __tablename__ = "ventas_consolidables"
+
+    id = Column(Integer, primary_key=True, index=True)
+    punto_venta_id = Column(Integer, ForeignKey("puntos_venta.id"), nullable=False)
+    tipo_comprobante = Column(Integer, nullable=False) # 6 = Factura B, 11 = Factura C
+    fecha = Column(DateTime, nullable=False, default=datetime.now)
+    referencia = Column(String, nullable=True) # Ticket del POS
+    items = Column(JSON, nullable=False) # [{descripcion, cantidad, precio_unitario, alicuota_iva, subtotal}]
+    total_neto = Column(Float, nullable=False)
+    total_iva = Column(Float, nullable=False)
+    total_comprobante = Column(Float, nullable=False)
+    estado = Column(String, nullable=False, default="pendiente") # pendiente, procesando, emitiendo, consolidada, error
+    # Número pedido a AFIP para su resumen mientras está en "emitiendo" (ver consolidacion._recuperar)
+    numero_resumen = Column(Integer, nullable=True)
+    intentos = Column(Integer, nullable=False, default=0) # Resúmenes rechazados por AFIP que la incluyeron
+    ultimo_error = Column(String, nullable=True)
+    # Comprobante resumen que la incluye. Sin FK: comprobantes está particionada
+    comprobante_id = Column(Integer, nullable=True)
+    comprobante_fecha = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_ventas_consolidables_estado_pv", "estado", "punto_venta_id", "tipo_comprobante", "fecha"),
+        Index("ix_ventas_consolidables_comprobante", "comprobante_id"),
+    )
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import HTMLResponse, Response
+from app.schemas import ProfilingConfig, PerfilResumen
+from app.services import profiling
+from typing import List, Optional
+
+def verificar_admin(x_admin_token: Optional[str] = Header(None)):
+    # Sin ADMIN_TOKEN configurado los endpoints de administración quedan cerrados
+    if not profiling.token_valido(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+router = APIRouter(dependencies=[Depends(verificar_admin)])
+
+@router.get("/admin/profiling", response_model=ProfilingConfig)
+def read_profiling():
+    return ProfilingConfig(tasa=profiling.tasa)
+
+@router.put("/admin/profiling", response_model=ProfilingConfig)
+def update_profiling(config: ProfilingConfig):
+    if not 0 <= config.tasa <= 1:
+        raise HTTPException(status_code=400, detail="La tasa debe estar entre 0 y 1")
+    profiling.tasa = config.tasa
+    return config
+
+@router.get("/admin/perfiles", response_model=List[PerfilResumen])
+def read_perfiles(limit: int = 100):
+    return profiling.listar(limit)
+
+@router.get("/admin/perfiles/{request_id}")
+def read_perfil(request_id: str, formato: str = "html"):
+    # formato=html: flamegraph navegable; formato=speedscope: JSON para https://www.speedscope.app
+    if formato not in ("html", "speedscope"):
+        raise HTTPException(status_code=400, detail="Formato inválido (html o speedscope)")
+    if not profiling.id_valido(request_id):
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    try:
+        contenido = profiling.renderizar(request_id, formato)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    if formato == "speedscope":
+        return Response(content=contenido, media_type="application/json")
+    return HTMLResponse(contenido)
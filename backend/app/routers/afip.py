@@ -4,7 +4,9 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.crud import puntos_venta as crud_pv
 from app.schemas import PuntoVenta, PuntoVentaCreate
-from app.services.afip import AfipService
+from app.services.afip import AfipService, CACHE_DIR
+from app.services.rate_limit import RateLimitExceeded
+import math
 from typing import List
 
 router = APIRouter()
@@ -13,7 +15,6 @@ router = APIRouter()
 # Usamos una ruta relativa a este archivo para que funcione tanto en Docker como local
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 UPLOAD_DIR = os.path.join(BASE_DIR, "certs")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @router.post("/puntos-venta/", response_model=PuntoVenta)
 def create_punto_venta(
@@ -25,7 +26,8 @@ def create_punto_venta(
     clave_privada: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    # Guardar archivos
+    # Guardar archivos (el directorio se crea recién cuando hace falta)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
     cert_filename = f"{cuit}_{numero}.crt"
     key_filename = f"{cuit}_{numero}.key"
     
@@ -90,10 +92,6 @@ def delete_punto_venta(punto_venta_id: int, db: Session = Depends(get_db)):
         
     return {"status": "success", "message": f"Punto de venta {pv.numero} eliminado correctamente"}
 
-# Definir directorio de caché
-CACHE_DIR = os.path.join(BASE_DIR, "cache")
-os.makedirs(CACHE_DIR, exist_ok=True)
-
 @router.get("/afip/test-connection/{punto_venta_id}")
 def test_afip_connection(punto_venta_id: int, db: Session = Depends(get_db)):
     pv = crud_pv.get_punto_venta(db, punto_venta_id)
@@ -128,5 +126,7 @@ def test_afip_connection(punto_venta_id: int, db: Session = Depends(get_db)):
                 "token_expiration": afip.wsaa.Expiracion,
                 "ultimo_comprobante_c": ultimo_cbte
             }
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
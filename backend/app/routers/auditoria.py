@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import AuditoriaSoap as AuditoriaSoapModel
+from app.schemas import AuditoriaSoap, AuditoriaSoapDetalle
+from app.services import auditoria
+from datetime import datetime
+from typing import List, Optional
+
+router = APIRouter()
+
+@router.get("/auditoria/", response_model=List[AuditoriaSoap])
+def read_auditoria(
+    cuit: str,
+    punto_venta: Optional[int] = None,
+    tipo_comprobante: Optional[int] = None,
+    numero: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    # Búsqueda por (CUIT, PV número AFIP, tipo, número); los lotes matchean por rango de números
+    query = db.query(AuditoriaSoapModel).filter(AuditoriaSoapModel.cuit == cuit)
+    if punto_venta is not None:
+        query = query.filter(AuditoriaSoapModel.punto_venta == punto_venta)
+    if tipo_comprobante is not None:
+        query = query.filter(AuditoriaSoapModel.tipo_comprobante == tipo_comprobante)
+    if numero is not None:
+        query = query.filter(
+            AuditoriaSoapModel.numero <= numero,
+            or_(AuditoriaSoapModel.numero_hasta >= numero, AuditoriaSoapModel.numero_hasta.is_(None))
+        )
+    if desde is not None:
+        query = query.filter(AuditoriaSoapModel.fecha >= desde)
+    if hasta is not None:
+        query = query.filter(AuditoriaSoapModel.fecha < hasta)
+    return query.order_by(AuditoriaSoapModel.fecha.desc()).offset(skip).limit(limit).all()
+
+@router.get("/auditoria/{registro_id}", response_model=AuditoriaSoapDetalle)
+def read_auditoria_detalle(registro_id: int, db: Session = Depends(get_db)):
+    registro = db.query(AuditoriaSoapModel).filter(AuditoriaSoapModel.id == registro_id).first()
+    if not registro:
+        raise HTTPException(status_code=404, detail="Registro de auditoría no encontrado")
+    try:
+        contenido = auditoria.leer(registro)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo leer el segmento de auditoría: {e}")
+    return AuditoriaSoapDetalle(**AuditoriaSoap.from_orm(registro).dict(), **contenido)
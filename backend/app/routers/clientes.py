@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.crud import clientes as crud_clientes
+from app.schemas import Cliente
+from app.services.cache import TTLCache
+from typing import List
+
+router = APIRouter()
+
+# Caché corta de resultados de autocompletado: el frontend repite las mismas
+# consultas al tipear/borrar y no necesita ver altas al instante
+busqueda_cache = TTLCache(ttl=30, maxsize=2048)
+
+@router.get("/clientes/", response_model=List[Cliente])
+def read_clientes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return crud_clientes.get_clientes(db, skip=skip, limit=limit)
+
+@router.get("/clientes/buscar", response_model=List[Cliente])
+def search_clientes(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    db: Session = Depends(get_db)
+):
+    q = q.strip()
+    key = (q.lower(), limit)
+    resultado = busqueda_cache.get(key)
+    if resultado is None:
+        clientes = crud_clientes.search_clientes(db, q, limit=limit)
+        resultado = [Cliente.from_orm(c) for c in clientes]
+        busqueda_cache.set(key, resultado)
+    return resultado
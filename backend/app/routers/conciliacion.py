@@ -0,0 +1,64 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db, SessionLocal
+from app.models import ConciliacionDiscrepancia as ConciliacionDiscrepanciaModel, ConciliacionProgreso as ConciliacionProgresoModel
+from app.schemas import ConciliacionDiscrepancia, ConciliacionProgreso
+from app.services import reconciliation
+from app.services.reconciliation import ReconciliationService
+from app.crud import puntos_venta as crud_pv
+from typing import List, Optional
+
+router = APIRouter()
+
+def _ejecutar_conciliacion(punto_venta_id: int, tipo_comprobante: int, desde: Optional[int], hasta: Optional[int]):
+    # Corre fuera del request: necesita su propia sesión
+    db = SessionLocal()
+    try:
+        resultado = ReconciliationService(db).reconcile(punto_venta_id, tipo_comprobante, desde, hasta, reservada=True)
+        print(f"Conciliación finalizada: {resultado}")
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Error en conciliación PV {punto_venta_id} tipo {tipo_comprobante}: {e}")
+    finally:
+        db.close()
+
+@router.post("/conciliacion/{punto_venta_id}/{tipo_comprobante}", status_code=202)
+def start_conciliacion(
+    punto_venta_id: int,
+    tipo_comprobante: int,
+    background_tasks: BackgroundTasks,
+    desde: Optional[int] = None,
+    hasta: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    # Sin desde/hasta se retoma desde el último checkpoint hasta el último autorizado en AFIP
+    if not crud_pv.get_punto_venta(db, punto_venta_id):
+        raise HTTPException(status_code=404, detail="Punto de venta no encontrado")
+    # Se reserva antes de responder: un segundo pedido recibe 409 en lugar de fallar en segundo plano
+    if not reconciliation.reservar(punto_venta_id, tipo_comprobante):
+        raise HTTPException(status_code=409, detail="Ya hay una conciliación en curso para este punto de venta y tipo")
+    background_tasks.add_task(_ejecutar_conciliacion, punto_venta_id, tipo_comprobante, desde, hasta)
+    return {"status": "accepted", "message": "Conciliación iniciada"}
+
+@router.get("/conciliacion/progreso", response_model=List[ConciliacionProgreso])
+def read_progreso(db: Session = Depends(get_db)):
+    return db.query(ConciliacionProgresoModel).all()
+
+@router.get("/conciliacion/discrepancias", response_model=List[ConciliacionDiscrepancia])
+def read_discrepancias(
+    punto_venta_id: Optional[int] = None,
+    tipo_comprobante: Optional[int] = None,
+    incluir_resueltas: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    query = db.query(ConciliacionDiscrepanciaModel)
+    if punto_venta_id is not None:
+        query = query.filter(ConciliacionDiscrepanciaModel.punto_venta_id == punto_venta_id)
+    if tipo_comprobante is not None:
+        query = query.filter(ConciliacionDiscrepanciaModel.tipo_comprobante == tipo_comprobante)
+    if not incluir_resueltas:
+        query = query.filter(ConciliacionDiscrepanciaModel.resuelta.is_(False))
+    return query.order_by(ConciliacionDiscrepanciaModel.punto_venta_id, ConciliacionDiscrepanciaModel.tipo_comprobante, ConciliacionDiscrepanciaModel.numero).offset(skip).limit(limit).all()
@@ -1,18 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas import ComprobanteCreate, Comprobante
+from app.database import get_db, SessionLocal
+from app.schemas import ComprobanteCreate, Comprobante, NotaCreditoLote, VentaConsolidable
 from app.services.invoice_generator import InvoiceService
+from app.services.rate_limit import RateLimitExceeded
+from app.services.afip import AfipNoDisponible
+from app.services.eventos import hub
+from app.services import consolidacion, ingesta, profiling
+from app.services.consolidacion import ConsolidacionService
+from app.models import VentaConsolidable as VentaConsolidableModel
 from app.crud import comprobantes as crud_comprobantes
-from typing import List
+import asyncio
+import json
+import math
+from typing import List, Optional
+from datetime import datetime
 
 router = APIRouter()
 
 @router.post("/facturas/", response_model=Comprobante)
-def create_invoice(invoice_data: ComprobanteCreate, db: Session = Depends(get_db)):
+def create_invoice(invoice_data: ComprobanteCreate, request: Request, response: Response, db: Session = Depends(get_db)):
     service = InvoiceService(db)
     try:
-        return service.create_invoice(invoice_data)
+        with profiling.perfilar(request, response):
+            return service.create_invoice(invoice_data)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except AfipNoDisponible as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -20,6 +36,169 @@ def create_invoice(invoice_data: ComprobanteCreate, db: Session = Depends(get_db
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Error interno al generar factura: " + str(e))
 
+@router.post("/facturas/notas-credito/lote", response_model=List[Comprobante])
+def create_credit_notes_batch(lote: NotaCreditoLote, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Devoluciones masivas / ajustes de precio: un FECAESolicitar multi-registro por PV y tipo
+    service = InvoiceService(db)
+    try:
+        with profiling.perfilar(request, response):
+            return service.create_credit_notes(lote)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except AfipNoDisponible as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Error interno al generar notas de crédito: " + str(e))
+
+@router.post("/facturas/consolidables", response_model=VentaConsolidable, status_code=202)
+def create_venta_consolidable(venta: ComprobanteCreate, db: Session = Depends(get_db)):
+    # Venta chica a Consumidor Final: se guarda y sale en el comprobante resumen diario
+    if not consolidacion.es_consolidable(venta):
+        raise HTTPException(
+            status_code=400,
+            detail="La venta no es consolidable (consolidación desactivada, no es Consumidor Final anónimo o supera el umbral)"
+        )
+    return ConsolidacionService(db).encolar([venta])[0]
+
+@router.get("/facturas/consolidables", response_model=List[VentaConsolidable])
+def read_ventas_consolidables(
+    estado: Optional[str] = None,
+    punto_venta_id: Optional[int] = None,
+    comprobante_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    # Trazabilidad: con comprobante_id se obtienen las ventas incluidas en un resumen
+    query = db.query(VentaConsolidableModel)
+    if estado is not None:
+        query = query.filter(VentaConsolidableModel.estado == estado)
+    if punto_venta_id is not None:
+        query = query.filter(VentaConsolidableModel.punto_venta_id == punto_venta_id)
+    if comprobante_id is not None:
+        query = query.filter(VentaConsolidableModel.comprobante_id == comprobante_id)
+    return query.order_by(VentaConsolidableModel.fecha.desc()).offset(skip).limit(limit).all()
+
+@router.post("/facturas/consolidables/emitir", response_model=List[Comprobante])
+def consolidar_ventas(punto_venta_id: Optional[int] = None, db: Session = Depends(get_db)):
+    # Consolidación manual (la automática corre una vez por día, ver services/consolidacion)
+    try:
+        return ConsolidacionService(db).consolidar(punto_venta_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Error interno al consolidar ventas: " + str(e))
+
+@router.post("/facturas/consolidables/reintentar")
+def reintentar_ventas_consolidables(punto_venta_id: Optional[int] = None, db: Session = Depends(get_db)):
+    # Ventas en "error" (resúmenes rechazados MAX_INTENTOS veces) de vuelta a la cola, una vez corregida la causa
+    return {"reencoladas": ConsolidacionService(db).reintentar(punto_venta_id)}
+
+@router.post("/facturas/ingesta")
+async def ingest_ventas(request: Request):
+    # Lote de ventas de POS (NDJSON o msgpack con prefijo de longitud, ver services/ingesta)
+    # que se responde con un stream NDJSON de acks, uno por registro
+    try:
+        formato = ingesta.formato(request.headers.get("content-type"))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    # El cuerpo se lee entero antes de responder: con la respuesta empezada, Starlette
+    # consume los mensajes http.request para detectar la desconexión y el resto se perdería
+    try:
+        cuerpo = await ingesta.leer_cuerpo(request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    async def generar():
+        # Sesión propia: la de get_db se cerraría antes de terminar el stream
+        db = SessionLocal()
+        try:
+            async for ack in ingesta.procesar(ingesta.iterar(cuerpo), formato, InvoiceService(db)):
+                yield json.dumps(ack) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(generar(), media_type=ingesta.FORMATO_NDJSON, headers={"X-Accel-Buffering": "no"})
+
+@router.websocket("/facturas/ingesta/ws")
+async def ingest_ventas_ws(websocket: WebSocket, formato: str = ingesta.FORMATO_NDJSON):
+    # Ingesta full duplex: los acks salen mientras el POS sigue mandando ventas
+    try:
+        formato = ingesta.formato(formato)
+    except ValueError as e:
+        await websocket.close(code=1003, reason=str(e))
+        return
+    await websocket.accept()
+
+    async def chunks():
+        while True:
+            mensaje = await websocket.receive()
+            if mensaje["type"] == "websocket.disconnect":
+                # Sin nadie que reciba los acks no se emite lo pendiente: el POS lo reenvía
+                raise WebSocketDisconnect(mensaje.get("code", 1000))
+            chunk = mensaje.get("bytes") or (mensaje.get("text") or "").encode("utf8")
+            if not chunk:
+                return # Mensaje vacío: fin del stream
+            yield chunk
+
+    db = SessionLocal()
+    try:
+        async for ack in ingesta.procesar(chunks(), formato, InvoiceService(db)):
+            await websocket.send_text(json.dumps(ack))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        db.close()
+
+@router.get("/facturas/eventos")
+async def stream_eventos(
+    request: Request,
+    solicitud_id: Optional[str] = None,
+    punto_venta_id: Optional[int] = None
+):
+    # Server-Sent Events con los cambios de estado de cada emisión
+    # (encolado, numerado, cae_solicitado, aprobado/rechazado, persistido, error)
+    async def generar():
+        # Se suscribe dentro del generador: si la respuesta nunca llega a iterarlo
+        # (el cliente se fue antes) no queda una suscripción huérfana en el hub
+        suscripcion = hub.suscribir(solicitud_id=solicitud_id, punto_venta_id=punto_venta_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep-alive para proxies; de paso detecta clientes desconectados
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: estado\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            hub.desuscribir(suscripcion)
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/facturas/", response_model=List[Comprobante])
-def read_facturas(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud_comprobantes.get_comprobantes(db, skip=skip, limit=limit)
+def read_facturas(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    with profiling.perfilar(request, response):
+        return crud_comprobantes.get_comprobantes(db, skip=skip, limit=limit, desde=desde, hasta=hasta)
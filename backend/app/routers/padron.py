@@ -0,0 +1,44 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db, SessionLocal
+from app.models import Cliente
+from app.schemas import PadronContribuyente, PadronPrefetch
+from app.services.padron import PadronService, PadronNoDisponible
+from app.services.rate_limit import RateLimitExceeded
+import math
+
+router = APIRouter()
+
+@router.get("/padron/{cuit}", response_model=PadronContribuyente)
+def read_padron(cuit: str, forzar: bool = False, db: Session = Depends(get_db)):
+    # Para autocompletar nombre, dirección y condición IVA del cliente al tipear el CUIT
+    try:
+        contribuyente = PadronService(db).lookup(cuit, forzar=forzar)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except PadronNoDisponible as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not contribuyente:
+        raise HTTPException(status_code=404, detail="CUIT no encontrado en el padrón de AFIP")
+    return contribuyente
+
+def _ejecutar_prefetch(cuits):
+    db = SessionLocal()
+    try:
+        if cuits is None:
+            cuits = [c for (c,) in db.query(Cliente.numero_documento).filter(Cliente.tipo_documento == 80)]
+        resultado = PadronService(db).prefetch(cuits)
+        print(f"Prefetch de padrón finalizado: {resultado}")
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Error en prefetch de padrón: {e}")
+    finally:
+        db.close()
+
+@router.post("/padron/prefetch", status_code=202)
+def prefetch_padron(data: PadronPrefetch, background_tasks: BackgroundTasks):
+    background_tasks.add_task(_ejecutar_prefetch, data.cuits)
+    return {"status": "accepted", "message": "Precarga de padrón iniciada"}
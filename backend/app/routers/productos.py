@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.crud import productos as crud_productos
+from app.schemas import Producto, ProductoCreate
+from app.services.cache import TTLCache
+from typing import List
+
+router = APIRouter()
+
+# Caché corta de resultados de autocompletado (ver routers/clientes.py)
+busqueda_cache = TTLCache(ttl=30, maxsize=2048)
+
+@router.get("/productos/", response_model=List[Producto])
+def read_productos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return crud_productos.get_productos(db, skip=skip, limit=limit)
+
+@router.post("/productos/", response_model=Producto)
+def create_producto(producto: ProductoCreate, db: Session = Depends(get_db)):
+    db_producto = crud_productos.create_producto(db, producto)
+    # El alta tiene que aparecer en la próxima búsqueda
+    busqueda_cache.clear()
+    return db_producto
+
+@router.get("/productos/buscar", response_model=List[Producto])
+def search_productos(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    db: Session = Depends(get_db)
+):
+    q = q.strip()
+    key = (q.lower(), limit)
+    resultado = busqueda_cache.get(key)
+    if resultado is None:
+        productos = crud_productos.search_productos(db, q, limit=limit)
+        resultado = [Producto.from_orm(p) for p in productos]
+        busqueda_cache.set(key, resultado)
+    return resultado
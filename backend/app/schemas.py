@@ -67,24 +67,136 @@ class ClienteDetalleCreate(BaseModel):
     condicion_iva: Optional[str] = None
     email: Optional[str] = None
 
+class ComprobanteAsociado(BaseModel):
+    # Referencia al comprobante original de una Nota de Crédito/Débito
+    punto_venta_id: Optional[int] = None # Por defecto, el mismo punto de venta de la nota
+    tipo_comprobante: int
+    numero: int
+
 class ComprobanteCreate(BaseModel):
     cliente_id: Optional[int] = None
     cliente_detalle: Optional[ClienteDetalleCreate] = None
     punto_venta_id: int
-    tipo_comprobante: int # 1=A, 6=B, 11=C
+    tipo_comprobante: int # 1=A, 6=B, 11=C, 2/7/12=ND, 3/8/13=NC
     items: List[ComprobanteDetalleBase]
     total_neto: float
     total_iva: float
     total_comprobante: float
+    moneda_id: str = "PES" # Código de moneda AFIP (PES, DOL, 060=EUR, ...)
+    comprobante_asociado: Optional[ComprobanteAsociado] = None # Obligatorio para NC/ND
+    solicitud_id: Optional[str] = None # Id generado por el cliente para seguir los eventos SSE
+
+class NotaCreditoCreate(BaseModel):
+    # Si no se envían items se anula el comprobante original completo
+    comprobante_asociado: ComprobanteAsociado
+    punto_venta_id: int
+    items: Optional[List[ComprobanteDetalleBase]] = None
+    total_neto: Optional[float] = None
+    total_iva: Optional[float] = None
+    total_comprobante: Optional[float] = None
+
+class NotaCreditoLote(BaseModel):
+    notas: List[NotaCreditoCreate]
 
 class Comprobante(ComprobanteCreate):
     id: int
-    numero: int
+    numero: Optional[int] = None # Solo los autorizados por AFIP tienen número
     fecha_emision: datetime
     cae: Optional[str] = None
     vto_cae: Optional[date] = None
     resultado_afip: Optional[str] = None
     observaciones_afip: Optional[str] = None
+    asoc_punto_venta_id: Optional[int] = None
+    asoc_tipo_comprobante: Optional[int] = None
+    asoc_numero: Optional[int] = None
+    moneda_cotizacion: Optional[float] = None
     
     class Config:
         orm_mode = True
+
+# Schemas para Conciliación contra AFIP
+class ConciliacionProgreso(BaseModel):
+    punto_venta_id: int
+    tipo_comprobante: int
+    ultimo_numero: int
+    actualizado: datetime
+
+    class Config:
+        orm_mode = True
+
+class ConciliacionDiscrepancia(BaseModel):
+    id: int
+    punto_venta_id: int
+    tipo_comprobante: int
+    numero: int
+    tipo_discrepancia: str
+    valor_local: Optional[str] = None
+    valor_afip: Optional[str] = None
+    detectada: datetime
+    resuelta: bool
+
+    class Config:
+        orm_mode = True
+
+# Schemas para Padrón AFIP
+class PadronContribuyente(BaseModel):
+    cuit: str
+    nombre: Optional[str] = None
+    direccion: Optional[str] = None
+    condicion_iva: Optional[str] = None
+    consultado: datetime
+
+    class Config:
+        orm_mode = True
+
+class PadronPrefetch(BaseModel):
+    # Sin CUITs se precargan todos los clientes con CUIT (tipo_documento 80)
+    cuits: Optional[List[str]] = None
+
+# Schemas para Auditoría SOAP
+class AuditoriaSoap(BaseModel):
+    id: int
+    fecha: datetime
+    servicio: str
+    metodo: str
+    cuit: str
+    punto_venta: Optional[int] = None
+    tipo_comprobante: Optional[int] = None
+    numero: Optional[int] = None
+    numero_hasta: Optional[int] = None
+
+    class Config:
+        orm_mode = True
+
+class AuditoriaSoapDetalle(AuditoriaSoap):
+    request: Optional[str] = None
+    response: Optional[str] = None
+
+# Schemas para Profiling (admin)
+class ProfilingConfig(BaseModel):
+    tasa: float # Fracción de requests de /api/facturas/ a perfilar (0 = desactivado)
+
+class PerfilResumen(BaseModel):
+    request_id: str
+    ruta: str
+    metodo: str
+    inicio: datetime
+    duracion: float
+
+# Schemas para Consolidación de ventas a Consumidor Final
+class VentaConsolidable(BaseModel):
+    id: int
+    punto_venta_id: int
+    tipo_comprobante: int
+    fecha: datetime
+    referencia: Optional[str] = None
+    total_comprobante: float
+    estado: str
+    numero_resumen: Optional[int] = None
+    intentos: int = 0
+    ultimo_error: Optional[str] = None
+    comprobante_id: Optional[int] = None
+    comprobante_fecha: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
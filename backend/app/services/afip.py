@@ -1,7 +1,62 @@
 import os
-from pyafipws.wsaa import WSAA
-from pyafipws.wsfev1 import WSFEv1
+import threading
 from datetime import datetime
+from app.services.rate_limit import limitador_para
+from app.services import auditoria
+
+# Directorio de caché por defecto para WSDLs y TA (backend/cache)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+
+# Factura, Nota de Débito y Nota de Crédito C (sin discriminar IVA)
+TIPOS_COMPROBANTE_C = {11, 12, 13}
+
+# Máximo de registros por FECAESolicitar (FECompTotXRequest)
+MAX_REGISTROS_LOTE = 250
+
+# FECompConsultar: "No existen datos en nuestros registros para los parámetros ingresados"
+ERROR_NO_EXISTE = "602"
+
+# Mapeo de Condiciones IVA (Strings del frontend -> IDs AFIP)
+# 1: IVA Responsable Inscripto
+# 4: IVA Sujeto Exento
+# 5: Consumidor Final
+# 6: Responsable Monotributo
+# 8: Proveedor del Exterior
+# 9: Cliente del Exterior
+# 13: Monotributista Social
+CONDICION_IVA_MAP = {
+    "Responsable Inscripto": 1,
+    "Exento": 4,
+    "Consumidor Final": 5,
+    "Monotributo": 6,
+    "Monotributista Social": 13
+}
+
+# pyafipws arrastra pysimplesoap, M2Crypto/cryptography, etc. Se importa recién
+# en el primer uso (o en el warmup del startup) para no pagar ese costo al arrancar.
+_pyafipws = None
+_pyafipws_lock = threading.Lock()
+
+def cargar_pyafipws():
+    """Importa pyafipws una sola vez y devuelve (WSAA, WSFEv1)"""
+    global _pyafipws
+    if _pyafipws is None:
+        with _pyafipws_lock:
+            if _pyafipws is None:
+                from pyafipws.wsaa import WSAA
+                from pyafipws.wsfev1 import WSFEv1
+                _pyafipws = (WSAA, WSFEv1)
+    return _pyafipws
+
+def warmup():
+    """Precarga pyafipws y crea el directorio de caché (pensado para correr en segundo plano)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cargar_pyafipws()
+
+class AfipNoDisponible(Exception):
+    """AFIP no respondió o devolvió un error: la consulta no dice nada sobre el comprobante"""
+
 
 class AfipService:
     def __init__(self, cuit: str, certificado: str, clave_privada: str, produccion: bool = False, cache_dir: str = None):
@@ -15,6 +70,13 @@ class AfipService:
         self.wsdl_wsaa = "https://wsaa.afip.gov.ar/ws/services/LoginCms?wsdl" if produccion else "https://wsaahomo.afip.gov.ar/ws/services/LoginCms?wsdl"
         self.wsdl_wsfe = "https://servicios1.afip.gov.ar/wsfev1/service.asmx?WSDL" if produccion else "https://wswhomo.afip.gov.ar/wsfev1/service.asmx?WSDL"
         
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # Token bucket compartido por CUIT y ambiente, delante de cada llamada a AFIP
+        self.limiter = limitador_para(cuit, produccion)
+
+        WSAA, WSFEv1 = cargar_pyafipws()
         self.wsaa = WSAA()
         self.wsfe = WSFEv1()
 
@@ -95,7 +157,11 @@ class AfipService:
                 # Generar nuevo token
                 tra = self.wsaa.CreateTRA("wsfe", ttl=43200)
                 cms = self.wsaa.SignTRA(tra, self.certificado, self.clave_privada)
-                self.wsaa.LoginCMS(cms)
+                self.limiter.adquirir()
+                try:
+                    self.wsaa.LoginCMS(cms)
+                finally:
+                    self._auditar("wsaa", "LoginCMS")
                 print("DEBUG: LoginCMS exitoso")
                 
                 # Debug logging
@@ -171,41 +237,77 @@ class AfipService:
         
         return True
 
+    def _auditar(self, servicio, metodo, punto_venta=None, tipo_comprobante=None, numero=None, numero_hasta=None):
+        """Entrega el último request/response SOAP al archivo de auditoría (solo encola)"""
+        ws = self.wsaa if servicio == "wsaa" else self.wsfe
+        auditoria.registrar(
+            servicio, metodo, self.cuit,
+            getattr(ws, "XmlRequest", None), getattr(ws, "XmlResponse", None),
+            punto_venta=punto_venta, tipo_comprobante=tipo_comprobante,
+            numero=numero, numero_hasta=numero_hasta
+        )
+
+    def _error(self) -> str:
+        return " ".join(str(parte) for parte in (self.wsfe.Excepcion, self.wsfe.ErrMsg) if parte) or "sin respuesta"
+
     def get_last_invoice_number(self, punto_venta: int, tipo_comprobante: int):
         """Obtiene el último número de comprobante autorizado"""
         # cbte_tipo: 1=Factura A, 6=Factura B, 11=Factura C
-        return self.wsfe.CompUltimoAutorizado(tipo_comprobante, punto_venta)
+        self.limiter.adquirir()
+        try:
+            ultimo = self.wsfe.CompUltimoAutorizado(tipo_comprobante, punto_venta)
+        finally:
+            self._auditar("wsfe", "FECompUltimoAutorizado", punto_venta, tipo_comprobante)
+        # pyafipws captura los errores de red/SOAP y devuelve "": no confundirlo con "sin comprobantes"
+        if ultimo in (None, "") or self.wsfe.Excepcion:
+            raise AfipNoDisponible(f"FECompUltimoAutorizado {punto_venta}-{tipo_comprobante}: {self._error()}")
+        return ultimo
 
-    def create_invoice(self, punto_venta, tipo_comprobante, numero, fecha, total, dni_cuit, tipo_doc, lineas_items, condicion_iva=None):
-        if not self.wsfe:
-             raise Exception("Servicio WSFE no inicializado")
+    def get_exchange_rate(self, moneda_id: str) -> float:
+        """Cotización oficial de una moneda (FEParamGetCotizacion). Usar vía services/cotizaciones."""
+        self.limiter.adquirir()
+        try:
+            cotizacion = self.wsfe.ParamGetCotizacion(moneda_id)
+        finally:
+            self._auditar("wsfe", "FEParamGetCotizacion")
+        if not cotizacion:
+            raise ValueError(f"AFIP no devolvió cotización para {moneda_id}: {self.wsfe.ErrMsg}")
+        return float(cotizacion)
 
-        self.wsfe.Reprocesar = False
-        concepto = 1 # Productos
-        
-        # Mapeo de Condiciones IVA (Strings del frontend -> IDs AFIP)
-        # 1: IVA Responsable Inscripto
-        # 4: IVA Sujeto Exento
-        # 5: Consumidor Final
-        # 6: Responsable Monotributo
-        # 8: Proveedor del Exterior
-        # 9: Cliente del Exterior
-        # 13: Monotributista Social
-        condicion_iva_map = {
-            "Responsable Inscripto": 1,
-            "Exento": 4,
-            "Consumidor Final": 5,
-            "Monotributo": 6,
-            "Monotributista Social": 13
+    def get_invoice(self, punto_venta: int, tipo_comprobante: int, numero: int):
+        """Consulta un comprobante autorizado (FECompConsultar). Devuelve None si AFIP no lo tiene."""
+        self.limiter.adquirir()
+        try:
+            cae = self.wsfe.CompConsultar(tipo_comprobante, punto_venta, numero)
+        finally:
+            self._auditar("wsfe", "FECompConsultar", punto_venta, tipo_comprobante, numero)
+        if not cae:
+            # Solo el código 602 significa que AFIP no lo tiene; cualquier otro error (o una
+            # excepción capturada por pyafipws) deja el número sin verificar
+            codigos = set(str(self.wsfe.ErrCode or "").replace(",", " ").split())
+            if not self.wsfe.Excepcion and codigos == {ERROR_NO_EXISTE}:
+                return None
+            raise AfipNoDisponible(f"FECompConsultar {punto_venta}-{tipo_comprobante}-{numero}: {self._error()}")
+        return {
+            "cae": cae,
+            "numero": int(self.wsfe.CbteNro or numero),
+            "fecha": self.wsfe.FechaCbte,
+            "vencimiento": self.wsfe.Vencimiento,
+            "total": float(self.wsfe.ImpTotal or 0),
+            "resultado": self.wsfe.Resultado
         }
 
+    def _cargar_factura(self, punto_venta, tipo_comprobante, numero, fecha, total, dni_cuit, tipo_doc, lineas_items, condicion_iva=None, cbtes_asoc=None, moneda_id="PES", moneda_ctz=1.0):
+        """Arma el comprobante en self.wsfe (CrearFactura + IVA + comprobantes asociados)"""
+        concepto = 1 # Productos
+
         # Preparar factura
         # CrearFactura(concepto, tipo_doc, nro_doc, doc_asoc, cbte_asoc,
         #              punto_venta, cbte_nro, imp_total, imp_tot_conc, imp_neto,
         #              imp_iva, imp_trib, imp_op_ex, fecha_cbte, fecha_venc_pago,
         #              fecha_serv_desde, fecha_serv_hasta, moneda_id, moneda_ctz)
         
-        if int(tipo_comprobante) == 11: # Factura C
+        if int(tipo_comprobante) in TIPOS_COMPROBANTE_C: # Factura/ND/NC C
             imp_neto = total
             imp_iva = 0.0
         else:
@@ -219,7 +321,7 @@ class AfipService:
         # Obtener ID Condicion IVA Receptor
         iva_receptor_id = None
         if condicion_iva:
-            iva_receptor_id = condicion_iva_map.get(condicion_iva)
+            iva_receptor_id = CONDICION_IVA_MAP.get(condicion_iva)
 
         self.wsfe.CrearFactura(
             concepto=concepto,
@@ -241,13 +343,23 @@ class AfipService:
             fecha_venc_pago=None, # No obligatorio para Concepto 1 (Productos)
             fecha_serv_desde=None,
             fecha_serv_hasta=None,
-            moneda_id="PES",
-            moneda_ctz=1.000,
+            moneda_id=moneda_id,
+            moneda_ctz=moneda_ctz,
             condicion_iva_receptor_id=iva_receptor_id
         )
 
-        # Agregar detalle de IVA (Solo para NO Factura C)
-        if int(tipo_comprobante) != 11:
+        # Comprobantes asociados (CbtesAsoc), obligatorios para NC/ND
+        for asoc in cbtes_asoc or []:
+            self.wsfe.AgregarCmpAsoc(
+                tipo=asoc['tipo'],
+                pto_vta=asoc['pto_vta'],
+                nro=asoc['nro'],
+                cuit=asoc.get('cuit'),
+                fecha=asoc.get('fecha')
+            )
+
+        # Agregar detalle de IVA (Solo para NO tipo C)
+        if int(tipo_comprobante) not in TIPOS_COMPROBANTE_C:
             for item in lineas_items:
                  # Asumiendo 21% por defecto si no viene
                  iva_id = 5 # 21%
@@ -260,9 +372,8 @@ class AfipService:
 
                  self.wsfe.AgregarIva(iva_id, item['base_imponible'], item['importe_iva'])
 
-        # Solicitar CAE
-        self.wsfe.CAESolicitar()
-        
+    def _leer_resultado(self):
+        """Resultado del último comprobante procesado (o leído del lote con LeerFacturaX)"""
         if self.wsfe.Resultado == "A":
             return {
                 "cae": self.wsfe.CAE,
@@ -275,3 +386,66 @@ class AfipService:
                 "errores": f"{self.wsfe.Excepcion}\n{self.wsfe.ErrMsg}".strip(),
                 "observaciones": self.wsfe.Obs
             }
+
+    def create_invoice(self, punto_venta, tipo_comprobante, numero, fecha, total, dni_cuit, tipo_doc, lineas_items, condicion_iva=None, cbtes_asoc=None, moneda_id="PES", moneda_ctz=1.0):
+        if not self.wsfe:
+             raise Exception("Servicio WSFE no inicializado")
+
+        self.wsfe.Reprocesar = False
+        self._cargar_factura(punto_venta, tipo_comprobante, numero, fecha, total, dni_cuit,
+                             tipo_doc, lineas_items, condicion_iva, cbtes_asoc, moneda_id, moneda_ctz)
+
+        # Solicitar CAE
+        self.limiter.adquirir()
+        try:
+            self.wsfe.CAESolicitar()
+        finally:
+            # Evidencia legal de lo enviado y lo devuelto, aunque la llamada falle
+            self._auditar("wsfe", "FECAESolicitar", punto_venta, tipo_comprobante, numero)
+        return self._leer_resultado()
+
+    def create_invoices_batch(self, facturas):
+        """Solicita CAE para varios comprobantes en un único FECAESolicitar.
+
+        `facturas` es una lista de dicts con los mismos argumentos que create_invoice.
+        AFIP exige que todos compartan punto de venta y tipo, y números consecutivos.
+        Devuelve los resultados en el mismo orden.
+        """
+        if not self.wsfe:
+             raise Exception("Servicio WSFE no inicializado")
+        if not facturas:
+            return []
+        if len(facturas) > MAX_REGISTROS_LOTE:
+            raise ValueError(f"AFIP admite hasta {MAX_REGISTROS_LOTE} comprobantes por lote")
+
+        self.wsfe.Reprocesar = False
+        self.wsfe.IniciarFacturasX()
+        for factura in facturas:
+            self._cargar_factura(**factura)
+            self.wsfe.AgregarFacturaX()
+
+        self.limiter.adquirir()
+        try:
+            self.wsfe.CAESolicitarX()
+        finally:
+            self._auditar(
+                "wsfe", "FECAESolicitar", facturas[0]["punto_venta"], facturas[0]["tipo_comprobante"],
+                facturas[0]["numero"], facturas[-1]["numero"]
+            )
+
+        resultados = []
+        for i in range(len(facturas)):
+            self.wsfe.LeerFacturaX(i)
+            resultados.append(self._leer_resultado())
+        return resultados
+
+
+def afip_service_para(pv, cache_dir: str = CACHE_DIR) -> AfipService:
+    """Crea un AfipService (sin autenticar) con los datos de un PuntoVenta"""
+    return AfipService(
+        cuit=pv.cuit,
+        certificado=pv.certificado_path,
+        clave_privada=pv.key_path,
+        produccion=pv.es_produccion,
+        cache_dir=cache_dir
+    )
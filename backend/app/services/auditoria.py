@@ -0,0 +1,288 @@
+"""Archivo de auditoría de los intercambios SOAP con AFIP (WSAA/WSFE).
+
+`registrar` solo encola el par request/response (no hace I/O): una hebra de
+fondo junta los registros en tandas, comprime cada uno como un frame zstd
+independiente, los agrega a archivos de segmento particionados por fecha
+(AUDITORIA_DIR/AAAA/MM/DD/) e inserta en auditoria_soap el índice
+(CUIT, PV, tipo, número) -> (archivo, offset, longitud) para leerlos después.
+
+Nada se descarta en silencio. Con la cola llena `registrar` frena al llamador
+hasta ESPERA_MAXIMA y, si no hay lugar, guarda el registro sin comprimir en
+AUDITORIA_DIR/pendientes/. Cada tanda escribe su índice en un diario de ese
+directorio antes que los frames y lo borra recién cuando el índice quedó en la
+base: si la base falla (o el proceso muere en el medio) el diario se reaplica
+al arrancar y periódicamente, y no quedan frames huérfanos.
+"""
+import fcntl
+import glob
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.database import SessionLocal
+from app.models import AuditoriaSoap
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+AUDITORIA_DIR = os.getenv("AUDITORIA_DIR", os.path.join(BASE_DIR, "auditoria"))
+PENDIENTES_DIR = os.path.join(AUDITORIA_DIR, "pendientes")
+NIVEL_ZSTD = int(os.getenv("AUDITORIA_NIVEL_ZSTD", "9"))
+
+MAX_PENDIENTES = 10000
+# Segundos que `registrar` puede frenar la emisión con la cola llena (disco o base lentos)
+ESPERA_MAXIMA = float(os.getenv("AUDITORIA_ESPERA_MAXIMA", "5"))
+TAMANO_TANDA = 200
+ESPERA_TANDA = 1.0 # segundos
+INTERVALO_RECUPERACION = 60.0 # segundos entre revisiones de AUDITORIA_DIR/pendientes
+
+_cola = queue.Queue(maxsize=MAX_PENDIENTES)
+_hilo = None
+_hilo_lock = threading.Lock()
+_detener = threading.Event()
+# Identifica los archivos que escribe este proceso (ver iniciar()); los offsets del índice
+# se calculan con tell() y solo son válidos si nadie más escribe en el mismo segmento
+_escritor_id = None
+descartados = 0 # Solo si ni siquiera se pudo escribir en pendientes/
+
+
+def registrar(servicio, metodo, cuit, xml_request, xml_response, punto_venta=None,
+              tipo_comprobante=None, numero=None, numero_hasta=None):
+    """Encola un intercambio SOAP para archivar. Bloquea hasta ESPERA_MAXIMA si la cola está llena."""
+    if not xml_request and not xml_response:
+        return
+    iniciar()
+    registro = (
+        datetime.utcnow(), servicio, metodo, str(cuit), punto_venta, tipo_comprobante,
+        numero, numero_hasta if numero_hasta is not None else numero, xml_request, xml_response
+    )
+    try:
+        _cola.put(registro, timeout=ESPERA_MAXIMA)
+    except queue.Full:
+        print("DEBUG: Cola de auditoría llena, registro guardado en pendientes")
+        _rescatar([registro])
+
+
+def iniciar():
+    """Arranca la hebra escritora (que primero reaplica lo pendiente de corridas anteriores)"""
+    global _hilo, _escritor_id
+    if _hilo is None:
+        with _hilo_lock:
+            if _hilo is None:
+                # Se genera acá (después del fork de los workers): el PID solo no alcanza, las
+                # réplicas en Docker suelen ser todas PID 1 y comparten el volumen de auditoría
+                _escritor_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:12]}"
+                _hilo = threading.Thread(target=_escritor, name="auditoria-soap", daemon=True)
+                _hilo.start()
+
+
+def detener(timeout: float = 5.0):
+    """Vacía la cola y detiene la hebra escritora (al apagar el servidor)"""
+    if _hilo is not None:
+        _detener.set()
+        _hilo.join(timeout)
+
+
+def _a_texto(xml):
+    if isinstance(xml, bytes):
+        return xml.decode("utf8", errors="replace")
+    return xml
+
+
+@contextmanager
+def _abrir_bloqueado(ruta: str, modo: str = "a"):
+    """Abre `ruta` con flock exclusivo. Si otro proceso la procesó y borró mientras se
+    esperaba el lock, la vuelve a abrir (si no, lo escrito iría a un archivo borrado)."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    while True:
+        f = open(ruta, modo)
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if os.fstat(f.fileno()).st_nlink:
+            break
+        f.close()
+    try:
+        yield f
+    finally:
+        f.close()
+
+
+def _rescatar(tanda):
+    """Guarda registros sin procesar en pendientes/; la hebra escritora los reintenta después"""
+    global descartados
+    try:
+        with _abrir_bloqueado(os.path.join(PENDIENTES_DIR, f"registros-{_escritor_id}.jsonl")) as f:
+            for registro in tanda:
+                f.write(json.dumps([registro[0].isoformat()] + [_a_texto(campo) for campo in registro[1:]]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError as e:
+        descartados += len(tanda)
+        print(f"DEBUG: No se pudo guardar la auditoría SOAP pendiente ({descartados} registros perdidos en total): {e}")
+
+
+def _escritor():
+    import zstandard
+
+    compresor = zstandard.ZstdCompressor(level=NIVEL_ZSTD)
+    _recuperar(compresor)
+    ultima_recuperacion = time.monotonic()
+    while not (_detener.is_set() and _cola.empty()):
+        tanda = []
+        limite = time.monotonic() + ESPERA_TANDA
+        while len(tanda) < TAMANO_TANDA:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                tanda.append(_cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        if tanda:
+            try:
+                _escribir_tanda(compresor, tanda)
+            except Exception as e:
+                print(f"DEBUG: Error escribiendo auditoría SOAP ({len(tanda)} registros a pendientes): {e}")
+                _rescatar(tanda)
+        if time.monotonic() - ultima_recuperacion > INTERVALO_RECUPERACION:
+            _recuperar(compresor)
+            ultima_recuperacion = time.monotonic()
+
+
+def _segmento(fecha: datetime) -> str:
+    # Un segmento por hora y escritor: ni los workers ni las réplicas comparten archivo
+    directorio = os.path.join(AUDITORIA_DIR, fecha.strftime("%Y"), fecha.strftime("%m"), fecha.strftime("%d"))
+    os.makedirs(directorio, exist_ok=True)
+    return os.path.join(directorio, f"{fecha.strftime('%H')}-{_escritor_id}.zst")
+
+
+def _escribir_tanda(compresor, tanda):
+    """Escribe diario, frames e índice. Solo lanza si falla antes de que el diario y los
+    frames estén en disco (el llamador rescata la tanda); un error de la base deja el diario."""
+    indices = []
+    frames = {}
+    archivos = {}
+    try:
+        for (fecha, servicio, metodo, cuit, punto_venta, tipo_comprobante,
+             numero, numero_hasta, xml_request, xml_response) in tanda:
+            ruta = _segmento(fecha)
+            if ruta not in archivos:
+                archivos[ruta] = open(ruta, "ab")
+                frames[ruta] = []
+            # Cada registro es un frame zstd autónomo: se lee con seek sin descomprimir el resto
+            frame = compresor.compress(json.dumps({
+                "request": _a_texto(xml_request),
+                "response": _a_texto(xml_response),
+            }).encode("utf8"))
+            # Solo esta hebra escribe los segmentos de este proceso: el offset se conoce de antemano
+            offset = archivos[ruta].tell() + sum(len(anterior) for anterior in frames[ruta])
+            frames[ruta].append(frame)
+            indices.append({
+                "fecha": fecha.isoformat(),
+                "servicio": servicio,
+                "metodo": metodo,
+                "cuit": cuit,
+                "punto_venta": punto_venta,
+                "tipo_comprobante": tipo_comprobante,
+                "numero": numero,
+                "numero_hasta": numero_hasta,
+                "archivo": os.path.relpath(ruta, AUDITORIA_DIR),
+                "offset": offset,
+                "longitud": len(frame),
+            })
+
+        diario = os.path.join(PENDIENTES_DIR, f"indice-{_escritor_id}-{uuid.uuid4().hex}.jsonl")
+        # El lock del diario lo reserva para esta hebra: otra recuperación no lo toma a medio escribir
+        with _abrir_bloqueado(diario, "w") as f:
+            f.write("".join(json.dumps(indice) + "\n" for indice in indices))
+            f.flush()
+            os.fsync(f.fileno())
+            try:
+                for ruta, segmento in archivos.items():
+                    segmento.write(b"".join(frames[ruta]))
+                    segmento.flush()
+                    os.fsync(segmento.fileno())
+            except Exception:
+                os.remove(diario)
+                raise
+
+            try:
+                _insertar_indices(indices)
+            except Exception as e:
+                print(f"DEBUG: Error insertando el índice de auditoría SOAP, queda en {diario}: {e}")
+                return
+            os.remove(diario)
+    finally:
+        for segmento in archivos.values():
+            segmento.close()
+
+
+def _insertar_indices(indices):
+    if not indices:
+        return
+    filas = [dict(indice, fecha=datetime.fromisoformat(indice["fecha"])) for indice in indices]
+    db = SessionLocal()
+    try:
+        # (archivo, offset) es único: reaplicar un diario ya insertado no duplica
+        db.execute(pg_insert(AuditoriaSoap.__table__).values(filas).on_conflict_do_nothing(
+            index_elements=["archivo", "offset"]
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _leer_lineas(f) -> list:
+    lineas = []
+    for linea in f:
+        try:
+            lineas.append(json.loads(linea))
+        except ValueError:
+            continue # Última línea cortada por una caída a mitad de escritura
+    return lineas
+
+
+def _recuperar(compresor):
+    """Reaplica diarios de índice y registros rescatados de pendientes/ (de cualquier proceso)"""
+    for ruta in sorted(glob.glob(os.path.join(PENDIENTES_DIR, "*.jsonl"))):
+        try:
+            f = open(ruta)
+        except FileNotFoundError:
+            continue
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue # Su dueño lo está usando
+            if not os.fstat(f.fileno()).st_nlink:
+                continue # Otro proceso ya lo procesó
+            lineas = _leer_lineas(f)
+            try:
+                if os.path.basename(ruta).startswith("indice-"):
+                    # Solo los frames que llegaron completos al segmento
+                    _insertar_indices([
+                        indice for indice in lineas
+                        if os.path.exists(os.path.join(AUDITORIA_DIR, indice["archivo"]))
+                        and os.path.getsize(os.path.join(AUDITORIA_DIR, indice["archivo"])) >= indice["offset"] + indice["longitud"]
+                    ])
+                else:
+                    _escribir_tanda(compresor, [
+                        tuple([datetime.fromisoformat(linea[0])] + linea[1:]) for linea in lineas
+                    ])
+            except Exception as e:
+                print(f"DEBUG: No se pudo recuperar la auditoría pendiente {ruta}: {e}")
+                continue
+            os.remove(ruta)
+
+
+def leer(registro: AuditoriaSoap) -> dict:
+    """Devuelve {"request": ..., "response": ...} de un registro del índice"""
+    import zstandard
+
+    with open(os.path.join(AUDITORIA_DIR, registro.archivo), "rb") as f:
+        f.seek(registro.offset)
+        frame = f.read(registro.longitud)
+    return json.loads(zstandard.ZstdDecompressor().decompress(frame))
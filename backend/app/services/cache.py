@@ -0,0 +1,43 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Caché en memoria con expiración por entrada y tamaño acotado.
+
+    Pensada para respuestas de lectura muy repetidas (autocompletado, etc.)
+    dentro de un mismo proceso. Es thread-safe porque los endpoints síncronos
+    de FastAPI corren en un threadpool.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expira, valor = entry
+            if expira < time.monotonic():
+                del self._data[key]
+                return None
+            return valor
+
+    def set(self, key, valor):
+        with self._lock:
+            if len(self._data) >= self.maxsize:
+                # Descartar primero las expiradas; si no alcanza, la más vieja insertada
+                ahora = time.monotonic()
+                for k in [k for k, (exp, _) in self._data.items() if exp < ahora]:
+                    del self._data[k]
+                if len(self._data) >= self.maxsize:
+                    del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, valor)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,381 @@
+"""Consolidación diaria de ventas chicas a Consumidor Final en comprobantes resumen.
+
+Con CONSOLIDACION_CF=1 las ventas anónimas (documento 99) de Factura B o C por
+debajo de UMBRAL no se emiten una por una: se guardan en ventas_consolidables y
+una vez por día (CONSOLIDACION_HORA) se agrupan por punto de venta, tipo y día
+en comprobantes resumen, cada uno también por debajo del umbral y con un ítem
+por alícuota. Cada resumen se fecha el día de sus ventas (dentro de la ventana
+que acepta AFIP), se autorizan en lotes multi-registro y cada venta queda
+vinculada a su comprobante (comprobante_id, comprobante_fecha).
+
+Corre una consolidación a la vez (advisory lock): cada worker tiene su
+programador. Antes de pedir el CAE de una tanda sus ventas pasan a "emitiendo"
+con el número de su resumen (numero_resumen) y se confirma; si algo falla
+después (la respuesta de AFIP, el commit, el proceso entero) no se vuelven a
+poner en "pendiente" a ciegas: se consulta ese número en AFIP y, si el resumen
+quedó autorizado, se guarda con su CAE (_recuperar). Lo mismo se hace al
+empezar cada corrida con lo que haya quedado de corridas anteriores.
+
+Uso manual (desde backend/):
+    python -m app.services.consolidacion [--punto-venta ID]
+"""
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import List
+from sqlalchemy import case, text
+from app.database import SessionLocal, engine
+from app.models import VentaConsolidable
+from app.schemas import ComprobanteCreate, ComprobanteDetalleBase, ClienteDetalleCreate
+from app.services.afip import MAX_REGISTROS_LOTE, AfipNoDisponible
+from app.services.invoice_generator import InvoiceService
+
+HABILITADA = os.getenv("CONSOLIDACION_CF", "0") == "1"
+# Monto a partir del cual AFIP exige identificar al Consumidor Final: mantenerlo al día con la normativa
+UMBRAL = float(os.getenv("CONSOLIDACION_UMBRAL", "10000000"))
+HORA = os.getenv("CONSOLIDACION_HORA", "23:30")
+
+TIPOS_CONSOLIDABLES = {6, 11}
+
+# Resúmenes rechazados que puede integrar una venta antes de quedar en "error" (revisión manual)
+MAX_INTENTOS = int(os.getenv("CONSOLIDACION_MAX_INTENTOS", "3"))
+
+# AFIP acepta comprobantes de productos fechados hasta 5 días antes del envío
+DIAS_ATRASO_MAXIMO = 5
+
+# Clave del advisory lock que serializa las corridas entre workers
+LOCK_CONSOLIDACION = 7_310_003
+
+CONSUMIDOR_FINAL = dict(
+    nombre="Consumidor Final", numero_documento="0", tipo_documento=99, condicion_iva="Consumidor Final"
+)
+
+
+def cliente_consumidor_final() -> ClienteDetalleCreate:
+    return ClienteDetalleCreate.construct(direccion=None, email=None, **CONSUMIDOR_FINAL)
+
+
+def es_consolidable(data: ComprobanteCreate) -> bool:
+    if not HABILITADA:
+        return False
+    if data.tipo_comprobante not in TIPOS_CONSOLIDABLES or data.comprobante_asociado or data.cliente_id:
+        return False
+    if (data.moneda_id or "PES") != "PES":
+        return False
+    if data.cliente_detalle is not None and data.cliente_detalle.tipo_documento != 99:
+        return False
+    total = data.total_comprobante
+    if total is None:
+        total = sum(item.subtotal for item in data.items)
+    return total < UMBRAL
+
+
+@contextmanager
+def _corrida_exclusiva():
+    """Advisory lock de sesión en una conexión propia mientras dure la corrida. Da False si está tomado."""
+    conexion = engine.connect()
+    obtenido = False
+    try:
+        obtenido = conexion.execute(text("SELECT pg_try_advisory_lock(:clave)"), {"clave": LOCK_CONSOLIDACION}).scalar()
+        conexion.commit()
+        yield obtenido
+    finally:
+        try:
+            if obtenido:
+                conexion.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": LOCK_CONSOLIDACION})
+                conexion.commit()
+            conexion.close()
+        except Exception:
+            conexion.invalidate() # Cerrar la conexión de verdad también suelta el lock
+
+
+class ConsolidacionService(InvoiceService):
+    def encolar(self, ventas: List[ComprobanteCreate], referencias=None) -> List[VentaConsolidable]:
+        """Guarda ventas consolidables (ver es_consolidable) hasta la próxima consolidación"""
+        registros = []
+        for venta, referencia in zip(ventas, referencias or [None] * len(ventas)):
+            if venta.total_comprobante is None:
+                venta = self._con_totales(venta, venta.items, venta.tipo_comprobante)
+            registros.append(VentaConsolidable(
+                punto_venta_id=venta.punto_venta_id,
+                tipo_comprobante=venta.tipo_comprobante,
+                fecha=datetime.now(),
+                referencia=None if referencia is None else str(referencia),
+                items=[item.dict() for item in venta.items],
+                total_neto=venta.total_neto,
+                total_iva=venta.total_iva,
+                total_comprobante=venta.total_comprobante
+            ))
+        self.db.add_all(registros)
+        self.db.commit()
+        return registros
+
+    def _reclamar(self, punto_venta_id, hasta):
+        # SKIP LOCKED + estado "procesando": dos workers no consolidan la misma venta
+        query = self.db.query(VentaConsolidable).filter(
+            VentaConsolidable.estado == "pendiente", VentaConsolidable.fecha <= hasta
+        )
+        if punto_venta_id is not None:
+            query = query.filter(VentaConsolidable.punto_venta_id == punto_venta_id)
+        ventas = query.order_by(
+            VentaConsolidable.punto_venta_id, VentaConsolidable.tipo_comprobante,
+            VentaConsolidable.fecha, VentaConsolidable.id
+        ).with_for_update(skip_locked=True).all()
+
+        reclamadas = [(v.id, v.punto_venta_id, v.tipo_comprobante, v.fecha.date(), v.items, v.total_comprobante)
+                      for v in ventas]
+        for venta in ventas:
+            venta.estado = "procesando"
+        self.db.commit()
+        return reclamadas
+
+    def _resumen(self, dia, ventas):
+        # Un ítem por alícuota con el total de las ventas incluidas
+        por_alicuota = {}
+        for _, _, _, _, items, _ in ventas:
+            for item in items:
+                alicuota = item.get("alicuota_iva") or 21.0
+                por_alicuota[alicuota] = por_alicuota.get(alicuota, 0.0) + item["subtotal"]
+        items = [
+            ComprobanteDetalleBase.construct(
+                producto_id=None,
+                descripcion=f"Ventas a Consumidor Final del {dia.strftime('%d/%m/%Y')} - IVA {alicuota:g}% ({len(ventas)} tickets)",
+                cantidad=1.0,
+                precio_unitario=round(subtotal, 2),
+                alicuota_iva=alicuota,
+                subtotal=round(subtotal, 2)
+            )
+            for alicuota, subtotal in sorted(por_alicuota.items())
+        ]
+        data = ComprobanteCreate.construct(
+            cliente_id=None, cliente_detalle=cliente_consumidor_final(),
+            punto_venta_id=ventas[0][1], tipo_comprobante=ventas[0][2], items=items,
+            moneda_id="PES", comprobante_asociado=None, solicitud_id=None
+        )
+        return self._con_totales(data, items, data.tipo_comprobante)
+
+    def _agrupar(self, reclamadas):
+        """{(pv, tipo): [(resumen, ids de ventas, día)]}, cada resumen de un solo día y por debajo del umbral"""
+        por_dia = {}
+        for venta in reclamadas:
+            por_dia.setdefault((venta[1], venta[2], venta[3]), []).append(venta)
+
+        grupos = {}
+        for (pv_id, tipo, dia), ventas in por_dia.items():
+            actual, total = [], 0.0
+            for venta in ventas + [None]:
+                if venta is None or (actual and total + venta[5] >= UMBRAL):
+                    if actual:
+                        grupos.setdefault((pv_id, tipo), []).append(
+                            (self._resumen(dia, actual), [v[0] for v in actual], dia)
+                        )
+                    actual, total = [], 0.0
+                if venta is not None:
+                    actual.append(venta)
+                    total += venta[5]
+        return grupos
+
+    def _vincular(self, ids, **valores):
+        self.db.query(VentaConsolidable).filter(VentaConsolidable.id.in_(ids)).update(
+            valores, synchronize_session=False
+        )
+
+    def _rechazado(self, ids, comprobante):
+        """Las ventas de un resumen rechazado vuelven a "pendiente" para la próxima corrida;
+        tras MAX_INTENTOS rechazos quedan en "error" hasta reintentar() manual"""
+        error = f"Resumen rechazado por AFIP: {comprobante.observaciones_afip}"[:1000]
+        # En el SET, intentos es el valor previo a este UPDATE
+        self._vincular(
+            ids, intentos=VentaConsolidable.intentos + 1, ultimo_error=error,
+            estado=case((VentaConsolidable.intentos + 1 >= MAX_INTENTOS, "error"), else_="pendiente")
+        )
+        agotadas = self.db.query(VentaConsolidable).filter(
+            VentaConsolidable.id.in_(ids), VentaConsolidable.estado == "error"
+        ).count()
+        if agotadas:
+            print(f"ALERTA: {agotadas} ventas consolidables en estado error tras {MAX_INTENTOS} rechazos. {error}")
+        else:
+            print(f"{error}; {len(ids)} ventas vuelven a pendiente")
+
+    def reintentar(self, punto_venta_id: int = None) -> int:
+        """Devuelve a "pendiente" las ventas en "error" (después de corregir la causa del rechazo)"""
+        query = self.db.query(VentaConsolidable).filter(VentaConsolidable.estado == "error")
+        if punto_venta_id is not None:
+            query = query.filter(VentaConsolidable.punto_venta_id == punto_venta_id)
+        cantidad = query.update({"estado": "pendiente", "intentos": 0}, synchronize_session=False)
+        self.db.commit()
+        return cantidad
+
+    def _recuperar(self, cliente, punto_venta_id: int = None, tipo_comprobante: int = None):
+        """Resuelve contra AFIP las ventas en "emitiendo" (corrida que falló después de pedir
+        el CAE) y devuelve a "pendiente" las que quedaron en "procesando" sin llegar a AFIP.
+        Solo se llama con la corrida exclusiva tomada: nada de esto está en vuelo."""
+        query = self.db.query(VentaConsolidable).filter(VentaConsolidable.estado.in_(("procesando", "emitiendo")))
+        if punto_venta_id is not None:
+            query = query.filter(VentaConsolidable.punto_venta_id == punto_venta_id)
+        if tipo_comprobante is not None:
+            query = query.filter(VentaConsolidable.tipo_comprobante == tipo_comprobante)
+        resumenes = {}
+        procesando = []
+        for v in query.order_by(VentaConsolidable.fecha, VentaConsolidable.id):
+            if v.estado == "procesando" or v.numero_resumen is None:
+                procesando.append(v.id)
+            else:
+                resumenes.setdefault((v.punto_venta_id, v.tipo_comprobante, v.numero_resumen), []).append(
+                    (v.id, v.punto_venta_id, v.tipo_comprobante, v.fecha.date(), v.items, v.total_comprobante)
+                )
+        if procesando:
+            self._vincular(procesando, estado="pendiente")
+            self.db.commit()
+
+        recuperados = []
+        conexiones = {}
+        for (pv_id, tipo, numero), ventas in resumenes.items():
+            ids = [v[0] for v in ventas]
+            data = self._resumen(ventas[0][3], ventas)
+            try:
+                if pv_id not in conexiones:
+                    pv = self._get_punto_venta(pv_id)
+                    conexiones[pv_id] = (pv, self._conectar_afip(pv))
+                pv, afip = conexiones[pv_id]
+                autorizado = afip.get_invoice(pv.numero, tipo, numero)
+            except (AfipNoDisponible, ValueError) as e:
+                # Sin saber qué pasó en AFIP no se toca nada: se reintenta en la próxima corrida
+                print(f"No se pudo verificar el resumen {numero} de PV {pv_id} tipo {tipo} en AFIP: {e}")
+                continue
+
+            # El número pudo quedar para otra emisión si el pedido nunca llegó a AFIP: se compara el total
+            if autorizado and autorizado.get("cae") and abs(autorizado["total"] - data.total_comprobante) <= 0.01:
+                factura = dict(
+                    numero=numero, fecha=datetime.strptime(autorizado["fecha"], "%Y%m%d"),
+                    moneda_id="PES", moneda_ctz=1.0
+                )
+                resultado = {"cae": autorizado["cae"], "vencimiento": autorizado["vencimiento"], "resultado": "Aprobado"}
+                recuperados.extend(self._persistir_tanda(
+                    pv, tipo, [factura], [(data, cliente, data.items, None, "PES", 1.0)], [resultado],
+                    antes_de_confirmar=lambda nuevos, ids=ids: self._vincular(
+                        ids, estado="consolidada", numero_resumen=None,
+                        comprobante_id=nuevos[0].id, comprobante_fecha=nuevos[0].fecha_emision
+                    )
+                ))
+                print(f"Resumen {numero} de PV {pv.numero} tipo {tipo} recuperado de AFIP ({len(ids)} ventas)")
+            else:
+                self._vincular(ids, estado="pendiente", numero_resumen=None)
+                self.db.commit()
+        return recuperados
+
+    def _fecha_minima(self, afip, pv, tipo_comprobante) -> date:
+        """Fecha más vieja que AFIP acepta para el próximo comprobante del (PV, tipo)"""
+        minima = date.today() - timedelta(days=DIAS_ATRASO_MAXIMO)
+        # Además, la fecha no puede ser anterior a la del último comprobante autorizado
+        ultimo = int(afip.get_last_invoice_number(pv.numero, tipo_comprobante))
+        if ultimo:
+            autorizado = afip.get_invoice(pv.numero, tipo_comprobante, ultimo)
+            if autorizado and autorizado.get("fecha"):
+                minima = max(minima, datetime.strptime(autorizado["fecha"], "%Y%m%d").date())
+        return minima
+
+    def consolidar(self, punto_venta_id: int = None, hasta: datetime = None):
+        """Emite los comprobantes resumen de las ventas pendientes hasta `hasta` (por defecto, ahora)"""
+        with _corrida_exclusiva() as exclusiva:
+            if not exclusiva:
+                raise ValueError("Ya hay una consolidación en curso")
+            return self._consolidar(punto_venta_id, hasta)
+
+    def _consolidar(self, punto_venta_id, hasta):
+        # Antes de reclamar: si falla no deja ventas en "procesando"
+        cliente = self._resolver_cliente(ComprobanteCreate.construct(
+            cliente_id=None, cliente_detalle=cliente_consumidor_final()
+        ))
+        emitidos = self._recuperar(cliente, punto_venta_id)
+        grupos = self._agrupar(self._reclamar(punto_venta_id, hasta or datetime.now()))
+
+        for (pv_id, tipo), resumenes in grupos.items():
+            pendientes = list(resumenes)
+            try:
+                pv = self._get_punto_venta(pv_id)
+                afip = self._conectar_afip(pv)
+                while pendientes:
+                    tanda = pendientes[:MAX_REGISTROS_LOTE]
+
+                    def marcar_tanda(facturas, tanda=tanda):
+                        # Confirmado antes de pedir el CAE: si algo falla después, _recuperar
+                        # sabe qué número consultar en AFIP para cada resumen
+                        for factura, (_, ids, _) in zip(facturas, tanda):
+                            self._vincular(ids, estado="emitiendo", numero_resumen=factura["numero"])
+                        self.db.commit()
+
+                    def vincular_tanda(nuevos, tanda=tanda):
+                        # En la misma transacción que los comprobantes: una venta nunca queda
+                        # pendiente si su resumen ya tiene CAE
+                        for nuevo, (_, ids, _) in zip(nuevos, tanda):
+                            if nuevo.cae:
+                                self._vincular(
+                                    ids, estado="consolidada", numero_resumen=None,
+                                    comprobante_id=nuevo.id, comprobante_fecha=nuevo.fecha_emision
+                                )
+                            else:
+                                self._vincular(ids, numero_resumen=None)
+                                self._rechazado(ids, nuevo)
+
+                    # Cada resumen con la fecha de sus ventas, salvo que AFIP ya no la acepte
+                    # (atraso mayor al permitido o un comprobante posterior ya autorizado)
+                    minima = self._fecha_minima(afip, pv, tipo)
+                    fechas = [datetime.combine(max(dia, minima), datetime.min.time()) for _, _, dia in tanda]
+                    emitidos.extend(self._emitir_tanda(
+                        afip, pv, tipo, [(data, cliente, data.items, None, "PES", 1.0) for data, _, _ in tanda],
+                        antes_de_confirmar=vincular_tanda, fechas=fechas, antes_de_solicitar=marcar_tanda
+                    ))
+                    pendientes = pendientes[MAX_REGISTROS_LOTE:]
+            except Exception as e:
+                # Lo que no llegó a AFIP vuelve a "pendiente"; la tanda en "emitiendo" se
+                # verifica contra AFIP (quizás ya tiene CAE y no hay que volver a emitirla)
+                print(f"Error consolidando ventas de PV {pv_id} tipo {tipo}: {e}")
+                self.db.rollback()
+                emitidos.extend(self._recuperar(cliente, pv_id, tipo))
+        return emitidos
+
+
+def _proxima_ejecucion(ahora: datetime) -> datetime:
+    hora, minuto = (int(parte) for parte in HORA.split(":"))
+    proxima = ahora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    return proxima if proxima > ahora else proxima + timedelta(days=1)
+
+
+def consolidar_pendientes(punto_venta_id: int = None):
+    db = SessionLocal()
+    try:
+        return len(ConsolidacionService(db).consolidar(punto_venta_id))
+    finally:
+        db.close()
+
+
+def iniciar_programador():
+    """Hebra que consolida las ventas pendientes todos los días a CONSOLIDACION_HORA"""
+    def ciclo():
+        while True:
+            time.sleep(max(0.0, (_proxima_ejecucion(datetime.now()) - datetime.now()).total_seconds()))
+            try:
+                emitidos = consolidar_pendientes()
+                if emitidos:
+                    print(f"Consolidación de ventas: {emitidos} comprobantes resumen emitidos")
+            except Exception as e:
+                print(f"Error en la consolidación de ventas: {e}")
+
+    hilo = threading.Thread(target=ciclo, name="consolidacion", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolidación de ventas a Consumidor Final")
+    parser.add_argument("--punto-venta", type=int, help="ID del punto de venta (por defecto, todos)")
+    args = parser.parse_args()
+    print(f"Comprobantes resumen emitidos: {consolidar_pendientes(args.punto_venta)}")
+
+
+if __name__ == "__main__":
+    main()
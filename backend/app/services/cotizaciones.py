@@ -0,0 +1,45 @@
+import threading
+from datetime import date
+
+# Cotizaciones por (moneda, producción, día). La cotización oficial cambia una vez
+# por día hábil, así que alcanza con una consulta a AFIP por moneda y día.
+_cotizaciones = {}
+# Un lock por clave: si llegan muchas facturas en USD a la vez, solo una consulta
+# AFIP y el resto espera ese resultado.
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def obtener_cotizacion(moneda_id: str, produccion: bool, consultar) -> float:
+    """Devuelve la cotización del día para `moneda_id`.
+
+    `consultar` es un callable sin argumentos que pide la cotización a AFIP
+    (normalmente `lambda: afip.get_exchange_rate(moneda_id)`); solo se invoca
+    si todavía no hay cotización para hoy.
+    """
+    if moneda_id == "PES":
+        return 1.0
+
+    clave = (moneda_id, produccion, date.today())
+    cotizacion = _cotizaciones.get(clave)
+    if cotizacion is not None:
+        return cotizacion
+
+    with _locks_lock:
+        lock = _locks.setdefault(clave, threading.Lock())
+
+    with lock:
+        # Otra hebra pudo haberla obtenido mientras esperábamos
+        cotizacion = _cotizaciones.get(clave)
+        if cotizacion is None:
+            cotizacion = consultar()
+            _cotizaciones[clave] = cotizacion
+            _descartar_vencidas(clave[2])
+    return cotizacion
+
+
+def _descartar_vencidas(hoy: date):
+    with _locks_lock:
+        for clave in [k for k in _cotizaciones if k[2] < hoy]:
+            _cotizaciones.pop(clave, None)
+            _locks.pop(clave, None)
@@ -0,0 +1,181 @@
+"""Worker de envío de comprobantes por email a partir del outbox (email_outbox).
+
+Reclama tandas de pendientes con FOR UPDATE SKIP LOCKED (se pueden correr varios
+workers): las pasa a "enviando" con un lease de EMAIL_LEASE segundos y confirma
+enseguida, así no se tienen locks abiertos mientras se habla con el SMTP. Después
+genera o reutiliza cada PDF, lo envía por una única conexión SMTP persistente y
+confirma cada resultado por separado. Si el worker muere a mitad de tanda, al
+vencer el lease los que quedaron en "enviando" se vuelven a reclamar. Los fallos
+se reintentan con backoff exponencial; al agotar los intentos el registro queda
+como "fallido" (dead letter) para revisión manual.
+
+Uso (desde backend/):
+    python -m app.services.email_outbox
+
+Para probar localmente sin enviar emails reales, levantar un sumidero SMTP
+(por ejemplo `python -m aiosmtpd -n -l localhost:1025` o el servicio mailpit
+de docker-compose) y usar SMTP_HOST=localhost SMTP_PORT=1025.
+"""
+import os
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import Comprobante, EmailOutbox
+from app.services.pdf import render_comprobante_pdf, nombre_comprobante
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USUARIO = os.getenv("SMTP_USUARIO")
+SMTP_CLAVE = os.getenv("SMTP_CLAVE")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "0") == "1"
+SMTP_REMITENTE = os.getenv("SMTP_REMITENTE", "facturacion@localhost")
+
+TAMANO_TANDA = int(os.getenv("EMAIL_TANDA", "50"))
+MAX_INTENTOS = int(os.getenv("EMAIL_MAX_INTENTOS", "8"))
+BACKOFF_BASE = 60 # segundos; se duplica en cada intento
+BACKOFF_MAXIMO = 6 * 3600
+INTERVALO_SONDEO = float(os.getenv("EMAIL_INTERVALO", "5"))
+# Tiempo que un worker tiene reservada una tanda; debe alcanzar para enviarla completa
+LEASE = float(os.getenv("EMAIL_LEASE", "600"))
+
+
+class EmailDeliveryWorker:
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._smtp = None
+
+    def _conexion(self) -> smtplib.SMTP:
+        """Conexión SMTP persistente; se verifica con NOOP y se reabre si se cayó"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._cerrar()
+
+        smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USUARIO:
+            smtp.login(SMTP_USUARIO, SMTP_CLAVE)
+        self._smtp = smtp
+        return smtp
+
+    def _cerrar(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _mensaje(self, envio: EmailOutbox, comprobante: Comprobante) -> EmailMessage:
+        nombre = nombre_comprobante(comprobante)
+        mensaje = EmailMessage()
+        mensaje["From"] = SMTP_REMITENTE
+        mensaje["To"] = envio.destinatario
+        mensaje["Subject"] = nombre
+        mensaje.set_content(
+            f"Estimado/a {comprobante.cliente.nombre}:\n\n"
+            f"Adjuntamos {nombre} por un total de {comprobante.total_comprobante:.2f}.\n"
+            f"CAE: {comprobante.cae}\n"
+        )
+        with open(render_comprobante_pdf(comprobante), "rb") as f:
+            mensaje.add_attachment(f.read(), maintype="application", subtype="pdf", filename=f"{nombre}.pdf")
+        return mensaje
+
+    def _reclamar(self, db: Session) -> list:
+        """Pasa una tanda a "enviando" con lease y confirma. Devuelve [(id, intentos)]:
+        `intentos` identifica este reclamo (si el lease vence y otro worker la toma, cambia)"""
+        ahora = datetime.utcnow()
+        # SKIP LOCKED: otro worker en paralelo toma otras filas en lugar de esperar.
+        # Un "enviando" con el lease vencido es de un worker que murió a mitad de tanda.
+        envios = (
+            db.query(EmailOutbox)
+            .filter(EmailOutbox.estado.in_(("pendiente", "enviando")), EmailOutbox.proximo_intento <= ahora)
+            .order_by(EmailOutbox.id)
+            .limit(TAMANO_TANDA)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        reclamados = []
+        for envio in envios:
+            # El intento se cuenta al reclamar: un email que tira abajo al worker no se reintenta para siempre
+            if envio.estado == "enviando" and envio.intentos >= MAX_INTENTOS:
+                envio.estado = "fallido"
+                envio.ultimo_error = "Lease vencido en el último intento (el worker se detuvo durante el envío)"
+                continue
+            envio.estado = "enviando"
+            envio.intentos += 1
+            envio.proximo_intento = ahora + timedelta(seconds=LEASE)
+            reclamados.append((envio.id, envio.intentos))
+        db.commit()
+        return reclamados
+
+    def _resultado(self, db: Session, envio_id: int, intentos: int, **valores):
+        # Solo si el reclamo sigue siendo nuestro (el lease no venció y nadie más la tomó)
+        db.query(EmailOutbox).filter(
+            EmailOutbox.id == envio_id, EmailOutbox.estado == "enviando", EmailOutbox.intentos == intentos
+        ).update(valores, synchronize_session=False)
+        db.commit()
+
+    def _enviar(self, db: Session, envio_id: int, intentos: int):
+        envio = db.query(EmailOutbox).filter(EmailOutbox.id == envio_id).first()
+        try:
+            comprobante = db.query(Comprobante).filter(
+                Comprobante.id == envio.comprobante_id,
+                Comprobante.fecha_emision == envio.comprobante_fecha
+            ).first()
+            if not comprobante:
+                raise ValueError("Comprobante no encontrado")
+            self._conexion().send_message(self._mensaje(envio, comprobante))
+        except Exception as e:
+            if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                self._cerrar()
+            db.rollback()
+            error = str(e)[:1000]
+            if intentos >= MAX_INTENTOS:
+                print(f"Email de comprobante {envio.comprobante_id} a {envio.destinatario} descartado: {e}")
+                self._resultado(db, envio_id, intentos, estado="fallido", ultimo_error=error)
+            else:
+                espera = min(BACKOFF_BASE * 2 ** (intentos - 1), BACKOFF_MAXIMO)
+                self._resultado(
+                    db, envio_id, intentos, estado="pendiente", ultimo_error=error,
+                    proximo_intento=datetime.utcnow() + timedelta(seconds=espera)
+                )
+            return
+        self._resultado(db, envio_id, intentos, estado="enviado", enviado=datetime.utcnow(), ultimo_error=None)
+
+    def procesar_tanda(self) -> int:
+        """Reclama y envía una tanda de pendientes. Devuelve la cantidad procesada."""
+        db = self.session_factory()
+        try:
+            reclamados = self._reclamar(db)
+            for envio_id, intentos in reclamados:
+                self._enviar(db, envio_id, intentos)
+            return len(reclamados)
+        finally:
+            db.close()
+
+    def run_forever(self, intervalo: float = INTERVALO_SONDEO):
+        try:
+            while True:
+                try:
+                    # Mientras haya trabajo se encadenan tandas; si no, se espera al próximo sondeo
+                    if self.procesar_tanda() < TAMANO_TANDA:
+                        time.sleep(intervalo)
+                except Exception as e:
+                    # Base o SMTP caídos: se reintenta en el próximo sondeo en lugar de terminar el worker
+                    print(f"Error en el worker de emails: {e}")
+                    self._cerrar()
+                    time.sleep(intervalo)
+        finally:
+            self._cerrar()
+
+
+if __name__ == "__main__":
+    EmailDeliveryWorker().run_forever()
@@ -0,0 +1,146 @@
+"""Publicación/suscripción de los estados de emisión de comprobantes.
+
+InvoiceService publica desde el threadpool de FastAPI (o desde procesos sin
+servidor, como la consolidación por línea de comandos) y cada conexión SSE
+consume de su propia asyncio.Queue acotada. Un suscriptor inactivo cuesta una
+cola vacía y una corrutina suspendida, así que un worker soporta miles.
+
+Con EVENTOS_POSTGRES=1 (por defecto) los eventos viajan por LISTEN/NOTIFY de
+Postgres: publicar() hace pg_notify en el canal CANAL y cada worker de la API
+tiene una hebra escuchando (iniciar()) que los reparte entre sus suscriptores,
+así el stream de un navegador ve las emisiones de todos los workers. Si el
+NOTIFY falla el evento se entrega solo a los suscriptores locales. Con
+EVENTOS_POSTGRES=0 el hub es por proceso (un solo worker).
+"""
+import asyncio
+import json
+import os
+import select
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+from app.database import engine
+
+# Eventos pendientes por suscriptor; si un cliente lento se atrasa se descartan los más viejos
+MAX_PENDIENTES = 100
+
+POSTGRES = os.getenv("EVENTOS_POSTGRES", "1") == "1"
+CANAL = "comprobantes_eventos"
+# NOTIFY admite hasta 8000 bytes por mensaje
+MAX_PAYLOAD = 7900
+
+
+class Suscripcion:
+    def __init__(self, loop, filtros: dict):
+        self.loop = loop
+        self.filtros = filtros
+        self.cola = asyncio.Queue(maxsize=MAX_PENDIENTES)
+
+    def acepta(self, evento: dict) -> bool:
+        return all(evento.get(campo) == valor for campo, valor in self.filtros.items())
+
+    def _encolar(self, evento: dict):
+        # Corre en el event loop (vía call_soon_threadsafe)
+        if self.cola.full():
+            self.cola.get_nowait()
+        self.cola.put_nowait(evento)
+
+
+class EventHub:
+    def __init__(self):
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+        self._escucha = None
+        self._detener = threading.Event()
+
+    def suscribir(self, **filtros) -> Suscripcion:
+        """Nueva suscripción (llamar desde el event loop). Los filtros en None se ignoran."""
+        suscripcion = Suscripcion(asyncio.get_running_loop(), {k: v for k, v in filtros.items() if v is not None})
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion: Suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def publicar(self, evento: dict):
+        """Publica un evento. Seguro desde cualquier hebra."""
+        self.publicar_varios([evento])
+
+    def publicar_varios(self, eventos: list):
+        """Publica varios eventos con una sola conexión (tandas de comprobantes)"""
+        for evento in eventos:
+            evento.setdefault("ts", datetime.utcnow().isoformat())
+        if POSTGRES:
+            try:
+                with engine.connect() as conexion:
+                    for evento in eventos:
+                        conexion.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": CANAL, "payload": _payload(evento)})
+                    conexion.commit()
+                return
+            except Exception as e:
+                print(f"No se pudieron publicar {len(eventos)} eventos por NOTIFY: {e}")
+        for evento in eventos:
+            self._entregar(evento)
+
+    def _entregar(self, evento: dict):
+        """Entrega un evento a los suscriptores locales que correspondan"""
+        with self._lock:
+            destinatarios = [s for s in self._suscripciones if s.acepta(evento)]
+        for suscripcion in destinatarios:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._encolar, evento)
+            except RuntimeError:
+                # El loop ya cerró (apagado del servidor)
+                self.desuscribir(suscripcion)
+
+    def iniciar(self):
+        """Hebra que escucha CANAL y reparte los eventos de todos los procesos (solo con POSTGRES)"""
+        if not POSTGRES or self._escucha is not None:
+            return
+        self._detener.clear()
+        self._escucha = threading.Thread(target=self._escuchar, name="eventos", daemon=True)
+        self._escucha.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._escucha is not None:
+            self._escucha.join(timeout=10)
+            self._escucha = None
+
+    def _escuchar(self):
+        while not self._detener.is_set():
+            conexion = None
+            try:
+                conexion = engine.raw_connection()
+                dbapi = conexion.driver_connection
+                dbapi.autocommit = True
+                dbapi.cursor().execute(f"LISTEN {CANAL}")
+                while not self._detener.is_set():
+                    if select.select([dbapi], [], [], 5)[0]:
+                        dbapi.poll()
+                        while dbapi.notifies:
+                            self._entregar(json.loads(dbapi.notifies.pop(0).payload))
+            except Exception as e:
+                # Los eventos publicados mientras no hay escucha se pierden (el estado final queda en la base)
+                print(f"Error escuchando eventos de comprobantes: {e}")
+                time.sleep(5)
+            finally:
+                if conexion is not None:
+                    try:
+                        conexion.invalidate() # No devolverla al pool con el LISTEN activo
+                    except Exception:
+                        pass
+
+
+def _payload(evento: dict) -> str:
+    payload = json.dumps(evento, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        # El detalle (errores de AFIP) es lo único que puede ser largo
+        payload = json.dumps({**evento, "detalle": str(evento.get("detalle"))[:1000]}, default=str)
+    return payload
+
+
+hub = EventHub()
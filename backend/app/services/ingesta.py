@@ -0,0 +1,314 @@
+"""Ingesta masiva de ventas desde terminales POS.
+
+Dos transportes con el mismo formato de registros y de acks:
+
+- POST /api/facturas/ingesta: el cuerpo completo se lee antes de responder
+  (hasta MAX_CUERPO bytes). Los acks vuelven en la respuesta recién después:
+  una vez empezada la respuesta Starlette se queda con los mensajes
+  http.request para detectar la desconexión y el resto del cuerpo se perdería.
+- WebSocket /api/facturas/ingesta/ws?formato=...: full duplex para un POS que
+  manda de a poco sobre una conexión abierta. Cada mensaje es un pedazo del
+  stream; un mensaje vacío marca el fin, se emite lo pendiente y se cierra.
+
+Los registros son compactos, en NDJSON (un objeto por línea, application/x-ndjson)
+o en msgpack con prefijo de longitud (4 bytes big-endian + el mapa msgpack,
+application/x-msgpack):
+
+    {"r": "caja3-000123",          # referencia del POS, se devuelve en el ack
+     "pv": 1, "t": 6,              # punto_venta_id y tipo de comprobante (1, 6, 11)
+     "i": [["Café", 2, 1500.0, 21.0], ...],  # [descripción, cantidad, precio, alícuota]
+     "cl": 15,                     # opcional: cliente_id
+     "d": "20123456789", "td": 80, # opcionales: documento y tipo (sin ellos, Consumidor Final)
+     "n": "Razón social", "c": "Responsable Inscripto", "e": "mail@..."}
+
+Los datos de cliente (d, td, n, c, e) solo se usan para dar de alta un
+documento desconocido: un cliente existente nunca se modifica desde la ingesta.
+
+Cada registro se valida a mano mientras se lee (sin pasar por pydantic) y se
+acumula por (PV, tipo); al juntar TAMANO_TANDA, cuando su primera venta lleva
+ESPERA_MAXIMA segundos esperando (en el WebSocket, así un POS lento no demora
+sus acks) y al terminar el stream, el grupo se emite con
+InvoiceService.emitir_ventas. Con la consolidación activa
+(services/consolidacion) las ventas anónimas chicas se guardan para el resumen
+diario en lugar de emitirse. Por cada registro se devuelve un ack (una línea
+NDJSON, o un mensaje de texto en el WebSocket), en el orden en que se emite:
+
+    {"r": "caja3-000123", "ok": true, "id": 812, "numero": 4711, "cae": "..."}
+    {"r": "caja3-000124", "ok": true, "venta_id": 90, "estado": "pendiente"}
+    {"r": "caja3-000125", "ok": false, "error": "..."}
+"""
+import asyncio
+import json
+import os
+import time
+from starlette.concurrency import run_in_threadpool
+from app.schemas import ComprobanteCreate, ComprobanteDetalleBase, ClienteDetalleCreate
+from app.services import consolidacion
+from app.services.consolidacion import ConsolidacionService
+from app.services.invoice_generator import InvoiceService
+from app.services.rate_limit import RateLimitExceeded
+
+FORMATO_NDJSON = "application/x-ndjson"
+FORMATO_MSGPACK = "application/x-msgpack"
+
+TAMANO_TANDA = int(os.getenv("INGESTA_TANDA", "100"))
+ESPERA_MAXIMA = float(os.getenv("INGESTA_ESPERA_MAXIMA", "2")) # segundos que una venta espera a completar su tanda
+MAX_REGISTRO = 64 * 1024 # bytes; un ticket de POS no debería acercarse
+MAX_CUERPO = int(os.getenv("INGESTA_MAX_CUERPO", str(64 * 1024 * 1024))) # bytes por POST
+
+# La ingesta solo emite facturas: las NC/ND necesitan comprobante asociado
+TIPOS_ADMITIDOS = {1, 6, 11}
+
+
+def formato(content_type: str) -> str:
+    tipo = (content_type or "").split(";")[0].strip().lower()
+    if tipo in (FORMATO_NDJSON, "application/jsonl"):
+        return FORMATO_NDJSON
+    if tipo in (FORMATO_MSGPACK, "application/msgpack"):
+        return FORMATO_MSGPACK
+    raise ValueError(f"Formato no soportado: {content_type!r} (usar {FORMATO_NDJSON} o {FORMATO_MSGPACK})")
+
+
+async def leer_cuerpo(stream, maximo: int = MAX_CUERPO) -> list:
+    """Lee el cuerpo completo de un POST (antes de empezar la respuesta). Lanza ValueError si supera `maximo`."""
+    chunks = []
+    total = 0
+    async for chunk in stream:
+        total += len(chunk)
+        if total > maximo:
+            raise ValueError(f"El cuerpo supera {maximo} bytes: partir la ingesta en varios POST o usar el WebSocket")
+        chunks.append(chunk)
+    return chunks
+
+
+async def iterar(chunks):
+    """Un cuerpo ya leído como el stream asíncrono que espera procesar()"""
+    for chunk in chunks:
+        yield chunk
+
+
+async def _leer_ndjson(chunks):
+    pendiente = b""
+    async for chunk in chunks:
+        pendiente += chunk
+        lineas = pendiente.split(b"\n")
+        pendiente = lineas.pop()
+        if len(pendiente) > MAX_REGISTRO:
+            raise ValueError("Registro demasiado grande")
+        for linea in lineas:
+            if linea.strip():
+                yield linea
+    if pendiente.strip():
+        yield pendiente
+
+
+async def _leer_msgpack(chunks):
+    pendiente = bytearray()
+    async for chunk in chunks:
+        pendiente += chunk
+        inicio = 0
+        while len(pendiente) - inicio >= 4:
+            longitud = int.from_bytes(pendiente[inicio:inicio + 4], "big")
+            if longitud > MAX_REGISTRO:
+                raise ValueError("Registro demasiado grande")
+            if len(pendiente) - inicio - 4 < longitud:
+                break
+            yield bytes(pendiente[inicio + 4:inicio + 4 + longitud])
+            inicio += 4 + longitud
+        del pendiente[:inicio]
+    if pendiente:
+        raise ValueError("Stream msgpack truncado")
+
+
+def _decodificar(crudo: bytes, formato_stream: str) -> dict:
+    try:
+        if formato_stream == FORMATO_MSGPACK:
+            import msgpack
+            registro = msgpack.unpackb(crudo, raw=False)
+        else:
+            registro = json.loads(crudo)
+    except Exception as e:
+        raise ValueError(f"Registro ilegible: {e}")
+    if not isinstance(registro, dict):
+        raise ValueError("El registro debe ser un objeto")
+    return registro
+
+
+def _entero(registro: dict, campo: str) -> int:
+    valor = registro.get(campo)
+    if not isinstance(valor, int) or isinstance(valor, bool):
+        raise ValueError(f"'{campo}' debe ser un entero")
+    return valor
+
+
+def _numero(valor, campo: str) -> float:
+    if not isinstance(valor, (int, float)) or isinstance(valor, bool):
+        raise ValueError(f"'{campo}' debe ser numérico")
+    return float(valor)
+
+
+def validar(registro: dict) -> ComprobanteCreate:
+    """Convierte un registro compacto en ComprobanteCreate. Lanza ValueError si es inválido."""
+    punto_venta_id = _entero(registro, "pv")
+    tipo_comprobante = _entero(registro, "t")
+    if tipo_comprobante not in TIPOS_ADMITIDOS:
+        raise ValueError(f"Tipo de comprobante {tipo_comprobante} no admitido en la ingesta")
+
+    lineas = registro.get("i")
+    if not isinstance(lineas, list) or not lineas:
+        raise ValueError("'i' debe ser una lista no vacía de items")
+    items = []
+    for linea in lineas:
+        if not isinstance(linea, list) or len(linea) not in (3, 4) or not isinstance(linea[0], str):
+            raise ValueError("Cada item debe ser [descripción, cantidad, precio, alícuota?]")
+        cantidad = _numero(linea[1], "cantidad")
+        precio = _numero(linea[2], "precio")
+        alicuota = _numero(linea[3], "alícuota") if len(linea) == 4 else 21.0
+        if cantidad <= 0 or precio < 0:
+            raise ValueError("Cantidad y precio deben ser positivos")
+        # construct(): los datos ya están validados, no se paga pydantic por item
+        items.append(ComprobanteDetalleBase.construct(
+            descripcion=linea[0], cantidad=cantidad, precio_unitario=precio,
+            alicuota_iva=alicuota, subtotal=round(cantidad * precio, 2)
+        ))
+
+    cliente_id = registro.get("cl")
+    if cliente_id is not None and (not isinstance(cliente_id, int) or isinstance(cliente_id, bool)):
+        raise ValueError("'cl' debe ser un entero")
+    cliente_detalle = None
+    if cliente_id is None:
+        if registro.get("d"):
+            cliente_detalle = ClienteDetalleCreate.construct(
+                nombre=str(registro["n"]) if registro.get("n") else None, # Sin nombre se toma del padrón
+                numero_documento=str(registro["d"]),
+                tipo_documento=registro.get("td") if isinstance(registro.get("td"), int) else 96,
+                condicion_iva=registro.get("c"),
+                direccion=None,
+                email=registro.get("e")
+            )
+        else:
+            cliente_detalle = consolidacion.cliente_consumidor_final()
+
+    return ComprobanteCreate.construct(
+        cliente_id=cliente_id,
+        cliente_detalle=cliente_detalle,
+        punto_venta_id=punto_venta_id,
+        tipo_comprobante=tipo_comprobante,
+        items=items,
+        total_neto=None,
+        total_iva=None,
+        total_comprobante=None, # Los calcula InvoiceService.emitir_ventas
+        moneda_id="PES",
+        comprobante_asociado=None,
+        solicitud_id=None
+    )
+
+
+def _ack(referencia, resultado) -> dict:
+    if isinstance(resultado, Exception):
+        ack = {"r": referencia, "ok": False, "error": str(resultado)}
+        if isinstance(resultado, RateLimitExceeded):
+            ack["retry_after"] = resultado.retry_after
+        return ack
+    ack = {"r": referencia, "ok": bool(resultado.cae), "id": resultado.id, "numero": resultado.numero, "cae": resultado.cae}
+    if not resultado.cae:
+        ack["error"] = resultado.observaciones_afip
+    return ack
+
+
+def _emitir_grupo(service: InvoiceService, clave, grupo):
+    """Emite (o guarda para consolidar) un grupo de ventas y arma sus acks.
+
+    Corre en el threadpool: leer los comprobantes después del commit consulta la base.
+    """
+    acks = [None] * len(grupo)
+    consolidables = [i for i, (_, venta) in enumerate(grupo) if consolidacion.es_consolidable(venta)]
+    if consolidables:
+        try:
+            registros = ConsolidacionService(service.db).encolar(
+                [grupo[i][1] for i in consolidables], [grupo[i][0] for i in consolidables]
+            )
+            for i, registro in zip(consolidables, registros):
+                acks[i] = {"r": grupo[i][0], "ok": True, "venta_id": registro.id, "estado": "pendiente"}
+        except Exception as e:
+            print(f"Error guardando ventas consolidables de PV {clave[0]}: {e}")
+            service.db.rollback()
+            for i in consolidables:
+                acks[i] = _ack(grupo[i][0], e)
+
+    resto = [i for i, ack in enumerate(acks) if ack is None]
+    if resto:
+        try:
+            resultados = service.emitir_ventas(clave[0], clave[1], [grupo[i][1] for i in resto])
+        except Exception as e:
+            print(f"Error emitiendo tanda de ingesta PV {clave[0]} tipo {clave[1]}: {e}")
+            service.db.rollback()
+            resultados = [e] * len(resto)
+        for i, resultado in zip(resto, resultados):
+            acks[i] = _ack(grupo[i][0], resultado)
+    return acks
+
+
+async def _emitir(service: InvoiceService, clave, grupo):
+    return await run_in_threadpool(_emitir_grupo, service, clave, grupo)
+
+
+async def procesar(chunks, formato_stream: str, service: InvoiceService):
+    """Lee, valida y emite el stream de ventas; genera un ack (dict) por registro."""
+    leer = _leer_msgpack if formato_stream == FORMATO_MSGPACK else _leer_ndjson
+    registros = leer(chunks).__aiter__()
+    grupos = {} # (PV, tipo) -> (momento de la primera venta, [(referencia, venta)])
+    posicion = 0
+    siguiente = None
+    try:
+        while True:
+            vencidos = [clave for clave, (inicio, _) in grupos.items() if time.monotonic() - inicio >= ESPERA_MAXIMA]
+            for clave in vencidos:
+                _, grupo = grupos.pop(clave)
+                for ack in await _emitir(service, clave, grupo):
+                    yield ack
+
+            if siguiente is None:
+                siguiente = asyncio.ensure_future(registros.__anext__())
+            # Se espera el próximo registro sin cancelarlo: al vencer el plazo se emite y se sigue esperando
+            espera = None
+            if grupos:
+                espera = max(0.0, min(inicio for inicio, _ in grupos.values()) + ESPERA_MAXIMA - time.monotonic())
+            await asyncio.wait({siguiente}, timeout=espera)
+            if not siguiente.done():
+                continue
+            terminado, siguiente = siguiente, None
+            try:
+                crudo = terminado.result()
+            except StopAsyncIteration:
+                break
+
+            posicion += 1
+            referencia = posicion
+            try:
+                registro = _decodificar(crudo, formato_stream)
+                referencia = registro.get("r", posicion)
+                venta = validar(registro)
+            except ValueError as e:
+                # Un registro inválido no frena al resto del stream
+                yield {"r": referencia, "ok": False, "error": str(e)}
+                continue
+
+            clave = (venta.punto_venta_id, venta.tipo_comprobante)
+            _, grupo = grupos.setdefault(clave, (time.monotonic(), []))
+            grupo.append((referencia, venta))
+            if len(grupo) >= TAMANO_TANDA:
+                del grupos[clave]
+                for ack in await _emitir(service, clave, grupo):
+                    yield ack
+    except ValueError as e:
+        # Stream corrupto: se emite lo ya validado y se informa dónde se cortó
+        yield {"r": None, "ok": False, "error": f"{e} (después del registro {posicion})"}
+    finally:
+        # Cliente desconectado mientras se esperaba un registro
+        if siguiente is not None and not siguiente.done():
+            siguiente.cancel()
+
+    for clave, (_, grupo) in grupos.items():
+        for ack in await _emitir(service, clave, grupo):
+            yield ack
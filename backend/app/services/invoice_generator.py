@@ -1,100 +1,394 @@
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
-from app.models import Comprobante, ComprobanteDetalle, PuntoVenta, Cliente
-from app.schemas import ComprobanteCreate
-from app.services.afip import AfipService
+from app.models import Comprobante, ComprobanteDetalle, PuntoVenta, Cliente, EmailOutbox
+from app.schemas import ComprobanteCreate, NotaCreditoLote
+from app.services.afip import AfipService, MAX_REGISTROS_LOTE, TIPOS_COMPROBANTE_C, afip_service_para
+from app.services.cotizaciones import obtener_cotizacion
+from app.services.padron import PadronService, PadronNoDisponible
+from app.services.rate_limit import RateLimitExceeded
+from app.services.eventos import hub
+from app.crud import comprobantes as crud_comprobantes
 from datetime import datetime
+from typing import List
 import os
+import uuid
+
+# Notas de Débito (2, 7, 12) y de Crédito (3, 8, 13): requieren comprobante asociado
+TIPOS_NOTA_DEBITO = {2, 7, 12}
+TIPOS_NOTA_CREDITO = {3, 8, 13}
+
+# Tipo de Nota de Crédito que corresponde a cada Factura (A, B, C)
+NOTA_CREDITO_POR_FACTURA = {1: 3, 6: 8, 11: 13}
 
 class InvoiceService:
     def __init__(self, db: Session):
         self.db = db
 
-    def create_invoice(self, data: ComprobanteCreate):
-        # 1. Validar Punto de Venta y Configuración AFIP
-        pv = self.db.query(PuntoVenta).filter(PuntoVenta.id == data.punto_venta_id).first()
+    def _get_punto_venta(self, punto_venta_id: int) -> PuntoVenta:
+        pv = self.db.query(PuntoVenta).filter(PuntoVenta.id == punto_venta_id).first()
         if not pv:
             raise ValueError("Punto de venta no encontrado")
-        
+
         if not os.path.exists(pv.certificado_path) or not os.path.exists(pv.key_path):
             raise ValueError("Certificados de AFIP no configurados para este punto de venta")
+        return pv
+
+    def _conectar_afip(self, pv: PuntoVenta) -> AfipService:
+        afip = afip_service_para(pv)
+        if not afip.authenticate():
+            raise ValueError("Error de autenticación con AFIP")
+        return afip
+
+    def _resolver_cliente(self, data: ComprobanteCreate) -> Cliente:
+        cliente = None
+        if data.cliente_id:
+            cliente = self.db.query(Cliente).filter(Cliente.id == data.cliente_id).first()
+
+        if not cliente and data.cliente_detalle:
+            self._completar_desde_padron(data.cliente_detalle)
+
+            # Buscar por CUIT
+            cliente = self.db.query(Cliente).filter(Cliente.numero_documento == data.cliente_detalle.numero_documento).first()
+            if not cliente:
+                # Crear nuevo cliente
+                cliente = Cliente(
+                    nombre=data.cliente_detalle.nombre,
+                    numero_documento=data.cliente_detalle.numero_documento,
+                    tipo_documento=data.cliente_detalle.tipo_documento,
+                    direccion=data.cliente_detalle.direccion,
+                    condicion_iva=data.cliente_detalle.condicion_iva,
+                    email=data.cliente_detalle.email
+                )
+                self.db.add(cliente)
+                self.db.commit()
+                self.db.refresh(cliente)
+            else:
+                # Actualizar datos existentes (opcional, pero útil)
+                cliente.nombre = data.cliente_detalle.nombre
+                cliente.direccion = data.cliente_detalle.direccion
+                cliente.condicion_iva = data.cliente_detalle.condicion_iva
+                self.db.commit()
+                self.db.refresh(cliente)
+
+        if not cliente:
+             raise ValueError("Cliente no encontrado y no se proporcionaron datos para crearlo")
+        return cliente
 
-        # Determinar directorio de caché (backend/cache)
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        CACHE_DIR = os.path.join(BASE_DIR, "cache")
-
-        # 2. Inicializar Servicio AFIP
-        afip = AfipService(
-            cuit=pv.cuit,
-            certificado=pv.certificado_path,
-            clave_privada=pv.key_path,
-            produccion=pv.es_produccion,
-            cache_dir=CACHE_DIR
+    def _cliente_para_venta(self, venta: ComprobanteCreate) -> Cliente:
+        """Cliente de una venta de POS: se busca por documento y, si no existe, se crea con lo mínimo.
+
+        A diferencia de _resolver_cliente nunca modifica un cliente existente: el POS
+        manda datos parciales (sin dirección ni condición IVA) que no pueden pisar el maestro.
+        """
+        if venta.cliente_id:
+            cliente = self.db.query(Cliente).filter(Cliente.id == venta.cliente_id).first()
+            if not cliente:
+                raise ValueError(f"Cliente {venta.cliente_id} no encontrado")
+            return cliente
+
+        detalle = venta.cliente_detalle
+        cliente = self.db.query(Cliente).filter(Cliente.numero_documento == detalle.numero_documento).first()
+        if cliente:
+            return cliente
+
+        self._completar_desde_padron(detalle)
+        cliente = Cliente(
+            nombre=detalle.nombre or detalle.numero_documento,
+            numero_documento=detalle.numero_documento,
+            tipo_documento=detalle.tipo_documento,
+            direccion=detalle.direccion,
+            condicion_iva=detalle.condicion_iva,
+            email=detalle.email
         )
+        self.db.add(cliente)
+        self.db.flush() # Se confirma junto con la tanda de comprobantes
+        return cliente
+
+    def _completar_desde_padron(self, detalle):
+        """Completa la condición IVA (y datos faltantes) de un CUIT desde el padrón de AFIP.
 
+        Una condición IVA errónea hace que AFIP rechace la factura; con la caché
+        del padrón esto no agrega una consulta a AFIP en cada factura.
+        """
+        if detalle.tipo_documento != 80 or detalle.condicion_iva:
+            return
         try:
-            # 3. Autenticación AFIP
-            if not afip.authenticate():
-                raise ValueError("Error de autenticación con AFIP")
+            contribuyente = PadronService(self.db).lookup(detalle.numero_documento)
+        except (PadronNoDisponible, RateLimitExceeded, ValueError) as e:
+            # El padrón es una ayuda: si no responde se factura con lo que cargó el operador
+            print(f"No se pudo consultar el padrón para {detalle.numero_documento}: {e}")
+            return
+        if contribuyente:
+            detalle.condicion_iva = contribuyente.condicion_iva
+            detalle.nombre = detalle.nombre or contribuyente.nombre
+            detalle.direccion = detalle.direccion or contribuyente.direccion
+
+    def _resolver_asociado(self, pv: PuntoVenta, tipo_comprobante: int, asociado) -> Comprobante:
+        """Busca el comprobante original de una NC/ND (índice pv + tipo + número)"""
+        if asociado is None:
+            if tipo_comprobante in TIPOS_NOTA_CREDITO | TIPOS_NOTA_DEBITO:
+                raise ValueError("Las Notas de Crédito/Débito requieren un comprobante asociado")
+            return None
+
+        asoc_pv_id = asociado.punto_venta_id or pv.id
+        original = crud_comprobantes.get_comprobante_por_numero(
+            self.db, asoc_pv_id, asociado.tipo_comprobante, asociado.numero
+        )
+        if not original or not original.cae:
+            raise ValueError(
+                f"Comprobante asociado {asociado.tipo_comprobante}-{asociado.numero} no encontrado o sin CAE"
+            )
+        return original
+
+    def _saldo_asociado(self, original: Comprobante) -> float:
+        """Total del original más sus Notas de Débito y menos sus Notas de Crédito autorizadas.
+
+        Bloquea la fila del original hasta el commit para que dos NC concurrentes
+        contra la misma factura no pasen las dos la validación.
+        """
+        self.db.query(Comprobante.id).filter(
+            Comprobante.id == original.id, Comprobante.fecha_emision == original.fecha_emision
+        ).with_for_update().first()
+        signo = case((Comprobante.tipo_comprobante.in_(TIPOS_NOTA_CREDITO), -1.0), else_=1.0)
+        ajustes = self.db.query(func.coalesce(func.sum(signo * Comprobante.total_comprobante), 0.0)).filter(
+            Comprobante.asoc_punto_venta_id == original.punto_venta_id,
+            Comprobante.asoc_tipo_comprobante == original.tipo_comprobante,
+            Comprobante.asoc_numero == original.numero,
+            Comprobante.cae.isnot(None)
+        ).scalar()
+        return round(original.total_comprobante + ajustes, 2)
+
+    def _validar_nota_credito(self, original: Comprobante, total: float, saldo: float = None) -> float:
+        """Una NC no puede superar el saldo del original; devuelve el saldo que queda después de ella"""
+        if saldo is None:
+            saldo = self._saldo_asociado(original)
+        if total > saldo + 0.01:
+            raise ValueError(
+                f"La Nota de Crédito ({total:.2f}) supera el saldo del comprobante "
+                f"{original.tipo_comprobante}-{original.numero} ({saldo:.2f})"
+            )
+        return saldo - total
+
+    def _cbtes_asoc(self, pv: PuntoVenta, original: Comprobante):
+        if original is None:
+            return None
+        return [{
+            "tipo": original.tipo_comprobante,
+            "pto_vta": original.punto_venta.numero,
+            "nro": original.numero,
+            "cuit": pv.cuit,
+            "fecha": original.fecha_emision.strftime("%Y%m%d"),
+        }]
+
+    def _items_afip(self, items):
+        # Preparar items para AFIP (y calcular totales precisos)
+        items_afip = []
+        for item in items:
+            # Calcular base imponible e IVA para cada item
+            # Asumimos que item.subtotal es Precio Final (con IVA)
+            alicuota = item.alicuota_iva or 21.0
+            divisor = 1 + (alicuota / 100.0)
+
+            neto = item.subtotal / divisor
+            iva = item.subtotal - neto
+
+            items_afip.append({
+                'base_imponible': neto,
+                'importe_iva': iva,
+                'alicuota_iva': alicuota
+            })
+        return items_afip
+
+    def _con_totales(self, data, items, tipo_comprobante: int):
+        # Totales calculados a partir de los items (precios finales, con IVA), con el mismo
+        # criterio que AfipService._cargar_factura para que la base coincida con lo enviado
+        total = round(sum(item.subtotal for item in items), 2)
+        if tipo_comprobante in TIPOS_COMPROBANTE_C:
+            # Los comprobantes C no discriminan IVA: ImpNeto = total, ImpIVA = 0
+            neto, iva = total, 0.0
+        else:
+            items_afip = self._items_afip(items)
+            neto = round(sum(i['base_imponible'] for i in items_afip), 2)
+            iva = round(sum(i['importe_iva'] for i in items_afip), 2)
+        return data.copy(update={"total_neto": neto, "total_iva": iva, "total_comprobante": total})
+
+    def _nuevo_comprobante(self, pv, cliente, tipo_comprobante, numero, fecha, data, afip_result, original=None, moneda_id="PES", moneda_ctz=1.0):
+        # Un rechazado no consume el número en AFIP (lo usará el próximo autorizado): se guarda
+        # sin número y el solicitado queda en las observaciones
+        observaciones = afip_result.get("observaciones")
+        if not afip_result.get("cae"):
+            observaciones = f"Número solicitado: {numero}\nErrores: {afip_result.get('errores', '')}\nObservaciones: {afip_result.get('observaciones', '')}"
+            numero = None
+        return Comprobante(
+            fecha_emision=fecha,
+            tipo_comprobante=tipo_comprobante,
+            punto_venta_id=pv.id,
+            numero=numero,
+            cliente_id=cliente.id,
+            total_neto=data.total_neto,
+            total_iva=data.total_iva,
+            total_comprobante=data.total_comprobante,
+            moneda_id=moneda_id,
+            moneda_cotizacion=moneda_ctz,
+            cae=afip_result.get("cae"),
+            vto_cae=datetime.strptime(afip_result.get("vencimiento"), "%Y%m%d").date() if afip_result.get("vencimiento") else None,
+            resultado_afip=afip_result.get("resultado"),
+            observaciones_afip=observaciones,
+            asoc_punto_venta_id=original.punto_venta_id if original else None,
+            asoc_tipo_comprobante=original.tipo_comprobante if original else None,
+            asoc_numero=original.numero if original else None
+        )
+
+    def _agregar_detalles(self, comprobante: Comprobante, items):
+        for item in items:
+            detalle = ComprobanteDetalle(
+                comprobante_id=comprobante.id,
+                fecha_emision=comprobante.fecha_emision, # Misma partición que el comprobante
+                producto_id=item.producto_id,
+                descripcion=item.descripcion,
+                cantidad=item.cantidad,
+                precio_unitario=item.precio_unitario,
+                alicuota_iva=item.alicuota_iva,
+                subtotal=item.subtotal
+            )
+            self.db.add(detalle)
+
+    def _encolar_email(self, comprobante: Comprobante, cliente: Cliente):
+        # Outbox transaccional: el envío lo hace services/email_outbox.py fuera del request
+        if comprobante.cae and cliente.email:
+            self.db.add(EmailOutbox(
+                comprobante_id=comprobante.id,
+                comprobante_fecha=comprobante.fecha_emision,
+                destinatario=cliente.email
+            ))
+
+    def _evento(self, data, estado: str, tipo_comprobante: int = None, **extra):
+        # Estados de emisión para el stream SSE (GET /api/facturas/eventos). Las NC del
+        # lote no traen tipo ni solicitud_id: el tipo lo decide create_credit_notes
+        return {
+            "solicitud_id": getattr(data, "solicitud_id", None),
+            "estado": estado,
+            "punto_venta_id": data.punto_venta_id,
+            "tipo_comprobante": tipo_comprobante or data.tipo_comprobante,
+            **extra
+        }
+
+    def _notificar(self, data, estado: str, **extra):
+        hub.publicar(self._evento(data, estado, **extra))
+
+    def _emitir_tanda(self, afip: AfipService, pv: PuntoVenta, tipo_comprobante: int, tanda, antes_de_confirmar=None,
+                      fechas=None, antes_de_solicitar=None):
+        """Numera, autoriza (un FECAESolicitar) y persiste una tanda de comprobantes.
+
+        Cada entrada es (data, cliente, items, original, moneda_id, moneda_ctz); todas
+        comparten punto de venta y tipo. Devuelve los comprobantes en el mismo orden.
+        `antes_de_confirmar(nuevos)` permite agregar cambios a la misma transacción.
+        `fechas` (una por entrada, no decrecientes) reemplaza la fecha actual.
+        `antes_de_solicitar(facturas)` corre con los números ya asignados, antes de pedir el CAE.
+        """
+        # Se consulta por cada tanda: otra emisión concurrente pudo avanzar la numeración
+        ultimo_cbte = int(afip.get_last_invoice_number(pv.numero, tipo_comprobante))
+        fechas = fechas or [datetime.now()] * len(tanda)
+
+        facturas = []
+        for offset, (data, cliente, items, original, moneda_id, moneda_ctz) in enumerate(tanda):
+            facturas.append(dict(
+                punto_venta=pv.numero,
+                tipo_comprobante=tipo_comprobante,
+                numero=ultimo_cbte + 1 + offset,
+                fecha=fechas[offset],
+                total=data.total_comprobante,
+                dni_cuit=int(cliente.numero_documento) if cliente.numero_documento.isdigit() else 0,
+                tipo_doc=cliente.tipo_documento,
+                lineas_items=self._items_afip(items),
+                condicion_iva=cliente.condicion_iva,
+                cbtes_asoc=self._cbtes_asoc(pv, original),
+                moneda_id=moneda_id,
+                moneda_ctz=moneda_ctz
+            ))
+
+        if antes_de_solicitar is not None:
+            antes_de_solicitar(facturas)
+        hub.publicar_varios([
+            self._evento(data, "cae_solicitado", tipo_comprobante, numero=factura["numero"])
+            for factura, (data, _, _, _, _, _) in zip(facturas, tanda)
+        ])
+        resultados = afip.create_invoices_batch(facturas)
+        return self._persistir_tanda(pv, tipo_comprobante, facturas, tanda, resultados, antes_de_confirmar)
+
+    def _persistir_tanda(self, pv: PuntoVenta, tipo_comprobante: int, facturas, tanda, resultados, antes_de_confirmar=None):
+        """Persiste en una sola transacción una tanda ya resuelta por AFIP (ver _emitir_tanda)"""
+        nuevos = []
+        for factura, (data, cliente, items, original, _, _), afip_result in zip(facturas, tanda, resultados):
+            nuevo = self._nuevo_comprobante(
+                pv, cliente, tipo_comprobante, factura["numero"], factura["fecha"], data, afip_result, original,
+                moneda_id=factura["moneda_id"], moneda_ctz=factura["moneda_ctz"]
+            )
+            self.db.add(nuevo)
+            nuevos.append(nuevo)
+        self.db.flush()
+        for nuevo, (data, cliente, items, _, _, _) in zip(nuevos, tanda):
+            self._agregar_detalles(nuevo, items)
+            self._encolar_email(nuevo, cliente)
+        if antes_de_confirmar is not None:
+            antes_de_confirmar(nuevos)
+        self.db.commit()
+
+        eventos = []
+        for nuevo, (data, _, _, _, _, _) in zip(nuevos, tanda):
+            eventos.append(self._evento(
+                data, "aprobado" if nuevo.cae else "rechazado", tipo_comprobante,
+                numero=nuevo.numero, cae=nuevo.cae, detalle=None if nuevo.cae else nuevo.observaciones_afip
+            ))
+            eventos.append(self._evento(data, "persistido", tipo_comprobante, numero=nuevo.numero, comprobante_id=nuevo.id))
+        hub.publicar_varios(eventos)
+        return nuevos
+
+    def create_invoice(self, data: ComprobanteCreate):
+        if not data.solicitud_id:
+            data.solicitud_id = str(uuid.uuid4())
+        self._notificar(data, "encolado")
+
+        try:
+            # 1. Validar Punto de Venta y Configuración AFIP
+            pv = self._get_punto_venta(data.punto_venta_id)
+
+            # 2. Inicializar Servicio AFIP y autenticar
+            afip = self._conectar_afip(pv)
+
+            # 3. Comprobante asociado (solo NC/ND)
+            original = self._resolver_asociado(pv, data.tipo_comprobante, data.comprobante_asociado)
+            if data.tipo_comprobante in TIPOS_NOTA_CREDITO:
+                self._validar_nota_credito(original, data.total_comprobante)
 
             # 4. Obtener último número de comprobante
             ultimo_cbte = afip.get_last_invoice_number(pv.numero, data.tipo_comprobante)
             nuevo_numero = int(ultimo_cbte) + 1
+            self._notificar(data, "numerado", numero=nuevo_numero)
 
-            # 5. Obtener o Crear Cliente
-            cliente = None
-            if data.cliente_id:
-                cliente = self.db.query(Cliente).filter(Cliente.id == data.cliente_id).first()
-            
-            if not cliente and data.cliente_detalle:
-                # Buscar por CUIT
-                cliente = self.db.query(Cliente).filter(Cliente.numero_documento == data.cliente_detalle.numero_documento).first()
-                if not cliente:
-                    # Crear nuevo cliente
-                    cliente = Cliente(
-                        nombre=data.cliente_detalle.nombre,
-                        numero_documento=data.cliente_detalle.numero_documento,
-                        tipo_documento=data.cliente_detalle.tipo_documento,
-                        direccion=data.cliente_detalle.direccion,
-                        condicion_iva=data.cliente_detalle.condicion_iva,
-                        email=data.cliente_detalle.email
-                    )
-                    self.db.add(cliente)
-                    self.db.commit()
-                    self.db.refresh(cliente)
-                else:
-                    # Actualizar datos existentes (opcional, pero útil)
-                    cliente.nombre = data.cliente_detalle.nombre
-                    cliente.direccion = data.cliente_detalle.direccion
-                    cliente.condicion_iva = data.cliente_detalle.condicion_iva
-                    self.db.commit()
-                    self.db.refresh(cliente)
+            # 5. Obtener o Crear Cliente (en NC/ND, el del comprobante original)
+            if original is not None and not data.cliente_id and not data.cliente_detalle:
+                cliente = original.cliente
+            else:
+                cliente = self._resolver_cliente(data)
 
-            if not cliente:
-                 raise ValueError("Cliente no encontrado y no se proporcionaron datos para crearlo")
-            
-            # 6. Enviar a AFIP
+            # 6. Cotización (una consulta a AFIP por moneda y día, ver services/cotizaciones).
+            # Una NC/ND va en la moneda y cotización del original, igual que en create_credit_notes
+            if original is not None:
+                moneda_id, moneda_ctz = original.moneda_id or "PES", original.moneda_cotizacion or 1.0
+            else:
+                moneda_id = data.moneda_id
+                moneda_ctz = obtener_cotizacion(
+                    moneda_id, pv.es_produccion, lambda: afip.get_exchange_rate(moneda_id)
+                )
+
+            # 7. Enviar a AFIP
             # TODO: Mapear tipo_doc de cliente a código AFIP (80=CUIT, 96=DNI, etc.)
-            tipo_doc_afip = cliente.tipo_documento 
-            
+            tipo_doc_afip = cliente.tipo_documento
+
             fecha_actual = datetime.now()
-            
-            # Preparar items para AFIP (y calcular totales precisos)
-            items_afip = []
-            for item in data.items:
-                # Calcular base imponible e IVA para cada item
-                # Asumimos que item.subtotal es Precio Final (con IVA)
-                alicuota = item.alicuota_iva or 21.0
-                divisor = 1 + (alicuota / 100.0)
-                
-                neto = item.subtotal / divisor
-                iva = item.subtotal - neto
-                
-                items_afip.append({
-                    'base_imponible': neto,
-                    'importe_iva': iva,
-                    'alicuota_iva': alicuota
-                })
 
+            self._notificar(data, "cae_solicitado", numero=nuevo_numero)
             afip_result = afip.create_invoice(
                 punto_venta=pv.numero,
                 tipo_comprobante=data.tipo_comprobante,
@@ -103,48 +397,131 @@ class InvoiceService:
                 total=data.total_comprobante,
                 dni_cuit=int(cliente.numero_documento) if cliente.numero_documento.isdigit() else 0,
                 tipo_doc=tipo_doc_afip,
-                lineas_items=items_afip,
-                condicion_iva=cliente.condicion_iva
+                lineas_items=self._items_afip(data.items),
+                condicion_iva=cliente.condicion_iva,
+                cbtes_asoc=self._cbtes_asoc(pv, original),
+                moneda_id=moneda_id,
+                moneda_ctz=moneda_ctz
             )
 
-            # 7. Guardar en Base de Datos
-            nuevo_comprobante = Comprobante(
-                fecha_emision=datetime.now(),
-                tipo_comprobante=data.tipo_comprobante,
-                punto_venta_id=pv.id,
-                numero=nuevo_numero,
-                cliente_id=cliente.id,
-                total_neto=data.total_neto,
-                total_iva=data.total_iva,
-                total_comprobante=data.total_comprobante,
-                cae=afip_result.get("cae"),
-                vto_cae=datetime.strptime(afip_result.get("vencimiento"), "%Y%m%d").date() if afip_result.get("vencimiento") else None,
-                resultado_afip=afip_result.get("resultado"),
-                observaciones_afip=f"Errores: {afip_result.get('errores', '')}\nObservaciones: {afip_result.get('observaciones', '')}".strip() if afip_result.get("resultado") == "Rechazado" else afip_result.get("observaciones")
+            self._notificar(
+                data, "aprobado" if afip_result.get("cae") else "rechazado",
+                numero=nuevo_numero, cae=afip_result.get("cae"), detalle=afip_result.get("errores")
+            )
+
+            # 8. Guardar en Base de Datos
+            nuevo_comprobante = self._nuevo_comprobante(
+                pv, cliente, data.tipo_comprobante, nuevo_numero, datetime.now(), data, afip_result, original,
+                moneda_id=moneda_id, moneda_ctz=moneda_ctz
             )
-            
+
             self.db.add(nuevo_comprobante)
+            self.db.flush()
+
+            # 9. Guardar Detalles y el envío por email, en la misma transacción que el comprobante
+            self._agregar_detalles(nuevo_comprobante, data.items)
+            self._encolar_email(nuevo_comprobante, cliente)
+
             self.db.commit()
             self.db.refresh(nuevo_comprobante)
+            self._notificar(data, "persistido", numero=nuevo_numero, comprobante_id=nuevo_comprobante.id)
 
-            # 8. Guardar Detalles
-            for item in data.items:
-                detalle = ComprobanteDetalle(
-                    comprobante_id=nuevo_comprobante.id,
-                    producto_id=item.producto_id,
-                    descripcion=item.descripcion,
-                    cantidad=item.cantidad,
-                    precio_unitario=item.precio_unitario,
-                    alicuota_iva=item.alicuota_iva,
-                    subtotal=item.subtotal
-                )
-                self.db.add(detalle)
-            
-            self.db.commit()
-            
             return nuevo_comprobante
 
         except Exception as e:
             # Log error y re-lanzar o guardar comprobante fallido
             print(f"Error generando factura: {e}")
+            self._notificar(data, "error", detalle=str(e))
             raise e
+
+    def create_credit_notes(self, lote: NotaCreditoLote):
+        """Emite muchas Notas de Crédito con un FECAESolicitar multi-registro por (PV, tipo).
+
+        Cada nota referencia su factura original; si no trae items, anula la factura completa.
+        """
+        notas_por_grupo = {}
+        pvs = {}
+        saldos = {} # Saldo de cada original, descontando las NC de este mismo lote
+        try:
+            # 1. Resolver originales y agrupar por (punto de venta, tipo de NC)
+            for nota in lote.notas:
+                pv = pvs.get(nota.punto_venta_id) or self._get_punto_venta(nota.punto_venta_id)
+                pvs[pv.id] = pv
+
+                original = self._resolver_asociado(pv, None, nota.comprobante_asociado)
+                tipo_nc = NOTA_CREDITO_POR_FACTURA.get(original.tipo_comprobante)
+                if tipo_nc is None:
+                    raise ValueError(
+                        f"El comprobante {original.tipo_comprobante}-{original.numero} no es una factura A, B o C"
+                    )
+
+                if nota.items is None:
+                    items = original.items
+                    nota = nota.copy(update={
+                        "total_neto": original.total_neto,
+                        "total_iva": original.total_iva,
+                        "total_comprobante": original.total_comprobante,
+                    })
+                else:
+                    items = nota.items
+                    if nota.total_comprobante is None:
+                        nota = self._con_totales(nota, items, tipo_nc)
+
+                clave = (original.punto_venta_id, original.tipo_comprobante, original.numero)
+                saldos[clave] = self._validar_nota_credito(original, nota.total_comprobante, saldos.get(clave))
+
+                notas_por_grupo.setdefault((pv.id, tipo_nc), []).append((nota, original, items))
+
+            # 2. Numerar y autorizar cada grupo en lotes de hasta MAX_REGISTROS_LOTE
+            emitidas = []
+            for (pv_id, tipo_nc), notas in notas_por_grupo.items():
+                pv = pvs[pv_id]
+                afip = self._conectar_afip(pv)
+                # La NC se emite en la moneda y cotización de la factura que anula
+                entradas = [
+                    (nota, original.cliente, items, original,
+                     original.moneda_id or "PES", original.moneda_cotizacion or 1.0)
+                    for nota, original, items in notas
+                ]
+                for inicio in range(0, len(entradas), MAX_REGISTROS_LOTE):
+                    emitidas.extend(self._emitir_tanda(afip, pv, tipo_nc, entradas[inicio:inicio + MAX_REGISTROS_LOTE]))
+
+            return emitidas
+
+        except Exception as e:
+            print(f"Error generando notas de crédito: {e}")
+            raise e
+
+    def emitir_ventas(self, punto_venta_id: int, tipo_comprobante: int, ventas: List[ComprobanteCreate]):
+        """Emite ventas de un POS (ver services/ingesta) con FECAESolicitar multi-registro.
+
+        Todas comparten punto de venta y tipo. Devuelve, en el mismo orden, el
+        Comprobante emitido o la excepción que impidió emitir esa venta; los errores
+        que afectan a todo el grupo (PV, autenticación, AFIP caído) se propagan.
+        """
+        pv = self._get_punto_venta(punto_venta_id)
+        afip = self._conectar_afip(pv)
+
+        resultados = [None] * len(ventas)
+        clientes = {}
+        pendientes = []
+        for posicion, venta in enumerate(ventas):
+            # Un POS repite siempre los mismos pocos clientes (casi todo Consumidor Final)
+            clave = venta.cliente_id or (venta.cliente_detalle.tipo_documento, venta.cliente_detalle.numero_documento)
+            try:
+                cliente = clientes.get(clave)
+                if cliente is None:
+                    cliente = clientes[clave] = self._cliente_para_venta(venta)
+            except ValueError as e:
+                resultados[posicion] = e
+                continue
+            if venta.total_comprobante is None:
+                venta = self._con_totales(venta, venta.items, venta.tipo_comprobante)
+            pendientes.append((posicion, (venta, cliente, venta.items, None, "PES", 1.0)))
+
+        for inicio in range(0, len(pendientes), MAX_REGISTROS_LOTE):
+            tanda = pendientes[inicio:inicio + MAX_REGISTROS_LOTE]
+            emitidos = self._emitir_tanda(afip, pv, tipo_comprobante, [entrada for _, entrada in tanda])
+            for (posicion, _), comprobante in zip(tanda, emitidos):
+                resultados[posicion] = comprobante
+        return resultados
@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import PadronContribuyente, PuntoVenta
+from app.services.afip import CACHE_DIR, cargar_pyafipws
+from app.services.cache import TTLCache
+from app.services.rate_limit import RateLimitExceeded, limitador_para
+
+# Cliente de padrón: "a5" (constancia de inscripción), "a13" o "stub" (archivo JSON local)
+PADRON_CLIENTE = os.getenv("PADRON_CLIENTE", "a5")
+PADRON_STUB_ARCHIVO = os.getenv("PADRON_STUB_ARCHIVO", os.path.join(CACHE_DIR, "padron_stub.json"))
+# Punto de venta cuyo certificado se usa para consultar el padrón (por defecto el primero)
+PADRON_PUNTO_VENTA_ID = os.getenv("PADRON_PUNTO_VENTA_ID")
+
+# Vigencia de la caché: los datos de un contribuyente cambian poco, un "no existe" puede
+# corregirse antes (CUIT recién dado de alta o mal tipeado)
+TTL_ENCONTRADO = timedelta(days=int(os.getenv("PADRON_TTL_DIAS", "30")))
+TTL_NO_ENCONTRADO = timedelta(hours=int(os.getenv("PADRON_TTL_NEGATIVO_HORAS", "24")))
+
+CONCURRENCIA_PREFETCH = int(os.getenv("PADRON_CONCURRENCIA", "4"))
+
+# Fault de AFIP para un CUIT inexistente (pyafipws lo captura y lo deja en Excepcion)
+FAULT_NO_EXISTE = "no existe persona"
+
+# Clientes AFIP ya autenticados por (servicio, CUIT, entorno): evita un login WSAA y la
+# carga del WSDL en cada fallo de caché. El TA dura 12 h; se renueva antes de que venza.
+_clientes = TTLCache(ttl=10 * 3600, maxsize=64)
+_clientes_lock = threading.Lock()
+
+
+# Lo que el cliente AFIP necesita del PuntoVenta, desacoplado de la sesión que lo cargó
+DatosPuntoVenta = namedtuple("DatosPuntoVenta", "cuit es_produccion certificado_path key_path")
+
+
+class PadronNoDisponible(Exception):
+    """Falló la consulta a AFIP (autenticación, red, SOAP). No incluye errores de la base."""
+
+
+def normalizar_cuit(cuit: str) -> str:
+    return "".join(c for c in str(cuit) if c.isdigit())
+
+
+class PadronClient(ABC):
+    """Interfaz de los clientes de padrón.
+
+    `consultar` devuelve un dict con nombre, direccion y condicion_iva (con los
+    mismos textos que usa Cliente.condicion_iva) o None si el CUIT no existe.
+    """
+
+    @abstractmethod
+    def consultar(self, cuit: str):
+        ...
+
+
+class StubPadronClient(PadronClient):
+    """Lee los contribuyentes de un JSON {cuit: {nombre, direccion, condicion_iva}} (desarrollo/tests)"""
+
+    def __init__(self, archivo: str = PADRON_STUB_ARCHIVO):
+        self.datos = {}
+        if os.path.exists(archivo):
+            with open(archivo, "r", encoding="utf8") as f:
+                self.datos = {normalizar_cuit(k): v for k, v in json.load(f).items()}
+
+    def consultar(self, cuit: str):
+        return self.datos.get(cuit)
+
+
+class AfipPadronClient(PadronClient):
+    """ws_sr_padron de AFIP (A5 o A13) vía pyafipws"""
+
+    SERVICIOS = {
+        "a5": ("ws_sr_constancia_inscripcion", "WSSrPadronA5", "personaServiceA5"),
+        "a13": ("ws_sr_padron_a13", "WSSrPadronA13", "personaServiceA13"),
+    }
+
+    def __init__(self, pv: DatosPuntoVenta, servicio: str = "a5"):
+        import pyafipws.ws_sr_padron as ws_sr_padron
+
+        servicio_wsaa, clase, endpoint = self.SERVICIOS[servicio]
+        host = "aws.afip.gov.ar" if pv.es_produccion else "awshomo.afip.gov.ar"
+        wsdl_wsaa = "https://wsaa.afip.gov.ar/ws/services/LoginCms?wsdl" if pv.es_produccion else "https://wsaahomo.afip.gov.ar/ws/services/LoginCms?wsdl"
+
+        self.limiter = limitador_para(pv.cuit, pv.es_produccion)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        # El padrón usa su propio TA (otro servicio WSAA); pyafipws lo cachea en CACHE_DIR
+        WSAA, _ = cargar_pyafipws()
+        self.limiter.adquirir()
+        ta = WSAA().Autenticar(servicio_wsaa, pv.certificado_path, pv.key_path, wsdl_wsaa, cache=CACHE_DIR)
+        if not ta:
+            raise ValueError(f"No se pudo autenticar con AFIP para {servicio_wsaa}")
+
+        self.padron = getattr(ws_sr_padron, clase)()
+        self.padron.SetTicketAcceso(ta)
+        self.padron.Cuit = pv.cuit
+        self.padron.Conectar(cache=CACHE_DIR, wsdl=f"https://{host}/sr-padron/webservices/{endpoint}?wsdl")
+        # pyafipws deja el resultado en atributos de la instancia: una consulta a la vez
+        self._lock = threading.Lock()
+
+    def consultar(self, cuit: str):
+        with self._lock:
+            return self._consultar(cuit)
+
+    def _consultar(self, cuit: str):
+        self.limiter.adquirir()
+        ok = self.padron.Consultar(cuit)
+        # pyafipws captura cualquier error (red, SOAP, fault) y devuelve False: solo el
+        # fault de "no existe" es una respuesta negativa; lo demás no se puede cachear
+        excepcion = str(getattr(self.padron, "Excepcion", "") or "")
+        if excepcion:
+            if FAULT_NO_EXISTE in excepcion.lower():
+                return None
+            raise PadronNoDisponible(f"Error de AFIP consultando el padrón para {cuit}: {excepcion}")
+        if not ok:
+            raise PadronNoDisponible(f"AFIP no respondió la consulta de padrón para {cuit}")
+        if not getattr(self.padron, "denominacion", None):
+            return None
+
+        if getattr(self.padron, "monotributo", "N") == "S":
+            condicion_iva = "Monotributo"
+        elif getattr(self.padron, "imp_iva", None) in ("S", "AC"):
+            condicion_iva = "Responsable Inscripto"
+        elif getattr(self.padron, "imp_iva", None) == "EX":
+            condicion_iva = "Exento"
+        else:
+            condicion_iva = "Consumidor Final"
+
+        partes = [getattr(self.padron, attr, None) for attr in ("direccion", "localidad", "provincia")]
+        return {
+            "nombre": self.padron.denominacion,
+            "direccion": ", ".join(p for p in partes if p) or None,
+            "condicion_iva": condicion_iva,
+        }
+
+
+def cliente_afip_compartido(datos: DatosPuntoVenta, servicio: str) -> AfipPadronClient:
+    clave = (servicio, datos.cuit, datos.es_produccion)
+    cliente = _clientes.get(clave)
+    if cliente is None:
+        with _clientes_lock:
+            cliente = _clientes.get(clave)
+            if cliente is None:
+                cliente = AfipPadronClient(datos, servicio)
+                _clientes.set(clave, cliente)
+    return cliente
+
+
+def fabrica_cliente_padron(db: Session, compartido: bool = True):
+    """Fábrica de clientes según PADRON_CLIENTE.
+
+    Con `compartido` devuelve el cliente AFIP cacheado del proceso (consultas
+    serializadas); el prefetch pide clientes propios para consultar en paralelo.
+
+    El punto de venta (PADRON_PUNTO_VENTA_ID o el primero) se resuelve acá, en la
+    hebra de la sesión, y se copian sus datos para que la fábrica pueda usarse desde
+    otras hebras sin tocar la sesión (que puede ser la de una factura en curso).
+    """
+    if PADRON_CLIENTE == "stub":
+        return StubPadronClient
+
+    query = db.query(PuntoVenta)
+    if PADRON_PUNTO_VENTA_ID:
+        query = query.filter(PuntoVenta.id == int(PADRON_PUNTO_VENTA_ID))
+    pv = query.order_by(PuntoVenta.id).first()
+    if not pv:
+        raise ValueError("No hay punto de venta con certificado para consultar el padrón")
+    datos = DatosPuntoVenta(pv.cuit, bool(pv.es_produccion), pv.certificado_path, pv.key_path)
+    if compartido:
+        return lambda: cliente_afip_compartido(datos, PADRON_CLIENTE)
+    return lambda: AfipPadronClient(datos, PADRON_CLIENTE)
+
+
+class PadronService:
+    """Consulta el padrón con caché persistente (padron_cache), incluida la caché negativa"""
+
+    def __init__(self, db: Session, client_factory=None):
+        self.db = db
+        # Fábrica y no instancia: el cliente AFIP autentica al crearse y no es thread-safe.
+        # Se resuelve recién si hay que consultar (un acierto de caché no toca AFIP).
+        self.client_factory = client_factory
+        self._client = None
+
+    def _fabrica(self):
+        if self.client_factory is None:
+            self.client_factory = fabrica_cliente_padron(self.db)
+        return self.client_factory
+
+    def _vigente(self, registro: PadronContribuyente) -> bool:
+        ttl = TTL_ENCONTRADO if registro.encontrado else TTL_NO_ENCONTRADO
+        return registro.consultado + ttl > datetime.utcnow()
+
+    def _fila(self, cuit: str, datos) -> dict:
+        return dict(
+            cuit=cuit,
+            encontrado=datos is not None,
+            nombre=datos.get("nombre") if datos else None,
+            direccion=datos.get("direccion") if datos else None,
+            condicion_iva=datos.get("condicion_iva") if datos else None,
+            consultado=datetime.utcnow(),
+        )
+
+    def _guardar(self, db: Session, filas):
+        # Upsert: si otro request o worker guardó el mismo CUIT en paralelo, gana el último
+        insert = pg_insert(PadronContribuyente.__table__).values(filas)
+        db.execute(insert.on_conflict_do_update(
+            index_elements=["cuit"],
+            set_={campo: insert.excluded[campo] for campo in ("encontrado", "nombre", "direccion", "condicion_iva", "consultado")}
+        ))
+
+    def lookup(self, cuit: str, forzar: bool = False):
+        """Datos del contribuyente o None si AFIP no lo conoce"""
+        cuit = normalizar_cuit(cuit)
+        registro = self.db.query(PadronContribuyente).filter(PadronContribuyente.cuit == cuit).first()
+        if registro is None or forzar or not self._vigente(registro):
+            fabrica = self._fabrica()
+            try:
+                if self._client is None:
+                    self._client = fabrica()
+                datos = self._client.consultar(cuit)
+            except (RateLimitExceeded, PadronNoDisponible):
+                raise
+            except Exception as e:
+                # Solo la parte remota: pyafipws/pysimplesoap no tienen una jerarquía común
+                raise PadronNoDisponible(f"No se pudo consultar el padrón para {cuit}: {e}") from e
+
+            # Sesión propia para la caché: la del llamador puede ser una tanda de facturas
+            # en curso (ingesta) que no se puede confirmar ni deshacer desde acá
+            fila = self._fila(cuit, datos)
+            db = Session(bind=self.db.get_bind())
+            try:
+                self._guardar(db, [fila])
+                db.commit()
+            finally:
+                db.close()
+            registro = PadronContribuyente(**fila)
+        return registro if registro.encontrado else None
+
+    def prefetch(self, cuits, concurrencia: int = CONCURRENCIA_PREFETCH, tanda: int = 1000):
+        """Precarga muchos CUITs: por cada tanda una sola lectura de la caché y consultas
+        en paralelo solo de los faltantes o vencidos"""
+        cuits = sorted({normalizar_cuit(c) for c in cuits} - {""})
+        fabrica = None
+        local = threading.local()
+
+        def consultar(cuit):
+            try:
+                if not hasattr(local, "client"):
+                    local.client = fabrica()
+                return cuit, local.client.consultar(cuit)
+            except Exception as e:
+                # Un CUIT que falla (AFIP caído, cupo agotado) no corta el resto ni se cachea
+                return cuit, e
+
+        consultados = 0
+        fallidos = 0
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            for inicio in range(0, len(cuits), tanda):
+                lote = cuits[inicio:inicio + tanda]
+                existentes = {
+                    r.cuit: r for r in self.db.query(PadronContribuyente).filter(PadronContribuyente.cuit.in_(lote))
+                }
+                pendientes = [c for c in lote if c not in existentes or not self._vigente(existentes[c])]
+                if not pendientes:
+                    continue
+
+                if fabrica is None:
+                    # Un cliente por hebra (y no el compartido) para consultar en paralelo
+                    fabrica = self.client_factory or fabrica_cliente_padron(self.db, compartido=False)
+                filas = []
+                for cuit, datos in pool.map(consultar, pendientes):
+                    if isinstance(datos, Exception):
+                        fallidos += 1
+                        print(f"No se pudo consultar el padrón para {cuit}: {datos}")
+                        continue
+                    filas.append(self._fila(cuit, datos))
+                if filas:
+                    self._guardar(self.db, filas)
+                    self.db.commit()
+                consultados += len(filas)
+
+        return {
+            "solicitados": len(cuits),
+            "en_cache": len(cuits) - consultados - fallidos,
+            "consultados": consultados,
+            "fallidos": fallidos
+        }
@@ -0,0 +1,191 @@
+"""Particiones mensuales de comprobantes y comprobante_detalles (por fecha_emision).
+
+Las dos tablas se particionan por rango mensual y cada detalle vive en la
+partición del mes de su comprobante (comprobante_detalles.fecha_emision es la
+fecha del comprobante). Este módulo crea las particiones futuras y archiva
+las viejas en archivos CSV comprimidos.
+
+Uso (desde backend/):
+    python -m app.services.particiones crear --meses 3
+    python -m app.services.particiones archivar --antes 2016-01 --directorio archivo/
+"""
+import argparse
+import gzip
+import os
+import threading
+import time
+from datetime import date
+from sqlalchemy import text
+from app.database import engine
+
+TABLAS = ("comprobantes", "comprobante_detalles")
+
+# Meses hacia adelante que se mantienen creados
+MESES_ADELANTE = int(os.getenv("PARTICIONES_MESES_ADELANTE", "3"))
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ARCHIVO_DIR = os.getenv("PARTICIONES_ARCHIVO_DIR", os.path.join(BASE_DIR, "archivo"))
+
+# Clave del advisory lock que serializa el mantenimiento: cada worker de uvicorn
+# arranca su propia hebra y, sin él, dos podían crear la misma partición a la vez
+LOCK_PARTICIONES = 7_310_001
+
+
+def _sumar_meses(mes: date, meses: int) -> date:
+    total = mes.year * 12 + (mes.month - 1) + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def nombre_particion(tabla: str, mes: date) -> str:
+    return f"{tabla}_y{mes.year:04d}m{mes.month:02d}"
+
+
+def _bloquear(conn):
+    # Hasta el fin de la transacción; quien espera ve después las particiones ya creadas
+    conn.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": LOCK_PARTICIONES})
+
+
+def _existe(conn, nombre: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:nombre) IS NOT NULL"), {"nombre": nombre}).scalar()
+
+
+def crear_particion(conn, mes: date):
+    """Crea las particiones de un mes para ambas tablas, si no existen.
+
+    Si la partición DEFAULT ya recibió filas de ese mes (porque la partición no
+    existía a tiempo), se mueven a la nueva antes de adjuntarla.
+    """
+    desde = mes
+    hasta = _sumar_meses(mes, 1)
+    cbte = nombre_particion("comprobantes", mes)
+    det = nombre_particion("comprobante_detalles", mes)
+    if _existe(conn, cbte) and _existe(conn, det):
+        return False
+
+    rango = {"desde": desde, "hasta": hasta}
+    filtro = "fecha_emision >= :desde AND fecha_emision < :hasta"
+
+    # Se crean sueltas y se adjuntan al final: así se pueden poblar desde DEFAULT
+    # sin chocar con la restricción de rango de la partición por defecto
+    conn.execute(text(f"CREATE TABLE {cbte} (LIKE comprobantes INCLUDING DEFAULTS)"))
+    conn.execute(text(f"CREATE TABLE {det} (LIKE comprobante_detalles INCLUDING DEFAULTS)"))
+
+    conn.execute(text(f"INSERT INTO {cbte} SELECT * FROM comprobantes_default WHERE {filtro}"), rango)
+    conn.execute(text(f"INSERT INTO {det} SELECT * FROM comprobante_detalles_default WHERE {filtro}"), rango)
+    conn.execute(text(f"DELETE FROM comprobante_detalles_default WHERE {filtro}"), rango)
+    conn.execute(text(f"DELETE FROM comprobantes_default WHERE {filtro}"), rango)
+
+    conn.execute(text(
+        f"ALTER TABLE comprobantes ATTACH PARTITION {cbte} "
+        f"FOR VALUES FROM ('{desde.isoformat()}') TO ('{hasta.isoformat()}')"
+    ))
+    conn.execute(text(
+        f"ALTER TABLE comprobante_detalles ATTACH PARTITION {det} "
+        f"FOR VALUES FROM ('{desde.isoformat()}') TO ('{hasta.isoformat()}')"
+    ))
+    return True
+
+
+def crear_particiones(meses_adelante: int = MESES_ADELANTE, desde: date = None):
+    """Asegura las particiones desde `desde` (por defecto el mes actual) hasta `meses_adelante` meses después"""
+    inicio = (desde or date.today()).replace(day=1)
+    creadas = []
+    with engine.begin() as conn:
+        _bloquear(conn)
+        for i in range(meses_adelante + 1):
+            mes = _sumar_meses(inicio, i)
+            if crear_particion(conn, mes):
+                creadas.append(mes)
+    return creadas
+
+
+def _particiones_anteriores(conn, tabla: str, antes_de: date):
+    """Particiones de `tabla` cuyo mes es anterior a `antes_de`, según su nombre"""
+    filas = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :tabla ORDER BY c.relname"
+    ), {"tabla": tabla})
+    limite = nombre_particion(tabla, antes_de)
+    prefijo = f"{tabla}_y"
+    return [nombre for (nombre,) in filas if nombre.startswith(prefijo) and nombre < limite]
+
+
+def _exportar(conn, tabla: str, directorio: str) -> str:
+    """Vuelca una tabla a un CSV comprimido con COPY (sin pasar fila por fila por Python)"""
+    destino = os.path.join(directorio, f"{tabla}.csv.gz")
+    temporal = destino + ".tmp"
+    cursor = conn.connection.cursor()
+    with gzip.open(temporal, "wb", compresslevel=6) as f:
+        cursor.copy_expert(f"COPY {tabla} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    os.replace(temporal, destino)
+    return destino
+
+
+def archivar(antes_de: date, directorio: str = ARCHIVO_DIR):
+    """Desadjunta, exporta a CSV.gz y elimina las particiones de meses anteriores a `antes_de`.
+
+    Primero los detalles (referencian a los comprobantes) y después los comprobantes.
+    Cada mes se procesa en su propia transacción.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    archivos = []
+    with engine.connect() as conn:
+        meses = _particiones_anteriores(conn, "comprobantes", antes_de)
+
+    for cbte in meses:
+        det = "comprobante_detalles" + cbte[len("comprobantes"):]
+        with engine.begin() as conn:
+            _bloquear(conn)
+            for tabla, particion in (("comprobante_detalles", det), ("comprobantes", cbte)):
+                if not _existe(conn, particion):
+                    continue
+                conn.execute(text(f"ALTER TABLE {tabla} DETACH PARTITION {particion}"))
+                archivos.append(_exportar(conn, particion, directorio))
+                conn.execute(text(f"DROP TABLE {particion}"))
+        print(f"Partición {cbte} archivada en {directorio}")
+    return archivos
+
+
+def iniciar_mantenimiento(intervalo: float = 24 * 3600):
+    """Hebra que crea las particiones futuras al arrancar y luego una vez por día"""
+    def ciclo():
+        while True:
+            try:
+                creadas = crear_particiones()
+                if creadas:
+                    print(f"Particiones creadas: {', '.join(m.strftime('%Y-%m') for m in creadas)}")
+            except Exception as e:
+                print(f"Error creando particiones: {e}")
+            time.sleep(intervalo)
+
+    hilo = threading.Thread(target=ciclo, name="particiones", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de particiones de comprobantes")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_crear = sub.add_parser("crear", help="Crear particiones del mes actual y los siguientes")
+    p_crear.add_argument("--meses", type=int, default=MESES_ADELANTE)
+    p_crear.add_argument("--desde", help="Mes inicial AAAA-MM (por defecto el actual)")
+
+    p_archivar = sub.add_parser("archivar", help="Archivar particiones anteriores a un mes")
+    p_archivar.add_argument("--antes", required=True, help="Mes AAAA-MM: se archivan los anteriores")
+    p_archivar.add_argument("--directorio", default=ARCHIVO_DIR)
+
+    args = parser.parse_args()
+    if args.comando == "crear":
+        desde = date.fromisoformat(args.desde + "-01") if args.desde else None
+        creadas = crear_particiones(args.meses, desde)
+        print(f"Particiones creadas: {len(creadas)}")
+    else:
+        archivos = archivar(date.fromisoformat(args.antes + "-01"), args.directorio)
+        print(f"Archivos generados: {len(archivos)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import html
+import os
+from app.models import Comprobante
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PDF_DIR = os.getenv("PDF_DIR", os.path.join(BASE_DIR, "pdf"))
+
+NOMBRES_COMPROBANTE = {
+    1: "Factura A", 2: "Nota de Débito A", 3: "Nota de Crédito A",
+    6: "Factura B", 7: "Nota de Débito B", 8: "Nota de Crédito B",
+    11: "Factura C", 12: "Nota de Débito C", 13: "Nota de Crédito C",
+}
+
+
+def nombre_comprobante(comprobante: Comprobante) -> str:
+    tipo = NOMBRES_COMPROBANTE.get(comprobante.tipo_comprobante, f"Comprobante {comprobante.tipo_comprobante}")
+    return f"{tipo} {comprobante.punto_venta.numero:05d}-{comprobante.numero:08d}"
+
+
+def _html(comprobante: Comprobante) -> str:
+    e = lambda valor: html.escape(str(valor)) if valor is not None else ""
+    filas = "".join(
+        f"<tr><td>{e(item.descripcion)}</td><td class='n'>{item.cantidad:g}</td>"
+        f"<td class='n'>{item.precio_unitario:.2f}</td><td class='n'>{item.subtotal:.2f}</td></tr>"
+        for item in comprobante.items
+    )
+    cliente = comprobante.cliente
+    return f"""<html><head><meta charset="utf-8"><style>
+        body {{ font-family: sans-serif; font-size: 11pt; }}
+        table {{ width: 100%; border-collapse: collapse; }}
+        td, th {{ border-bottom: 1px solid #ccc; padding: 4px; }}
+        .n {{ text-align: right; }}
+    </style></head><body>
+        <h2>{e(nombre_comprobante(comprobante))}</h2>
+        <p>Emisor CUIT: {e(comprobante.punto_venta.cuit)}<br>
+           Fecha: {comprobante.fecha_emision.strftime('%d/%m/%Y')}</p>
+        <p>Cliente: {e(cliente.nombre)} ({e(cliente.numero_documento)})<br>
+           {e(cliente.direccion)}<br>Condición IVA: {e(cliente.condicion_iva)}</p>
+        <table><tr><th>Descripción</th><th class='n'>Cant.</th><th class='n'>Precio</th><th class='n'>Subtotal</th></tr>{filas}</table>
+        <p class='n'>Neto: {comprobante.total_neto:.2f} &nbsp; IVA: {comprobante.total_iva:.2f}<br>
+           <b>Total {e(comprobante.moneda_id or 'PES')}: {comprobante.total_comprobante:.2f}</b></p>
+        <p>CAE: {e(comprobante.cae)} &nbsp; Vto. CAE: {e(comprobante.vto_cae)}</p>
+    </body></html>"""
+
+
+def render_comprobante_pdf(comprobante: Comprobante) -> str:
+    """Genera (o reutiliza si ya existe) el PDF del comprobante y devuelve su ruta"""
+    os.makedirs(PDF_DIR, exist_ok=True)
+    ruta = os.path.join(
+        PDF_DIR,
+        f"{comprobante.punto_venta.cuit}_{comprobante.punto_venta.numero}_{comprobante.tipo_comprobante}_{comprobante.numero}.pdf"
+    )
+    if os.path.exists(ruta):
+        return ruta
+
+    # weasyprint es pesado de importar: solo lo necesita el worker de emails
+    from weasyprint import HTML
+
+    temporal = ruta + ".tmp"
+    HTML(string=_html(comprobante)).write_pdf(temporal)
+    os.replace(temporal, ruta)
+    return ruta
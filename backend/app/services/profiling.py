@@ -0,0 +1,124 @@
+"""Profiling a demanda de las rutas de /api/facturas/ con pyinstrument (muestreo estadístico).
+
+Se perfila un request si trae `X-Profile: 1` junto con `X-Admin-Token`, o por
+muestreo con probabilidad `tasa` (PROFILING_TASA, ajustable en caliente con
+PUT /api/admin/profiling). Con tasa 0 y sin header el costo por request es una
+comparación: pyinstrument ni siquiera se importa.
+
+El perfil se arma dentro de la función de la ruta, no en un middleware: las
+rutas síncronas corren en el threadpool y pyinstrument muestrea la hebra que lo
+inicia. Cada perfil se guarda en PROFILE_DIR como <request_id>.pyisession más
+un .json con el resumen, y se conservan los últimos MAX_PERFILES.
+
+La tasa es por proceso: con varios workers de uvicorn el toggle solo afecta al
+worker que lo recibe (para todos, usar la variable de entorno).
+"""
+import glob
+import json
+import os
+import random
+import re
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "perfiles"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+INTERVALO = float(os.getenv("PROFILING_INTERVALO", "0.001")) # segundos entre muestras
+MAX_PERFILES = int(os.getenv("PROFILING_MAX_PERFILES", "500"))
+
+tasa = float(os.getenv("PROFILING_TASA", "0"))
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def token_valido(token) -> bool:
+    return bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+
+def id_valido(request_id) -> bool:
+    # El id termina en un nombre de archivo: nada de barras ni "..".
+    return bool(request_id) and bool(_ID_VALIDO.match(request_id)) and ".." not in request_id
+
+
+def _debe_perfilar(request) -> bool:
+    if tasa and random.random() < tasa:
+        return True
+    return request.headers.get("x-profile") == "1" and token_valido(request.headers.get("x-admin-token"))
+
+
+@contextmanager
+def perfilar(request, response=None, ruta: str = None):
+    """Perfila el bloque si el request fue elegido. Si se pasa `response`, agrega X-Profile-Id."""
+    if not _debe_perfilar(request):
+        yield
+        return
+
+    from pyinstrument import Profiler
+
+    request_id = request.headers.get("x-request-id")
+    if not id_valido(request_id):
+        request_id = uuid.uuid4().hex
+    inicio = datetime.utcnow()
+    profiler = Profiler(interval=INTERVALO, async_mode="disabled")
+    profiler.start()
+    try:
+        yield
+    finally:
+        session = profiler.stop()
+        try:
+            _guardar(request_id, session, {
+                "request_id": request_id,
+                "ruta": ruta or request.url.path,
+                "metodo": request.method,
+                "inicio": inicio.isoformat(),
+                "duracion": session.duration,
+            })
+            if response is not None:
+                response.headers["X-Profile-Id"] = request_id
+        except OSError as e:
+            # Un perfil perdido no puede hacer fallar la factura
+            print(f"DEBUG: No se pudo guardar el perfil {request_id}: {e}")
+
+
+def _guardar(request_id: str, session, resumen: dict):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    session.save(os.path.join(PROFILE_DIR, f"{request_id}.pyisession"))
+    with open(os.path.join(PROFILE_DIR, f"{request_id}.json"), "w") as f:
+        json.dump(resumen, f)
+    _podar()
+
+
+def _podar():
+    resumenes = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")), key=os.path.getmtime)
+    for ruta in resumenes[:max(0, len(resumenes) - MAX_PERFILES)]:
+        base = ruta[:-len(".json")]
+        for archivo in (ruta, base + ".pyisession"):
+            try:
+                os.remove(archivo)
+            except FileNotFoundError:
+                pass
+
+
+def listar(limit: int = 100) -> list:
+    """Resúmenes de los perfiles guardados, del más nuevo al más viejo"""
+    resumenes = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")), key=os.path.getmtime, reverse=True)
+    resultado = []
+    for ruta in resumenes[:limit]:
+        try:
+            with open(ruta) as f:
+                resultado.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return resultado
+
+
+def renderizar(request_id: str, formato: str = "html") -> str:
+    """Flamegraph del perfil: "html" (visor de pyinstrument) o "speedscope" (JSON para speedscope.app)"""
+    from pyinstrument.session import Session
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+
+    session = Session.load(os.path.join(PROFILE_DIR, f"{request_id}.pyisession"))
+    renderer = SpeedscopeRenderer() if formato == "speedscope" else HTMLRenderer()
+    return renderer.render(session)
@@ -0,0 +1,146 @@
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+# Límites hacia AFIP por CUIT y ambiente (compartidos entre workers de uvicorn)
+LLAMADAS_POR_SEGUNDO = float(os.getenv("AFIP_LLAMADAS_POR_SEGUNDO", "5"))
+RAFAGA = float(os.getenv("AFIP_RAFAGA", "10"))
+# Espera máxima en la cola antes de rechazar con 429
+ESPERA_MAXIMA = float(os.getenv("AFIP_ESPERA_MAXIMA", "10"))
+# Procesos de fondo (conciliación): usan el cupo ocioso de la facturación (mientras el bucket
+# compartido tenga más de RESERVA_FACTURACION tokens) y, si no hay, un bucket propio a
+# FRACCION_FONDO de la tasa, con solo una espera corta en el compartido
+FRACCION_FONDO = float(os.getenv("AFIP_FRACCION_FONDO", "0.2"))
+ESPERA_MAXIMA_FONDO = float(os.getenv("AFIP_ESPERA_MAXIMA_FONDO", "0.2"))
+RESERVA_FACTURACION = float(os.getenv("AFIP_RESERVA_FACTURACION", str(RAFAGA / 2)))
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RATE_LIMIT_DIR = os.getenv("AFIP_RATE_LIMIT_DIR", os.path.join(BASE_DIR, "cache", "ratelimit"))
+
+
+class RateLimitExceeded(Exception):
+    """La cola hacia AFIP está saturada; reintentar dentro de `retry_after` segundos"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Demasiadas solicitudes a AFIP, reintentar en {math.ceil(retry_after)} s")
+
+
+class TokenBucket:
+    """Token bucket con el estado en un archivo protegido con flock.
+
+    Así todos los procesos (workers de uvicorn, jobs) que comparten el
+    directorio ven el mismo bucket. Una solicitud sin token disponible
+    reserva uno a futuro (el saldo queda negativo) y duerme hasta su turno:
+    el saldo negativo es la cola de espera, acotada por `espera_maxima`.
+    """
+
+    def __init__(self, path: str, tasa: float, capacidad: float, espera_maxima: float):
+        self.path = path
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.espera_maxima = espera_maxima
+
+    def adquirir(self, espera_maxima: float = None, reserva: float = 0.0):
+        """Toma un token, esperando si hace falta. Lanza RateLimitExceeded si la espera supera el máximo.
+
+        Con `reserva` solo se toma si después quedan al menos `reserva` tokens (nunca espera).
+        """
+        espera_maxima = self.espera_maxima if espera_maxima is None else espera_maxima
+        espera = self._reservar(espera_maxima, reserva)
+        if espera > 0:
+            time.sleep(espera)
+
+    def _reservar(self, espera_maxima: float, reserva: float = 0.0) -> float:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                contenido = f.read()
+                ahora = time.time()
+                try:
+                    estado = json.loads(contenido)
+                    tokens = min(self.capacidad, estado["tokens"] + (ahora - estado["ts"]) * self.tasa)
+                except (ValueError, KeyError):
+                    tokens = self.capacidad
+
+                tokens -= 1
+                if reserva and tokens < reserva:
+                    raise RateLimitExceeded((reserva - tokens) / self.tasa)
+                espera = -tokens / self.tasa if tokens < 0 else 0.0
+                if espera > espera_maxima:
+                    # No reservar: la cola está llena. Se informa cuándo habrá lugar.
+                    raise RateLimitExceeded(espera - espera_maxima)
+
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "ts": ahora}))
+                f.flush()
+                return espera
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(clave, nombre: str, tasa: float, capacidad: float, espera_maxima: float) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(clave)
+        if bucket is None:
+            bucket = TokenBucket(os.path.join(RATE_LIMIT_DIR, nombre), tasa, capacidad, espera_maxima)
+            _buckets[clave] = bucket
+        return bucket
+
+
+def limitador_para(cuit: str, produccion: bool) -> TokenBucket:
+    """Bucket compartido para un CUIT en un ambiente (homologación/producción)"""
+    ambiente = "prod" if produccion else "homo"
+    return _bucket(
+        (cuit, produccion), f"{cuit}_{ambiente}.json",
+        tasa=LLAMADAS_POR_SEGUNDO, capacidad=RAFAGA, espera_maxima=ESPERA_MAXIMA
+    )
+
+
+class LimitadorFondo:
+    """Limitador de baja prioridad para procesos de fondo (conciliación).
+
+    Mientras la facturación no use su cupo, cada llamada toma un token del bucket
+    compartido sin esperar, siempre que queden `reserva` tokens para la
+    facturación: con AFIP ocioso la conciliación corre a la tasa completa del CUIT.
+    Si no, toma un token del bucket propio (`fraccion` de la tasa, esperando lo
+    que haga falta) y después uno del compartido, sin esperar más de
+    ESPERA_MAXIMA_FONDO: con la cola de la facturación llena se lanza
+    RateLimitExceeded y el proceso cede en lugar de ocupar lugar en ella.
+    """
+
+    def __init__(self, propio: TokenBucket, compartido: TokenBucket, reserva: float = RESERVA_FACTURACION):
+        self.propio = propio
+        self.compartido = compartido
+        self.reserva = reserva
+
+    def adquirir(self, espera_maxima: float = None):
+        try:
+            self.compartido.adquirir(0.0, reserva=self.reserva)
+            return
+        except RateLimitExceeded:
+            pass
+        self.propio.adquirir(math.inf)
+        self.compartido.adquirir(ESPERA_MAXIMA_FONDO)
+
+
+def limitador_fondo(cuit: str, produccion: bool, fraccion: float = None) -> LimitadorFondo:
+    """Limitador de fondo del CUIT; `fraccion` (por defecto FRACCION_FONDO) es su cupo garantizado"""
+    ambiente = "prod" if produccion else "homo"
+    fraccion = FRACCION_FONDO if fraccion is None else fraccion
+    tasa = LLAMADAS_POR_SEGUNDO * fraccion
+    propio = _bucket(
+        (cuit, produccion, "fondo", fraccion), f"{cuit}_{ambiente}_fondo.json",
+        tasa=tasa, capacidad=max(1.0, tasa), espera_maxima=math.inf
+    )
+    return LimitadorFondo(propio, limitador_para(cuit, produccion))
@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.database import engine
+from app.models import Comprobante, PuntoVenta, ConciliacionProgreso, ConciliacionDiscrepancia
+from app.services.afip import AfipNoDisponible, afip_service_para
+from app.services.rate_limit import RateLimitExceeded, limitador_fondo
+
+# Consultas simultáneas a FECompConsultar. El ritmo lo pone el limitador de fondo de
+# services/rate_limit: el cupo ocioso del CUIT y, con la facturación activa, una fracción
+# garantizada (CONCILIACION_FRACCION, por defecto AFIP_FRACCION_FONDO)
+CONCURRENCIA = int(os.getenv("CONCILIACION_CONCURRENCIA", "8"))
+FRACCION = float(os.getenv("CONCILIACION_FRACCION")) if os.getenv("CONCILIACION_FRACCION") else None
+
+# Cantidad de números verificados entre checkpoints
+TAMANO_TANDA = 500
+
+# Intentos por número ante errores de AFIP antes de cortar la corrida en ese número
+REINTENTOS_CONSULTA = 3
+
+# Primera clave de pg_try_advisory_lock(clave, pv * 1000 + tipo)
+LOCK_CONCILIACION = 7_310_002
+
+# Conciliaciones reservadas por este proceso: (PV, tipo) -> conexión que tiene el advisory lock
+_en_curso = {}
+_en_curso_lock = threading.Lock()
+
+
+def reservar(punto_venta_id: int, tipo_comprobante: int) -> bool:
+    """Marca el (PV, tipo) como en curso. False si ya hay una conciliación corriendo.
+
+    La reserva vale entre workers: es un advisory lock de sesión en una conexión
+    propia, que queda abierta (fuera de transacción) hasta liberar().
+    """
+    clave = (punto_venta_id, tipo_comprobante)
+    with _en_curso_lock:
+        if clave in _en_curso:
+            return False
+        conexion = engine.connect()
+        try:
+            obtenido = conexion.execute(
+                text("SELECT pg_try_advisory_lock(:clase, :objeto)"),
+                {"clase": LOCK_CONCILIACION, "objeto": punto_venta_id * 1000 + tipo_comprobante}
+            ).scalar()
+            conexion.commit() # El lock de sesión sobrevive al commit
+        except Exception:
+            conexion.close()
+            raise
+        if not obtenido:
+            conexion.close()
+            return False
+        _en_curso[clave] = conexion
+        return True
+
+
+def liberar(punto_venta_id: int, tipo_comprobante: int):
+    with _en_curso_lock:
+        conexion = _en_curso.pop((punto_venta_id, tipo_comprobante), None)
+    if conexion is None:
+        return
+    try:
+        conexion.execute(
+            text("SELECT pg_advisory_unlock(:clase, :objeto)"),
+            {"clase": LOCK_CONCILIACION, "objeto": punto_venta_id * 1000 + tipo_comprobante}
+        )
+        conexion.commit()
+        conexion.close()
+    except Exception as e:
+        # Cerrar la conexión de verdad (no devolverla al pool) también suelta el lock
+        print(f"DEBUG: Error liberando la conciliación PV {punto_venta_id} tipo {tipo_comprobante}: {e}")
+        conexion.invalidate()
+
+
+class ReconciliationService:
+    """Compara los Comprobantes locales con lo que AFIP autorizó (FECompConsultar).
+
+    Recorre la numeración de un (PV, tipo) en tandas, consultando AFIP con
+    concurrencia acotada. Al terminar cada tanda guarda las discrepancias y
+    avanza el checkpoint, así una ejecución interrumpida retoma donde quedó.
+    Si AFIP no responde por un número (tras REINTENTOS_CONSULTA intentos), la
+    corrida se corta ahí y el checkpoint queda justo antes.
+    """
+
+    def __init__(self, db: Session, concurrencia: int = CONCURRENCIA, fraccion: float = FRACCION):
+        self.db = db
+        self.concurrencia = concurrencia
+        self.fraccion = fraccion
+
+    def get_progreso(self, punto_venta_id: int, tipo_comprobante: int) -> ConciliacionProgreso:
+        progreso = self.db.query(ConciliacionProgreso).filter(
+            ConciliacionProgreso.punto_venta_id == punto_venta_id,
+            ConciliacionProgreso.tipo_comprobante == tipo_comprobante
+        ).first()
+        if not progreso:
+            progreso = ConciliacionProgreso(punto_venta_id=punto_venta_id, tipo_comprobante=tipo_comprobante, ultimo_numero=0)
+            self.db.add(progreso)
+            self.db.commit()
+            self.db.refresh(progreso)
+        return progreso
+
+    def reconcile(self, punto_venta_id: int, tipo_comprobante: int, desde: int = None, hasta: int = None,
+                  reservada: bool = False):
+        """Concilia un (PV, tipo). Con `reservada` el llamador ya hizo reservar() (ver routers/conciliacion)."""
+        if not reservada and not reservar(punto_venta_id, tipo_comprobante):
+            raise ValueError("Ya hay una conciliación en curso para este punto de venta y tipo")
+        try:
+            return self._reconcile(punto_venta_id, tipo_comprobante, desde, hasta)
+        finally:
+            liberar(punto_venta_id, tipo_comprobante)
+
+    def _reconcile(self, punto_venta_id, tipo_comprobante, desde, hasta):
+        pv = self.db.query(PuntoVenta).filter(PuntoVenta.id == punto_venta_id).first()
+        if not pv:
+            raise ValueError("Punto de venta no encontrado")
+
+        # Autenticar una vez en esta hebra: deja el TA en caché para las hebras de consulta
+        limitador = limitador_fondo(pv.cuit, pv.es_produccion, self.fraccion)
+        afip = afip_service_para(pv)
+        afip.limiter = limitador
+        afip.authenticate()
+        ultimo_afip = int(afip.get_last_invoice_number(pv.numero, tipo_comprobante))
+
+        progreso = self.get_progreso(punto_venta_id, tipo_comprobante)
+        usar_checkpoint = desde is None
+        desde = desde if desde is not None else (progreso.ultimo_numero or 0) + 1
+        hasta = hasta if hasta is not None else ultimo_afip
+
+        # pyafipws no es thread-safe: una instancia de WSFEv1 por hebra
+        local = threading.local()
+
+        def consultar(numero):
+            if not hasattr(local, "afip"):
+                local.afip = afip_service_para(pv)
+                local.afip.limiter = limitador
+                local.afip.authenticate()
+            fallos = 0
+            while True:
+                try:
+                    return numero, local.afip.get_invoice(pv.numero, tipo_comprobante, numero)
+                except RateLimitExceeded as e:
+                    # La facturación está usando el cupo del CUIT: ceder y reintentar
+                    time.sleep(e.retry_after)
+                except AfipNoDisponible as e:
+                    fallos += 1
+                    if fallos >= REINTENTOS_CONSULTA:
+                        return numero, e
+                    time.sleep(2 ** fallos)
+
+        total_discrepancias = 0
+        verificado_hasta = desde - 1
+        sin_verificar = []
+        with ThreadPoolExecutor(max_workers=self.concurrencia) as pool:
+            for inicio in range(desde, hasta + 1, TAMANO_TANDA):
+                fin = min(inicio + TAMANO_TANDA - 1, hasta)
+                remotos = dict(pool.map(consultar, range(inicio, fin + 1)))
+                sin_verificar = sorted(n for n, remoto in remotos.items() if isinstance(remoto, Exception))
+                # Los números sin respuesta válida no se comparan: no son "faltante_afip"
+                discrepancias = self._comparar(pv, tipo_comprobante, inicio, fin, remotos, omitir=set(sin_verificar))
+                self._guardar(discrepancias)
+                total_discrepancias += len(discrepancias)
+
+                # El checkpoint avanza solo sobre números verificados sin huecos
+                verificado_hasta = sin_verificar[0] - 1 if sin_verificar else fin
+                if usar_checkpoint and verificado_hasta >= inicio:
+                    progreso.ultimo_numero = verificado_hasta
+                    progreso.actualizado = datetime.utcnow()
+                self.db.commit()
+                print(f"Conciliación PV {pv.numero} tipo {tipo_comprobante}: {fin}/{hasta} ({total_discrepancias} discrepancias)")
+                if sin_verificar:
+                    print(
+                        f"Conciliación PV {pv.numero} tipo {tipo_comprobante} interrumpida: {len(sin_verificar)} números "
+                        f"sin respuesta de AFIP desde {sin_verificar[0]} ({remotos[sin_verificar[0]]})"
+                    )
+                    break
+
+        # Comprobantes con CAE local más allá del último que AFIP reconoce (solo si esta
+        # corrida llegó hasta ahí; una corrida sin números nuevos no vuelve a revisar la cola)
+        if not sin_verificar and desde <= hasta and hasta >= ultimo_afip:
+            sobrantes = self._locales_aprobados(pv, tipo_comprobante, ultimo_afip + 1, None)
+            discrepancias = [
+                self._discrepancia(pv, tipo_comprobante, c.numero, "faltante_afip", c.cae, None)
+                for c in sobrantes.values()
+            ]
+            self._guardar(discrepancias)
+            self.db.commit()
+            total_discrepancias += len(discrepancias)
+
+        return {
+            "punto_venta_id": punto_venta_id,
+            "tipo_comprobante": tipo_comprobante,
+            "desde": desde,
+            "hasta": hasta,
+            "verificado_hasta": verificado_hasta,
+            "sin_verificar": len(sin_verificar),
+            "discrepancias": total_discrepancias
+        }
+
+    def _locales_aprobados(self, pv, tipo_comprobante, desde, hasta):
+        query = self.db.query(Comprobante).filter(
+            Comprobante.punto_venta_id == pv.id,
+            Comprobante.tipo_comprobante == tipo_comprobante,
+            Comprobante.cae.isnot(None),
+            Comprobante.numero >= desde
+        )
+        if hasta is not None:
+            query = query.filter(Comprobante.numero <= hasta)
+        return {c.numero: c for c in query}
+
+    def _comparar(self, pv, tipo_comprobante, inicio, fin, remotos, omitir=frozenset()):
+        locales = self._locales_aprobados(pv, tipo_comprobante, inicio, fin)
+        discrepancias = []
+        for numero in range(inicio, fin + 1):
+            if numero in omitir:
+                continue
+            local_cbte = locales.get(numero)
+            remoto = remotos.get(numero)
+
+            if remoto and not local_cbte:
+                # Típico de una caída entre CAESolicitar y el commit local
+                discrepancias.append(self._discrepancia(pv, tipo_comprobante, numero, "faltante_local", None, remoto["cae"]))
+            elif local_cbte and not remoto:
+                discrepancias.append(self._discrepancia(pv, tipo_comprobante, numero, "faltante_afip", local_cbte.cae, None))
+            elif local_cbte and remoto:
+                if str(local_cbte.cae) != str(remoto["cae"]):
+                    discrepancias.append(self._discrepancia(pv, tipo_comprobante, numero, "cae", local_cbte.cae, remoto["cae"]))
+                if abs((local_cbte.total_comprobante or 0) - remoto["total"]) > 0.01:
+                    discrepancias.append(self._discrepancia(
+                        pv, tipo_comprobante, numero, "total",
+                        f"{local_cbte.total_comprobante:.2f}", f"{remoto['total']:.2f}"
+                    ))
+        return discrepancias
+
+    def _discrepancia(self, pv, tipo_comprobante, numero, tipo_discrepancia, valor_local, valor_afip):
+        return dict(
+            punto_venta_id=pv.id,
+            tipo_comprobante=tipo_comprobante,
+            numero=numero,
+            tipo_discrepancia=tipo_discrepancia,
+            valor_local=valor_local,
+            valor_afip=valor_afip,
+            detectada=datetime.utcnow(),
+            resuelta=False
+        )
+
+    def _guardar(self, discrepancias):
+        # Re-conciliar un rango no duplica: una discrepancia ya registrada solo actualiza sus
+        # valores (se conservan la fecha de detección y si ya fue marcada como resuelta)
+        if not discrepancias:
+            return
+        insert = pg_insert(ConciliacionDiscrepancia.__table__).values(discrepancias)
+        self.db.execute(insert.on_conflict_do_update(
+            constraint="uq_conciliacion_discrepancias_clave",
+            set_={"valor_local": insert.excluded.valor_local, "valor_afip": insert.excluded.valor_afip}
+        ))
@@ -0,0 +1,79 @@
+"""Benchmark de arranque en frío del backend.
+
+Importa `app.main` en un proceso nuevo con `python -X importtime` y falla
+(exit code 1) si el tiempo total de imports supera el presupuesto o si algún
+módulo pesado que debería cargarse de forma diferida (pyafipws y compañía)
+aparece en el arranque.
+
+Uso (desde backend/):
+    python bench_startup.py                 # presupuesto por defecto
+    STARTUP_BUDGET_MS=800 python bench_startup.py
+"""
+import os
+import re
+import subprocess
+import sys
+
+# Presupuesto de tiempo de imports de app.main, en milisegundos
+BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+# Cantidad de corridas; se toma la mejor para reducir ruido
+RUNS = int(os.getenv("STARTUP_RUNS", "3"))
+
+# Módulos que no deben importarse al arrancar (se cargan en el primer uso o en el warmup)
+LAZY_MODULES = ("pyafipws", "pysimplesoap", "M2Crypto", "weasyprint", "zstandard", "msgpack", "pyinstrument")
+
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def medir():
+    """Devuelve (tiempo acumulado de app.main en ms, lista de módulos importados)"""
+    env = dict(os.environ, AFIP_WARMUP="0")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        raise SystemExit("No se pudo importar app.main")
+
+    total_us = 0
+    modulos = []
+    for line in proc.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, nombre = int(match.group(2)), match.group(3), match.group(4)
+        modulos.append(nombre)
+        # Solo las entradas de primer nivel: su acumulado ya incluye a sus hijos
+        if len(indent) == 1:
+            total_us += cumulative
+    return total_us / 1000.0, modulos
+
+
+def main():
+    mejor_ms = None
+    modulos = []
+    for _ in range(RUNS):
+        ms, modulos = medir()
+        mejor_ms = ms if mejor_ms is None else min(mejor_ms, ms)
+
+    print(f"Imports de app.main: {mejor_ms:.1f} ms (presupuesto {BUDGET_MS:.0f} ms, mejor de {RUNS})")
+
+    errores = []
+    eager = sorted({m for m in modulos if m.split(".")[0] in LAZY_MODULES})
+    if eager:
+        errores.append("Módulos pesados importados al arrancar: " + ", ".join(eager))
+    if mejor_ms > BUDGET_MS:
+        errores.append(f"El arranque superó el presupuesto: {mejor_ms:.1f} ms > {BUDGET_MS:.0f} ms")
+
+    for error in errores:
+        print(f"ERROR: {error}", file=sys.stderr)
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Ingesta de POS: cada registro enviado tiene su ack (POST y WebSocket).
+
+La emisión (_emitir_grupo) se reemplaza por un stub: no hace falta base ni AFIP.
+Correr desde backend/ con `python -m pytest tests` (requiere pytest y httpx).
+"""
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.routers import invoices
+from app.services import ingesta
+
+
+class _SesionFalsa:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    emitidos = []
+
+    def emitir_grupo(service, clave, grupo):
+        emitidos.extend(referencia for referencia, _ in grupo)
+        return [{"r": referencia, "ok": True, "numero": i + 1} for i, (referencia, _) in enumerate(grupo)]
+
+    monkeypatch.setattr(ingesta, "_emitir_grupo", emitir_grupo)
+    monkeypatch.setattr(invoices, "SessionLocal", _SesionFalsa)
+    monkeypatch.setattr(ingesta, "TAMANO_TANDA", 7)
+    cliente = TestClient(app)
+    cliente.emitidos = emitidos
+    return cliente
+
+
+def _registros(cantidad: int) -> list:
+    return [
+        {"r": f"caja1-{i:06d}", "pv": 1, "t": 11 if i % 2 else 6, "i": [["Café", 1, 1500.0, 21.0]]}
+        for i in range(cantidad)
+    ]
+
+
+def test_post_ndjson_devuelve_un_ack_por_registro(cliente):
+    registros = _registros(25)
+
+    def cuerpo():
+        # En pedazos (Transfer-Encoding: chunked), cortando registros a la mitad
+        datos = "".join(json.dumps(r) + "\n" for r in registros).encode("utf8")
+        for inicio in range(0, len(datos), 37):
+            yield datos[inicio:inicio + 37]
+
+    respuesta = cliente.post(
+        "/api/facturas/ingesta", content=cuerpo(), headers={"Content-Type": ingesta.FORMATO_NDJSON}
+    )
+
+    assert respuesta.status_code == 200
+    acks = [json.loads(linea) for linea in respuesta.text.splitlines() if linea]
+    assert len(acks) == len(registros)
+    assert sorted(ack["r"] for ack in acks) == sorted(r["r"] for r in registros)
+    assert all(ack["ok"] for ack in acks)
+
+
+def test_post_msgpack_devuelve_un_ack_por_registro(cliente):
+    msgpack = pytest.importorskip("msgpack")
+    registros = _registros(10)
+    datos = b""
+    for registro in registros:
+        empaquetado = msgpack.packb(registro)
+        datos += len(empaquetado).to_bytes(4, "big") + empaquetado
+
+    respuesta = cliente.post(
+        "/api/facturas/ingesta", content=datos, headers={"Content-Type": ingesta.FORMATO_MSGPACK}
+    )
+
+    acks = [json.loads(linea) for linea in respuesta.text.splitlines() if linea]
+    assert sorted(ack["r"] for ack in acks) == sorted(r["r"] for r in registros)
+
+
+def test_post_con_registro_invalido_igual_responde_todos(cliente):
+    registros = _registros(3)
+    lineas = [json.dumps(registros[0]), "{no es json", json.dumps(registros[1]), json.dumps(registros[2])]
+
+    respuesta = cliente.post(
+        "/api/facturas/ingesta", content="\n".join(lineas), headers={"Content-Type": ingesta.FORMATO_NDJSON}
+    )
+
+    acks = [json.loads(linea) for linea in respuesta.text.splitlines() if linea]
+    assert len(acks) == 4
+    assert [ack["ok"] for ack in acks].count(False) == 1
+
+
+def test_post_formato_no_soportado(cliente):
+    respuesta = cliente.post("/api/facturas/ingesta", content=b"{}", headers={"Content-Type": "text/plain"})
+    assert respuesta.status_code == 415
+
+
+def test_websocket_devuelve_un_ack_por_registro(cliente):
+    registros = _registros(12)
+    with cliente.websocket_connect("/api/facturas/ingesta/ws") as ws:
+        for registro in registros:
+            ws.send_text(json.dumps(registro) + "\n")
+        ws.send_text("") # Fin del stream
+        acks = []
+        for _ in registros:
+            acks.append(json.loads(ws.receive_text()))
+
+    assert sorted(ack["r"] for ack in acks) == sorted(r["r"] for r in registros)
+    assert sorted(cliente.emitidos) == sorted(r["r"] for r in registros)
@@ -16,6 +16,32 @@ interface PuntoVenta {
     es_produccion: boolean;
 }
 
+// Estados que publica el backend por SSE durante la emisión
+const ETIQUETAS_ESTADO: Record<string, string> = {
+    encolado: "En cola...",
+    numerado: "Numerando...",
+    cae_solicitado: "Solicitando CAE a AFIP...",
+    aprobado: "CAE aprobado, guardando...",
+    rechazado: "Rechazado por AFIP, guardando...",
+    persistido: "Guardado",
+};
+
+// Abre el stream de eventos de una emisión y espera a que conecte (máx. 1s) antes de facturar
+const abrirEventos = (solicitudId: string, onEstado: (estado: string) => void): Promise<EventSource> => {
+    const eventos = new EventSource(`${api.defaults.baseURL}/facturas/eventos?solicitud_id=${solicitudId}`);
+    eventos.addEventListener("estado", (e) => {
+        const evento = JSON.parse((e as MessageEvent).data);
+        onEstado(evento.estado);
+    });
+    return new Promise((resolve) => {
+        const timeout = setTimeout(() => resolve(eventos), 1000);
+        eventos.onopen = () => {
+            clearTimeout(timeout);
+            resolve(eventos);
+        };
+    });
+};
+
 interface ItemFactura {
     descripcion: string;
     cantidad: number;
@@ -41,6 +67,7 @@ export function Facturador() {
     ]);
 
     const [loading, setLoading] = useState(false);
+    const [estadoEmision, setEstadoEmision] = useState<string | null>(null);
     const [ultimoComprobante, setUltimoComprobante] = useState<any>(null);
 
     useEffect(() => {
@@ -109,6 +136,10 @@ export function Facturador() {
 
         const totals = calculateTotals();
         setLoading(true);
+        setEstadoEmision(null);
+
+        const solicitudId = crypto.randomUUID();
+        const eventos = await abrirEventos(solicitudId, setEstadoEmision);
 
         try {
             // Determinar tipo documento AFIP
@@ -142,7 +173,8 @@ export function Facturador() {
                 })),
                 total_neto: totals.totalNeto,
                 total_iva: totals.totalIva,
-                total_comprobante: totals.total
+                total_comprobante: totals.total,
+                solicitud_id: solicitudId
             };
 
 
@@ -163,6 +195,8 @@ export function Facturador() {
                 variant: "destructive",
             });
         } finally {
+            eventos.close();
+            setEstadoEmision(null);
             setLoading(false);
         }
     };
@@ -299,7 +333,7 @@ export function Facturador() {
                         </div>
                         <Button size="lg" onClick={handleGenerarFactura} disabled={loading}>
                             {loading && <Loader2 className="mr-2 h-4 w-4 animate-spin" />}
-                            {loading ? "Generando..." : "Generar Factura"}
+                            {loading ? (estadoEmision && ETIQUETAS_ESTADO[estadoEmision]) || "Generando..." : "Generar Factura"}
                         </Button>
                     </div>
 